@@ -0,0 +1,54 @@
+"""
+compare `crypto.Cipher` with the per-message context construction it replaced
+
+    python -m benchmarks.cipher
+"""
+import os
+import timeit
+
+from cryptology import crypto, internal
+
+SIZES = (64, 256, 1024, 4096)
+NUMBER = 20000
+
+
+class LegacyCipher:
+    __slots__ = ('key', 'iv',)
+
+    def __init__(self, key: bytes) -> None:
+        self.key = key
+        self.iv = os.urandom(16)
+
+    def encrypt(self, data: bytes) -> bytes:
+        padder = internal.PKCS7(internal.AES.block_size).padder()
+        padded_data = padder.update(data) + padder.finalize()
+        encryptor = internal.Cipher(internal.AES(self.key), internal.CBC(self.iv), crypto.BACKEND).encryptor()
+        return self.iv + encryptor.update(padded_data) + encryptor.finalize()
+
+    def decrypt(self, data: bytes) -> bytes:
+        iv, cipherdata = data[:16], data[16:]
+        decryptor = internal.Cipher(internal.AES(self.key), internal.CBC(iv), crypto.BACKEND).decryptor()
+        plaintext_padded = decryptor.update(cipherdata) + decryptor.finalize()
+        unpadder = internal.PKCS7(internal.AES.block_size).unpadder()
+        return unpadder.update(plaintext_padded) + unpadder.finalize()
+
+
+def messages_per_second(func, arg: bytes) -> float:
+    return NUMBER / min(timeit.repeat(lambda: func(arg), number=NUMBER, repeat=5))
+
+
+def main() -> None:
+    key = os.urandom(32)
+    ciphers = (('legacy', LegacyCipher(key)), ('cached', crypto.Cipher(key)))
+    print(f'{"size":>6} {"operation":>10} ' + ' '.join(f'{name:>12}' for name, _ in ciphers) + f' {"speedup":>8}')
+    for size in SIZES:
+        data = os.urandom(size)
+        encrypted = ciphers[1][1].encrypt(data)
+        for operation, arg in (('encrypt', data), ('decrypt', encrypted)):
+            rates = [messages_per_second(getattr(cipher, operation), arg) for _, cipher in ciphers]
+            print(f'{size:>6} {operation:>10} ' + ' '.join(f'{rate:>10.0f}/s' for rate in rates)
+                  + f' {rates[1] / rates[0]:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
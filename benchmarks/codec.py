@@ -0,0 +1,67 @@
+"""
+compare `cryptology.codec` with the xdrlib framing it replaced
+
+    python -m benchmarks.codec
+"""
+import json
+import timeit
+import warnings
+
+from cryptology import codec
+from cryptology.common import ClientMessageType, ServerMessageType
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    import xdrlib
+
+NUMBER = 100000
+PAYLOAD = json.dumps({
+    '@type': 'BuyOrderPlaced',
+    'amount': '1',
+    'initial_amount': '3',
+    'closed_inline': False,
+    'order_id': 1,
+    'price': '1',
+    'time': [946684800, 0],
+    'trade_pair': 'BTC_USD',
+    'client_order_id': 123
+}).encode('utf-8')
+
+
+def xdrlib_encode_inbox_message() -> bytes:
+    xdr = xdrlib.Packer()
+    xdr.pack_enum(ClientMessageType.INBOX_MESSAGE.value)
+    xdr.pack_hyper(12345)
+    xdr.pack_bytes(PAYLOAD)
+    return xdr.get_buffer()
+
+
+def codec_encode_inbox_message() -> bytes:
+    return codec.encode_inbox_message(12345, PAYLOAD)
+
+
+OUTBOX_MESSAGE = codec.encode_outbox_message(42, 946684800.0, PAYLOAD)
+
+
+def xdrlib_decode_outbox_message() -> tuple:
+    xdr = xdrlib.Unpacker(OUTBOX_MESSAGE)
+    ServerMessageType.by_value(xdr.unpack_enum())
+    return xdr.unpack_hyper(), xdr.unpack_double(), xdr.unpack_string()
+
+
+def codec_decode_outbox_message() -> tuple:
+    frame = memoryview(OUTBOX_MESSAGE)
+    ServerMessageType.by_value(codec.decode_message_type(frame))
+    return codec.decode_outbox_message(frame)
+
+
+def main() -> None:
+    assert xdrlib_encode_inbox_message() == codec_encode_inbox_message()
+    for name, legacy, current in (('encode inbox', xdrlib_encode_inbox_message, codec_encode_inbox_message),
+                                  ('decode outbox', xdrlib_decode_outbox_message, codec_decode_outbox_message)):
+        rates = [NUMBER / min(timeit.repeat(func, number=NUMBER, repeat=5)) for func in (legacy, current)]
+        print(f'{name:>14}: xdrlib {rates[0]:>10.0f}/s codec {rates[1]:>10.0f}/s {rates[1] / rates[0]:>6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+an in-process stand-in for the exchange with the real handshake and AES framing,
+clients connect to `client_url` and market data clients to `market_data_url`
+"""
+import aiohttp
+import asyncio
+import json
+import os
+import time
+
+from aiohttp import web
+from typing import Callable, List, Optional
+
+from cryptology import codec, crypto
+from cryptology.common import ClientMessageType
+
+__all__ = ('SERVER_KEYS', 'CLIENT_KEYS', 'Exchange', 'ClientConnection',)
+
+SERVER_KEYS = crypto.Keys.load('tests/server_test.pub', 'tests/server_test.priv')
+CLIENT_KEYS = crypto.Keys.load('tests/client_test.pub', 'tests/client_test.priv')
+
+InboxCallback = Callable[[int, dict, float], None]
+
+
+class ClientConnection:
+    """
+    the exchange side of a client connection
+    """
+    __slots__ = ('ws', 'client_id', 'server_cipher', 'client_cipher', 'outbox_id',)
+
+    ws: web.WebSocketResponse
+    client_id: str
+    server_cipher: crypto.Cipher
+    client_cipher: crypto.Cipher
+    outbox_id: int
+
+    def __init__(self, ws: web.WebSocketResponse) -> None:
+        self.ws = ws
+        self.outbox_id = 0
+
+    async def handshake(self) -> None:
+        symmetric_key = os.urandom(32)
+        self.server_cipher = crypto.Cipher(symmetric_key)
+        client_id, _, client_aes_key, _ = codec.decode_client_handshake(
+            SERVER_KEYS.decrypt(await self.ws.receive_bytes(timeout=10)))
+        self.client_id = str(client_id, 'ascii')
+        self.client_cipher = crypto.Cipher(bytes(client_aes_key))
+        data_to_sign = os.urandom(32)
+        await self.ws.send_bytes(CLIENT_KEYS.encrypt(codec.encode_server_handshake(data_to_sign, 0, symmetric_key)))
+        CLIENT_KEYS.verify(await self.ws.receive_bytes(timeout=10), data_to_sign)
+
+    async def send_outbox(self, payload: bytes) -> None:
+        self.outbox_id += 1
+        await self.ws.send_bytes(self.server_cipher.encrypt(
+            codec.encode_outbox_message(self.outbox_id, time.time(), payload)))
+
+    async def serve(self, on_inbox: Optional[InboxCallback]) -> None:
+        """
+        answers RPC requests with their payload and passes other messages to `on_inbox`
+        """
+        async for msg in self.ws:
+            if msg.type != aiohttp.WSMsgType.BINARY:
+                break
+            received = time.perf_counter()
+            message_type, message_id, payload = codec.decode_client_message(self.client_cipher.decrypt(msg.data))
+            if message_type == ClientMessageType.RPC_REQUEST.value:
+                await self.ws.send_bytes(self.server_cipher.encrypt(codec.encode_rpc_response(message_id, payload)))
+            elif on_inbox is not None:
+                on_inbox(message_id, json.loads(bytes(payload)), received)
+
+
+class Exchange:
+    """
+    `on_inbox` gets the sequence id, payload and `time.perf_counter()` arrival time of client messages
+    """
+    __slots__ = ('host', 'port', 'runner', 'clients', 'market_data', 'on_inbox', 'connected',)
+
+    host: str
+    port: int
+    runner: Optional[web.AppRunner]
+    clients: List[ClientConnection]
+    market_data: List[web.WebSocketResponse]
+    on_inbox: Optional[InboxCallback]
+    connected: asyncio.Event
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.clients = []
+        self.market_data = []
+        self.on_inbox = None
+        self.connected = asyncio.Event()
+
+    @property
+    def client_url(self) -> str:
+        return f'ws://{self.host}:{self.port}/'
+
+    @property
+    def market_data_url(self) -> str:
+        return f'ws://{self.host}:{self.port}/market-data'
+
+    async def __aenter__(self) -> 'Exchange':
+        app = web.Application()
+        app.router.add_get('/', self._client)
+        app.router.add_get('/market-data', self._market_data)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        for connection in self.clients:
+            await connection.ws.close()
+        for ws in self.market_data:
+            await ws.close()
+        await self.runner.cleanup()
+
+    async def wait_connected(self, clients: int = 0, market_data: int = 0) -> None:
+        while len(self.clients) < clients or len(self.market_data) < market_data:
+            self.connected.clear()
+            await self.connected.wait()
+
+    async def _client(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        connection = ClientConnection(ws)
+        await connection.handshake()
+        self.clients.append(connection)
+        self.connected.set()
+        try:
+            await connection.serve(self.on_inbox)
+        finally:
+            self.clients.remove(connection)
+        return ws
+
+    async def _market_data(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_bytes(codec.encode_uint(1))
+        self.market_data.append(ws)
+        self.connected.set()
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.BINARY:
+                    break
+        finally:
+            self.market_data.remove(ws)
+        return ws
+
+    async def broadcast(self, payload: bytes) -> None:
+        frame = codec.encode_broadcast_message(payload)
+        for ws in self.market_data:
+            await ws.send_bytes(frame)
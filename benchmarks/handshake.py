@@ -0,0 +1,79 @@
+"""
+event loop stall while 100 connections handshake at once after a server restart,
+with the RSA work of the client inline and in thread and process pools
+
+    python -m benchmarks.handshake
+"""
+import asyncio
+import os
+import time
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from cryptology import codec, crypto
+
+CONNECTIONS = 100
+TICK = .001
+
+SERVER_KEYS = crypto.Keys.load('tests/server_test.pub', 'tests/server_test.priv')
+CLIENT_KEYS = crypto.Keys.load('tests/client_test.pub', 'tests/client_test.priv')
+
+
+async def handshake(executor: Optional[Executor], inline: bool, server_response: bytes) -> None:
+    """
+    the client side RSA operations of `BaseProtocolClient.handshake`
+    """
+    frame = codec.encode_client_handshake(b'test', 0, os.urandom(32), 5)
+    if inline:
+        CLIENT_KEYS.sign(CLIENT_KEYS.decrypt(server_response)[:32])
+        SERVER_KEYS.encrypt(frame)
+    else:
+        await crypto.run_in_executor(executor, SERVER_KEYS.encrypt, frame)
+        response = await crypto.run_in_executor(executor, CLIENT_KEYS.decrypt, server_response)
+        await crypto.run_in_executor(executor, CLIENT_KEYS.sign, response[:32])
+    await asyncio.sleep(0)
+
+
+async def measure(executor: Optional[Executor], inline: bool) -> List[float]:
+    loop = asyncio.get_event_loop()
+    server_response = CLIENT_KEYS.encrypt(codec.encode_server_handshake(os.urandom(32), 1, os.urandom(32)))
+    stalls = []
+    done = False
+
+    async def ticker() -> None:
+        while not done:
+            started = loop.time()
+            await asyncio.sleep(TICK)
+            stalls.append(loop.time() - started - TICK)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(TICK)
+    await asyncio.gather(*(handshake(executor, inline, server_response) for _ in range(CONNECTIONS)))
+    done = True
+    await tick
+    return stalls
+
+
+def main() -> None:
+    loop = asyncio.get_event_loop()
+    modes = (
+        ('inline', None, True),
+        ('threads', ThreadPoolExecutor(4), False),
+        ('processes', ProcessPoolExecutor(os.cpu_count() or 1), False),
+    )
+    print(f'{"mode":>10} {"total":>9} {"max stall":>10} {"p99 stall":>10}')
+    for name, executor, inline in modes:
+        # the first run starts the workers and loads the keys in them
+        loop.run_until_complete(measure(executor, inline))
+        started = time.perf_counter()
+        stalls = sorted(loop.run_until_complete(measure(executor, inline)))
+        total = time.perf_counter() - started
+        p99 = stalls[int(len(stalls) * .99)] if stalls else 0.
+        print(f'{name:>10} {total * 1000:>7.1f}ms {max(stalls, default=0.) * 1000:>8.2f}ms {p99 * 1000:>8.2f}ms')
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+throughput and latency of the client against the stand-in exchange of `benchmarks.exchange`
+
+- `outbox`: outbox messages pushed by the exchange until `read_callback` got them all
+- `market_data`: broadcasts until `market_data_callback` got them all
+- `market_data_workers`: the same with the frames decoded by a `DecodePool`
+- `order_send`: `send_signed_message` until the exchange decrypted them all
+- `rpc`: sequential `send_signed_request` round trips on every connection
+
+latencies of the streaming scenarios include the time spent queued behind the previous messages,
+every scenario runs on each of `--event-loops`
+
+    python -m benchmarks.pipeline --output results.json
+    python -m benchmarks.pipeline --scenarios outbox market_data --event-loops asyncio uvloop
+    python -m benchmarks.pipeline --baseline results.json  # exits with 1 on regressions
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from typing import Any, Awaitable, Callable, Dict, List
+
+from cryptology import ClientWriterStub, DecodePool, new_event_loop, run_client, run_market_data
+from cryptology.event_loop import PREFERENCE, available_event_loops
+from cryptology.metrics import Histogram
+
+from .exchange import CLIENT_KEYS, SERVER_KEYS, Exchange
+
+SCENARIOS: Dict[str, Callable[[int, int, int], Awaitable[Dict[str, Any]]]] = {}
+
+
+def scenario(func: Callable[[int, int, int], Awaitable[Dict[str, Any]]]) -> Callable:
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def template(size: int, message_type: str) -> bytes:
+    """
+    a json payload of about `size` bytes with a `%f` placeholder for the send time
+    """
+    head = b'{"@type": "%s", "trade_pair": "BTC_USD", "client_order_id": 1, "sent_at": %%.9f, "padding": "' \
+        % message_type.encode('ascii')
+    return head + b'x' * max(size - len(head) - 16, 0) + b'"}'
+
+
+def result(histogram: Histogram, elapsed: float) -> Dict[str, Any]:
+    return {
+        'messages': histogram.count,
+        'seconds': elapsed,
+        'messages_per_second': histogram.count / elapsed,
+        'p50': histogram.percentile(.5),
+        'p99': histogram.percentile(.99),
+    }
+
+
+async def idle_writer(ws: ClientWriterStub, sequence_id: int) -> None:
+    await asyncio.sleep(3600)
+
+
+async def wait(awaitable: Awaitable[Any], tasks: List[asyncio.Future]) -> None:
+    """
+    waits for `awaitable`, raising the error of a client that exits before
+    """
+    waiter = asyncio.ensure_future(awaitable)
+    await asyncio.wait([waiter, *tasks], return_when=asyncio.FIRST_COMPLETED)
+    if not waiter.done():
+        waiter.cancel()
+        for task in tasks:
+            if task.done():
+                task.result()
+        raise RuntimeError('a client exited')
+
+
+async def stop(tasks: List[asyncio.Future]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def start_clients(exchange: Exchange, connections: int, **kwargs: Any) -> List[asyncio.Future]:
+    return [asyncio.ensure_future(run_client(client_id=f'bench{n}', client_keys=CLIENT_KEYS,
+                                             ws_addr=exchange.client_url, server_keys=SERVER_KEYS, **kwargs))
+            for n in range(connections)]
+
+
+@scenario
+async def outbox(size: int, connections: int, messages: int) -> Dict[str, Any]:
+    histogram = Histogram()
+    done = asyncio.Event()
+    frame = template(size, 'BuyOrderPlaced')
+
+    async def read_callback(ws: ClientWriterStub, outbox_id: int, ts: Any, payload: dict) -> None:
+        histogram.record(time.perf_counter() - payload['sent_at'])
+        if histogram.count == connections * messages:
+            done.set()
+
+    async def push(connection: Any) -> None:
+        for _ in range(messages):
+            await connection.send_outbox(frame % time.perf_counter())
+
+    async with Exchange() as exchange:
+        tasks = start_clients(exchange, connections, read_callback=read_callback, writer=idle_writer)
+        await wait(exchange.wait_connected(clients=connections), tasks)
+        started = time.perf_counter()
+        await asyncio.gather(*(push(connection) for connection in exchange.clients))
+        await wait(done.wait(), tasks)
+        elapsed = time.perf_counter() - started
+        await stop(tasks)
+    return result(histogram, elapsed)
+
+
+async def _market_data(size: int, connections: int, messages: int, **options: Any) -> Dict[str, Any]:
+    histogram = Histogram()
+    done = asyncio.Event()
+    frame = template(size, 'AnonymousTrade')
+
+    async def market_data_callback(payload: dict) -> None:
+        histogram.record(time.perf_counter() - payload['sent_at'])
+        if histogram.count == connections * messages:
+            done.set()
+
+    async with Exchange() as exchange:
+        tasks = [asyncio.ensure_future(run_market_data(ws_addr=exchange.market_data_url,
+                                                       market_data_callback=market_data_callback, **options))
+                 for _ in range(connections)]
+        await wait(exchange.wait_connected(market_data=connections), tasks)
+        started = time.perf_counter()
+        for _ in range(messages):
+            await exchange.broadcast(frame % time.perf_counter())
+        await wait(done.wait(), tasks)
+        elapsed = time.perf_counter() - started
+        await stop(tasks)
+    return result(histogram, elapsed)
+
+
+@scenario
+async def market_data(size: int, connections: int, messages: int) -> Dict[str, Any]:
+    return await _market_data(size, connections, messages)
+
+
+@scenario
+async def market_data_workers(size: int, connections: int, messages: int) -> Dict[str, Any]:
+    with DecodePool() as pool:
+        return await _market_data(size, connections, messages, decode_pool=pool)
+
+
+@scenario
+async def order_send(size: int, connections: int, messages: int) -> Dict[str, Any]:
+    histogram = Histogram()
+    done = asyncio.Event()
+    start = asyncio.Event()
+    padding = 'x' * max(size - 120, 0)
+
+    def on_inbox(sequence_id: int, payload: dict, received: float) -> None:
+        histogram.record(received - payload['sent_at'])
+        if histogram.count == connections * messages:
+            done.set()
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        await start.wait()
+        for n in range(messages):
+            await ws.send_signed_message(sequence_id=sequence_id + n + 1, payload={
+                '@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'amount': '1', 'price': '1',
+                'client_order_id': n, 'ttl': 0, 'sent_at': time.perf_counter(), 'padding': padding})
+        await asyncio.sleep(3600)
+
+    async def read_callback(ws: ClientWriterStub, outbox_id: int, ts: Any, payload: dict) -> None:
+        pass
+
+    async with Exchange() as exchange:
+        exchange.on_inbox = on_inbox
+        tasks = start_clients(exchange, connections, read_callback=read_callback, writer=writer)
+        await wait(exchange.wait_connected(clients=connections), tasks)
+        started = time.perf_counter()
+        start.set()
+        await wait(done.wait(), tasks)
+        elapsed = time.perf_counter() - started
+        await stop(tasks)
+    return result(histogram, elapsed)
+
+
+@scenario
+async def rpc(size: int, connections: int, messages: int) -> Dict[str, Any]:
+    histogram = Histogram()
+    done = asyncio.Event()
+    start = asyncio.Event()
+    finished = 0
+    payload = {'@type': 'Echo', 'padding': 'x' * max(size - 40, 0)}
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        nonlocal finished
+        await start.wait()
+        for _ in range(messages):
+            sent_at = time.perf_counter()
+            await ws.send_signed_request(payload=payload)
+            histogram.record(time.perf_counter() - sent_at)
+        finished += 1
+        if finished == connections:
+            done.set()
+        await asyncio.sleep(3600)
+
+    async def read_callback(ws: ClientWriterStub, outbox_id: int, ts: Any, payload: dict) -> None:
+        pass
+
+    async with Exchange() as exchange:
+        tasks = start_clients(exchange, connections, read_callback=read_callback, writer=writer)
+        await wait(exchange.wait_connected(clients=connections), tasks)
+        started = time.perf_counter()
+        start.set()
+        await wait(done.wait(), tasks)
+        elapsed = time.perf_counter() - started
+        await stop(tasks)
+    return result(histogram, elapsed)
+
+
+def regressions(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    throughput drops and p99 latency increases over `tolerance` compared to `baseline`
+    """
+    def key(item: Dict[str, Any]) -> tuple:
+        return item['scenario'], item.get('event_loop', 'asyncio'), item['payload_size'], item['connections']
+
+    previous = {key(item): item for item in baseline}
+    found = []
+    for item in results:
+        old = previous.get(key(item))
+        if old is None:
+            continue
+        if item['messages_per_second'] < old['messages_per_second'] * (1 - tolerance):
+            found.append(f'{key(item)}: {old["messages_per_second"]:.0f} -> {item["messages_per_second"]:.0f} msg/s')
+        if item['p99'] > old['p99'] * (1 + tolerance):
+            found.append(f'{key(item)}: p99 {old["p99"] * 1000:.3f} -> {item["p99"] * 1000:.3f}ms')
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--event-loops', nargs='+', choices=sorted(available_event_loops()),
+                        default=[next(x for x in PREFERENCE if x in available_event_loops())])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[128, 1024, 8192])
+    parser.add_argument('--connections', nargs='+', type=int, default=[1, 10])
+    parser.add_argument('--messages', type=int, default=2000, help='messages per connection')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--baseline', help='compare with the results in this json file')
+    parser.add_argument('--tolerance', type=float, default=.2)
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"scenario":>19} {"loop":>7} {"size":>6} {"conns":>5} {"msg/s":>10} {"p50":>10} {"p99":>10}')
+    for name in args.scenarios:
+        for event_loop in args.event_loops:
+            loop = new_event_loop(event_loop)
+            asyncio.set_event_loop(loop)
+            for size in args.sizes:
+                for connections in args.connections:
+                    item = loop.run_until_complete(SCENARIOS[name](size, connections, args.messages))
+                    item.update(scenario=name, event_loop=event_loop, payload_size=size, connections=connections)
+                    results.append(item)
+                    print(f'{name:>19} {event_loop:>7} {size:>6} {connections:>5} '
+                          f'{item["messages_per_second"]:>10.0f} '
+                          f'{item["p50"] * 1000:>8.3f}ms {item["p99"] * 1000:>8.3f}ms')
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print('regression', line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
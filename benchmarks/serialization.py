@@ -0,0 +1,55 @@
+"""
+compare the installed json backends on representative payloads
+
+    python -m benchmarks.serialization
+"""
+import timeit
+
+from cryptology import serialization
+
+NUMBER = 20000
+
+ORDER_BOOK_AGG = {
+    '@type': 'OrderBookAgg',
+    'buy_levels': {str(10000 - x): f'{x % 7 + 0.125:.8f}' for x in range(50)},
+    'sell_levels': {str(10001 + x): f'{x % 5 + 0.5:.8f}' for x in range(50)},
+    'trade_pair': 'BTC_USD',
+    'current_order_id': 123456,
+}
+
+BUY_ORDER_PLACED = {
+    '@type': 'BuyOrderPlaced',
+    'amount': '1',
+    'initial_amount': '3',
+    'closed_inline': False,
+    'order_id': 1,
+    'price': '1',
+    'time': [946684800, 0],
+    'trade_pair': 'BTC_USD',
+    'client_order_id': 123
+}
+
+PLACE_BUY_LIMIT_ORDER = {
+    '@type': 'PlaceBuyLimitOrder',
+    'trade_pair': 'BTC_USD',
+    'amount': '10.1',
+    'price': '15000.3',
+    'client_order_id': 123,
+    'ttl': 0
+}
+
+
+def main() -> None:
+    backends = serialization.available_serializers()
+    print(f'{"":>28} ' + ' '.join(f'{name:>12}' for name in backends))
+    for name, payload in (('OrderBookAgg', ORDER_BOOK_AGG), ('BuyOrderPlaced', BUY_ORDER_PLACED),
+                          ('PlaceBuyLimitOrder', PLACE_BUY_LIMIT_ORDER)):
+        encoded = memoryview(backends['json'].dumps(payload))
+        for operation, arg in (('loads', encoded), ('dumps', payload)):
+            rates = [NUMBER / min(timeit.repeat(lambda: getattr(backend, operation)(arg), number=NUMBER, repeat=5))
+                     for backend in backends.values()]
+            print(f'{name:>20} {operation:>7} ' + ' '.join(f'{rate:>10.0f}/s' for rate in rates))
+
+
+if __name__ == '__main__':
+    main()
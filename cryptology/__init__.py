@@ -1,3 +1,17 @@
-from .client import ClientReadCallback, ClientWriter, ClientWriterStub, run_client, Keys
+from .client import ClientReadCallback, ClientBatchReadCallback, ClientWriter, ClientWriterStub, run_client, Keys
 from .exceptions import *
 from .market_data_client import run as run_market_data
+from .order_book import OrderBook, OrderBooks
+from .journal import OutgoingJournal, SessionState
+from .reconnect import Backoff, run_resilient_client, run_resilient_market_data
+from .pool import ClientPool
+from .messages import MessageDecoder
+from .stream import connect, connect_market_data
+from .metrics import Histogram, PipelineMetrics, RoundTripTracker
+from .orders import OrderTracker
+from .balances import BalanceCache
+from .recording import Recorder
+from .replay import replay_client, replay_market_data
+from .ring import RingPublisher, RingSubscriber
+from .decode_pool import DecodePool
+from .event_loop import new_event_loop, run
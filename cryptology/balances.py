@@ -0,0 +1,170 @@
+import logging
+
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Dict, FrozenSet, Iterator, List, Optional
+
+from . import exceptions
+
+if TYPE_CHECKING:
+    from .client import ClientWriterStub
+
+__all__ = ('Balance', 'BalanceCache', 'BalanceCallback',)
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal(0)
+
+
+class Balance:
+    """
+    the funds of a currency, `reserved` is held by active orders
+    """
+    __slots__ = ('currency', 'available', 'reserved',)
+
+    currency: str
+    available: Decimal
+    reserved: Decimal
+
+    def __init__(self, currency: str, available: Decimal = ZERO, reserved: Decimal = ZERO) -> None:
+        self.currency = currency
+        self.available = available
+        self.reserved = reserved
+
+    def __repr__(self) -> str:
+        return f'<Balance {self.currency} available {self.available} reserved {self.reserved}>'
+
+    @property
+    def total(self) -> Decimal:
+        return self.available + self.reserved
+
+
+BalanceCallback = Callable[[Balance, Any], None]
+
+
+class BalanceCache:
+    """
+    balances of the account kept from the outbox for checks before placing orders
+
+    `SetBalance` sets the available funds, the ones with reason `on_hold` move `change` between
+    the available and reserved funds. `OwnTrade` releases what the traded part of an order held,
+    the bought currency arrives in a `SetBalance`. the server doesn't report that part, it's taken
+    to be `amount` of the base currency for a sell and `amount * price` of the quote currency for
+    a buy, so a buy filled below its limit price leaves the difference in `reserved` until the next
+    `refresh`. deposits and withdrawals are passed to the subscribers only, their funds arrive in
+    a `SetBalance` as well.
+
+    `refresh` loads the balances from `UserBalanceRequest`, `run_client` does it on every connect
+    before the writer starts. the response doesn't tell which messages it already includes, so of
+    the messages arriving while the request is in flight only the available funds of `SetBalance`
+    are applied again on top of it, the reserved funds are the ones of the response
+    """
+    __slots__ = ('balances', 'callbacks', 'replay',)
+
+    TYPES: ClassVar[FrozenSet[str]] = frozenset((
+        'SetBalance', 'DepositTransactionAccepted', 'WithdrawalTransactionAccepted', 'OwnTrade',
+    ))
+
+    balances: Dict[str, Balance]
+    callbacks: List[BalanceCallback]
+    replay: Optional[List[Any]]
+
+    def __init__(self) -> None:
+        self.balances = {}
+        self.callbacks = []
+        self.replay = None
+
+    def __iter__(self) -> Iterator[Balance]:
+        return iter(list(self.balances.values()))
+
+    def __contains__(self, currency: str) -> bool:
+        return currency in self.balances
+
+    def get(self, currency: str) -> Optional[Balance]:
+        return self.balances.get(currency)
+
+    def available(self, currency: str) -> Decimal:
+        balance = self.balances.get(currency)
+        return balance.available if balance is not None else ZERO
+
+    def reserved(self, currency: str) -> Decimal:
+        balance = self.balances.get(currency)
+        return balance.reserved if balance is not None else ZERO
+
+    def subscribe(self, callback: BalanceCallback) -> None:
+        """
+        `callback` gets the balance and the payload after every message about a currency,
+        it runs in the reader and shouldn't block, its errors are logged
+        """
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback: BalanceCallback) -> None:
+        self.callbacks.remove(callback)
+
+    def _balance(self, currency: str) -> Balance:
+        balance = self.balances.get(currency)
+        if balance is None:
+            balance = self.balances[currency] = Balance(currency)
+        return balance
+
+    def _notify(self, balance: Balance, payload: Any) -> None:
+        for callback in self.callbacks:
+            try:
+                callback(balance, payload)
+            except Exception:
+                logger.exception('balance callback %r failed on %s', callback, payload)
+
+    def _apply(self, message_type: str, payload: Any) -> Balance:
+        if message_type == 'SetBalance':
+            balance = self._balance(payload['currency'])
+            balance.available = Decimal(payload['balance'])
+            if payload.get('reason') == 'on_hold':
+                balance.reserved = max(balance.reserved - Decimal(payload['change']), ZERO)
+        elif message_type == 'OwnTrade':
+            base, quote = payload['trade_pair'].split('_')
+            amount = Decimal(payload['amount'])
+            # the maker's side is `maker_buy`, the taker's the other one, a buy held the quote currency
+            if payload['maker'] == payload['maker_buy']:
+                balance = self._balance(quote)
+                amount *= Decimal(payload['price'])
+            else:
+                balance = self._balance(base)
+            balance.reserved = max(balance.reserved - amount, ZERO)
+        else:
+            balance = self._balance(payload['currency'])
+        return balance
+
+    def received(self, payload: Any) -> None:
+        """
+        `payload` is a decoded outbox payload or typed message
+        """
+        message_type = payload.get('@type')
+        if message_type not in self.TYPES:
+            return
+        if self.replay is not None and message_type == 'SetBalance':
+            self.replay.append(payload)
+        self._notify(self._apply(message_type, payload), payload)
+
+    def seed(self, response: Any) -> None:
+        """
+        replaces the balances with the ones of a `UserBalanceResponse`
+        """
+        if response.get('@type') != 'UserBalanceResponse':
+            raise exceptions.CryptologyError(f'unexpected response to UserBalanceRequest: {response!r}')
+        self.balances = {
+            currency: Balance(currency, Decimal(str(item['available'])), Decimal(str(item['on_hold'])))
+            for currency, item in response['balances'].items()
+        }
+        for balance in list(self.balances.values()):
+            self._notify(balance, response)
+        # setting the available funds again is safe whether the response included the message or not
+        for payload in self.replay or ():
+            balance = self._balance(payload['currency'])
+            balance.available = Decimal(payload['balance'])
+            self._notify(balance, payload)
+
+    async def refresh(self, ws: 'ClientWriterStub', timeout: Optional[float] = None) -> None:
+        self.replay = []
+        try:
+            self.seed(await ws.send_signed_request(payload={'@type': 'UserBalanceRequest'}, timeout=timeout))
+        finally:
+            self.replay = None
@@ -2,19 +2,31 @@ import aiohttp
 import asyncio
 import functools
 import inspect
-import json
+import itertools
 import logging
 import os
+import time
 import warnings
-import xdrlib
 
+from concurrent.futures import Executor
 from datetime import datetime
-from typing import Any, AsyncIterator, Awaitable, Callable, ClassVar, Optional, Tuple, Type, cast, List
-
-from . import common, crypto, exceptions, parallel
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, ClassVar, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple,
+    Type, cast,
+)
+
+from . import codec, common, crypto, exceptions, parallel, serialization
+from .balances import BalanceCache
+from .dispatch import CallbackDispatcher
+from .journal import OutgoingJournal, SessionState
+from .messages import MessageDecoder
+from .metrics import PipelineMetrics, RoundTripTracker, timed_call
+from .orders import OrderTracker
+from .outbound import OutboundQueue, TokenBucket
 from .market_data_client import receive_msg
+from .recording import Recorder
 
-__all__ = ('ClientReadCallback', 'ClientWriter', 'ClientWriterStub', 'run_client', 'Keys',)
+__all__ = ('ClientReadCallback', 'ClientBatchReadCallback', 'ClientWriter', 'ClientWriterStub', 'run_client', 'Keys',)
 
 logger = logging.getLogger(__name__)
 
@@ -31,14 +43,17 @@ class ClientWriterStub:
     async def send_signed_message(self, *, sequence_id: int, payload: dict) -> None:
         pass
 
-    async def send_signed_request(self, *, request_id: int, payload: dict) -> Any:
+    async def send_signed_request(self, *, payload: dict, request_id: Optional[int] = None,
+                                  timeout: Optional[float] = None) -> Any:
         pass
 
 
 ClientReadCallback = Callable[[ClientWriterStub, int, datetime, dict], Awaitable[None]]
+ClientBatchReadCallback = Callable[[ClientWriterStub, List[Tuple[int, datetime, dict]]], Awaitable[None]]
 ClientWriter = Callable[[ClientWriterStub, int], Awaitable[None]]
 ClientThrottlingCallback = Callable[[int, int, int], Awaitable[bool]]
 TradesStateChangedCallback = Callable[[List[str], bool], Awaitable[None]]
+MessageHandler = Callable[[memoryview], Awaitable[Optional[Tuple[int, datetime, dict]]]]
 
 
 class BaseProtocolClient(aiohttp.ClientWebSocketResponse):
@@ -49,45 +64,89 @@ class BaseProtocolClient(aiohttp.ClientWebSocketResponse):
     server_keys: ClassVar[Keys]
     symmetric_key: bytes
     client_cipher: crypto.Cipher
-    rpc_requests: dict
-    rpc_completed: asyncio.Event
+    rpc_futures: Dict[int, asyncio.Future]
+    rpc_request_ids: Iterator[int]
+    rpc_timeout: Optional[float]
+    crypto_executor: Optional[Executor]
+    serializer: serialization.Serializer
+    decoder: Optional[MessageDecoder]
+    outbound: OutboundQueue
+    journal: Optional[OutgoingJournal]
+    message_handlers: Dict[int, MessageHandler]
+    throttling_callback: Optional[ClientThrottlingCallback]
+    trades_state_changed_callback: Optional[TradesStateChangedCallback]
+    metrics: Optional[PipelineMetrics]
+    round_trips: Optional[RoundTripTracker]
+    orders: Optional[OrderTracker]
+    balances: Optional[BalanceCache]
+    observers: Tuple[Callable[[Any], None], ...]
+    required_types: FrozenSet[str]
+    recorder: Optional[Recorder]
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         kw = {}
         kw.update(dict(zip(CLIENTWEBSOCKETRESPONSE_INIT_ARGS, args)))
         kw.update(kwargs)
         super(BaseProtocolClient, self).__init__(**kw)
+        self._init_protocol()
+
+    def _init_protocol(self) -> None:
         self.symmetric_key = os.urandom(32)
         self.client_cipher = crypto.Cipher(self.symmetric_key)
-        self.rpc_requests = dict()
-        self.rpc_completed = asyncio.Event()
-        self.send_fut = None
-        self.throttle = 0
+        self.rpc_futures = dict()
+        self.rpc_request_ids = itertools.count(1)
+        self.rpc_timeout = None
+        self.crypto_executor = None
+        self.serializer = serialization.get_serializer()
+        self.decoder = None
+        self.outbound = OutboundQueue(self.send_bytes)
+        self.journal = None
+        self.message_handlers = {
+            common.ServerMessageType.OUTBOX_MESSAGE.value: self._handle_outbox_message,
+            common.ServerMessageType.RPC_RESPONSE.value: self._handle_rpc_response,
+            common.ServerMessageType.ERROR_MESSAGE.value: self._handle_error_message,
+            common.ServerMessageType.BROADCAST_MESSAGE.value: self._handle_broadcast_message,
+            common.ServerMessageType.THROTTLING_MESSAGE.value: self._handle_throttling_message,
+        }
+        self.throttling_callback = None
+        self.trades_state_changed_callback = None
+        self.metrics = None
+        self.round_trips = None
+        self.orders = None
+        self.balances = None
+        self.observers = ()
+        self.required_types = frozenset()
+        self.recorder = None
+
+    def bind(self, client_id: str, client_keys: Keys, server_keys: Keys) -> None:
+        """
+        sets the account of a connection made through a session with the unbound class
+        """
+        self.client_id = client_id
+        self.client_keys = client_keys
+        self.server_keys = server_keys
 
     async def handshake(self, last_seen_order: int) -> Tuple[int, crypto.Cipher, int]:
-        packer = xdrlib.Packer()
-        packer.pack_bytes(self.client_id.encode('ascii'))
-        packer.pack_hyper(last_seen_order)
-        packer.pack_bytes(self.symmetric_key)
-        packer.pack_uint(self.VERSION)
-        await self.send_bytes(self.server_keys.encrypt(packer.get_buffer()))
+        """
+        RSA operations run in `crypto_executor` to keep the loop responsive while many connections handshake
+        """
+        executor = self.crypto_executor
+        handshake = codec.encode_client_handshake(
+            self.client_id.encode('ascii'), last_seen_order, self.symmetric_key, self.VERSION)
+        await self.send_bytes(await crypto.run_in_executor(executor, self.server_keys.encrypt, handshake))
         logger.debug('sent handshake')
 
         response = await receive_msg(self, timeout=3)
         logger.debug('received handshake')
-        unpacker = xdrlib.Unpacker(self.client_keys.decrypt(response))
-        data_to_sign = unpacker.unpack_bytes()
-        last_seen_sequence = unpacker.unpack_hyper()
-        server_aes_key = unpacker.unpack_bytes()
-        try:
-            server_version = unpacker.unpack_uint()
-        except EOFError:
+        data_to_sign, last_seen_sequence, server_aes_key, server_version = \
+            codec.decode_server_handshake(await crypto.run_in_executor(executor, self.client_keys.decrypt, response))
+        if server_version is None:
             server_version = 1
 
-        await self.send_bytes(self.client_keys.sign(data_to_sign))
+        await self.send_bytes(await crypto.run_in_executor(executor, self.client_keys.sign, bytes(data_to_sign)))
         logger.debug('sent client key')
 
-        return last_seen_sequence, crypto.Cipher(server_aes_key), server_version
+        return last_seen_sequence, crypto.Cipher(bytes(server_aes_key)), server_version
 
     async def send_signed(self, *args, **kwargs) -> None:
         warnings.warn("The 'send_signed' method is deprecated, use 'send_signed_message' instead", DeprecationWarning)
@@ -97,105 +156,187 @@ class BaseProtocolClient(aiohttp.ClientWebSocketResponse):
         if self.closed:
             logger.warning('the socket is closed')
             raise exceptions.CryptologyConnectionError()
-        xdr = xdrlib.Packer()
-        xdr.pack_enum(common.ClientMessageType.INBOX_MESSAGE.value)
-        xdr.pack_hyper(sequence_id)
-        xdr.pack_bytes(json.dumps(payload).encode('utf-8'))
-        encrypted = self.client_cipher.encrypt(xdr.get_buffer())
-        if self.send_fut:
-            await self.send_fut
-        if self.throttle:
-            logger.warning('throttle for %f seconds', self.throttle)
-            throttle, self.throttle = self.throttle, 0
-            await asyncio.sleep(throttle)
+        encrypted = self.client_cipher.encrypt(
+            codec.encode_inbox_message(sequence_id, self.serializer.dumps(payload)))
         logger.debug('sending message with seq id %i: %s', sequence_id, payload)
-        self.send_fut = asyncio.ensure_future(self.send_bytes(encrypted))
-
-    async def send_signed_request(self, *, request_id: int, payload: dict) -> Any:
-        xdr = xdrlib.Packer()
-        xdr.pack_enum(common.ClientMessageType.RPC_REQUEST.value)
-        xdr.pack_hyper(request_id)
-        xdr.pack_bytes(json.dumps(payload).encode('utf-8'))
-        logger.debug('sending RPC req with req id %i: %s', request_id, payload)
-        await self.send_bytes(self.client_cipher.encrypt(xdr.get_buffer()))
+        if self.journal is not None:
+            self.journal.record(sequence_id, payload)
+        if self.round_trips is not None:
+            self.round_trips.sent(sequence_id, payload)
+        await self.outbound.put(encrypted)
+
+    @property
+    def _peer_closed(self) -> bool:
+        """
+        whether the server closed the connection, aiohttp marks it closing or sets the close code
+        before closing it from `receive`, a cancelled `receive` only sets `ABNORMAL_CLOSURE`
+        """
+        return self._closing or self.close_code not in (None, aiohttp.WSCloseCode.ABNORMAL_CLOSURE)
+
+    async def close(self, **kwargs: Any) -> bool:
+        # frames queued after the server closed the connection can't be sent anymore
+        await self.outbound.close(0. if self._peer_closed else None)
+        return await super().close(**kwargs)
+
+    def next_request_id(self) -> int:
         while True:
+            request_id = next(self.rpc_request_ids)
+            if request_id not in self.rpc_futures:
+                return request_id
+
+    async def send_signed_request(self, *, payload: dict, request_id: Optional[int] = None,
+                                  timeout: Optional[float] = None) -> Any:
+        if self.closed:
+            logger.warning('the socket is closed')
+            raise exceptions.CryptologyConnectionError()
+        if request_id is None:
+            request_id = self.next_request_id()
+        elif request_id in self.rpc_futures:
+            raise ValueError(f'RPC request {request_id} is already in flight')
+        if timeout is None:
+            timeout = self.rpc_timeout
+
+        frame = codec.encode_rpc_request(request_id, self.serializer.dumps(payload))
+
+        result = asyncio.get_event_loop().create_future()
+        self.rpc_futures[request_id] = result
+        try:
+            logger.debug('sending RPC req with req id %i: %s', request_id, payload)
+            # queued behind signed messages and paced like them
+            await self.outbound.put(self.client_cipher.encrypt(frame))
             logger.debug('waiting for RPC result')
-            await self.rpc_completed.wait()
-            self.rpc_completed.clear()
-            if request_id in self.rpc_requests:
-                logger.debug('result received')
-                return self.rpc_requests.pop(request_id)
+            return await asyncio.wait_for(result, timeout)
+        finally:
+            del self.rpc_futures[request_id]
+
+    def abort_rpc_requests(self, exc: BaseException) -> None:
+        for result in self.rpc_futures.values():
+            if not result.done():
+                result.set_exception(exc)
 
     async def receive_iter(self, server_cipher: crypto.Cipher, throttling_callback: ClientThrottlingCallback,
                            trades_state_changed_callback: TradesStateChangedCallback
                            ) -> AsyncIterator[Tuple[int, datetime, dict]]:
-        while True:
-            data = await receive_msg(self)
-
-            decrypted = server_cipher.decrypt(data)
-            xdr = xdrlib.Unpacker(decrypted)
-            message_type: common.ServerMessageType = common.ServerMessageType.by_value(xdr.unpack_enum())
-            logger.debug('message %s received', message_type)
-            if message_type is common.ServerMessageType.THROTTLING_MESSAGE:
-                level = xdr.unpack_int()
-                sequence_id = xdr.unpack_hyper()
-                order_id = xdr.unpack_hyper()
-                if not throttling_callback or not await throttling_callback(level, sequence_id, order_id):
-                    self.throttle = 0.001 * level
-            elif message_type is common.ServerMessageType.OUTBOX_MESSAGE:
-                outbox_id = xdr.unpack_hyper()
-                ts = datetime.utcfromtimestamp(xdr.unpack_double())
-                payload = json.loads(xdr.unpack_string().decode('utf-8'))
-                logger.debug('outbox message: %s', payload)
-                yield outbox_id, ts, payload
-            elif message_type is common.ServerMessageType.RPC_RESPONSE:
-                request_id = xdr.unpack_hyper()
-                payload = json.loads(xdr.unpack_string().decode('utf-8'))
-                logger.debug('RPC response: %s', payload)
-                self.rpc_requests[request_id] = payload
-                self.rpc_completed.set()
-            elif message_type is common.ServerMessageType.ERROR_MESSAGE:
-                error_type = common.ServerErrorType.by_value(xdr.unpack_int())
-                message = xdr.unpack_string().decode('utf-8')
-                if message == 'TimeoutError()':
-                    logger.error('heartbeat error received')
-                    raise exceptions.HeartbeatError(datetime.utcnow(), datetime.utcnow())
-                logger.error('error received: %s', message)
-
-                if error_type == common.ServerErrorType.UNKNOWN_ERROR:
-                    raise exceptions.CryptologyError(message)
-                elif error_type == common.ServerErrorType.INVALID_PAYLOAD:
-                    raise exceptions.InvalidPayload(message)
-                elif error_type == common.ServerErrorType.DUPLICATE_CLIENT_ORDER_ID:
-                    raise exceptions.DuplicateClientOrderId()
-                elif error_type == common.ServerErrorType.TRADES_DISABLED:
-                    raise exceptions.TradesDisabledError()
-            elif message_type == common.ServerMessageType.BROADCAST_MESSAGE:
-                message = xdr.unpack_string().decode('utf-8')
-                payload = json.loads(message)
-                if payload['@type'] == 'TradesDisabledOnPairs':
-                    if trades_state_changed_callback:
-                        await trades_state_changed_callback(payload['trade_pairs'], False)
-                    else:
-                        logger.warning('Trades disabled for pairs {},'
-                                       'but trades_state_changed_callback'
-                                       ' is not seted'.format(' '.join(payload['trade_pairs'])))
-                elif payload['@type'] == 'TradesEnabledOnPairs':
-                    if trades_state_changed_callback:
-                        await trades_state_changed_callback(payload['trade_pairs'], True)
-                    else:
-                        logger.warning('Trades enabled for pairs {},'
-                                       'but trades_state_changed_callback'
-                                       ' is not seted'.format(' '.join(payload['trade_pairs'])))
+        self.throttling_callback = throttling_callback
+        self.trades_state_changed_callback = trades_state_changed_callback
+        handlers = self.message_handlers
+        metrics = self.metrics
+        recorder = self.recorder
+        try:
+            while True:
+                if metrics is None and recorder is None:
+                    frame = memoryview(server_cipher.decrypt(await receive_msg(self)))
+                else:
+                    started = time.perf_counter()
+                    data = await receive_msg(self)
+                    received = time.perf_counter()
+                    frame = memoryview(server_cipher.decrypt(data))
+                    if metrics is not None:
+                        metrics.record('receive', received - started)
+                        metrics.record('decrypt', time.perf_counter() - received)
+                    if recorder is not None:
+                        recorder.write(frame if recorder.decrypted else data)
+                try:
+                    handler = handlers[codec.decode_message_type(frame)]
+                except KeyError:
+                    logger.error('unsupported message type')
+                    raise exceptions.UnsupportedMessageType()
+                item = await handler(frame)
+                if item is not None:
+                    yield item
+        finally:
+            self.abort_rpc_requests(exceptions.CryptologyConnectionError('connection closed'))
+
+    async def _handle_throttling_message(self, frame: memoryview) -> None:
+        level, sequence_id, order_id = codec.decode_throttling_message(frame)
+        logger.debug('throttling message received: level %i', level)
+        if not self.throttling_callback or not await self.throttling_callback(level, sequence_id, order_id):
+            logger.warning('throttle for %f seconds', 0.001 * level)
+            self.outbound.postpone(0.001 * level)
+
+    async def _handle_outbox_message(self, frame: memoryview) -> Tuple[int, datetime, Optional[dict]]:
+        """
+        with a `decoder` the payload is a typed message, or `None` if its type isn't subscribed
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        outbox_id, timestamp, message = codec.decode_outbox_message(frame)
+        if metrics is not None:
+            unpacked = time.perf_counter()
+            metrics.record('unpack', unpacked - started)
+        if self.decoder is None:
+            payload = self.serializer.loads(message)
+            if self.observers:
+                self._notify_observers(payload)
+        elif not self.observers:
+            payload = self.decoder.decode(message, self.serializer.loads)
+        else:
+            payload = self.decoder.decode(message, self.serializer.loads, self.required_types)
+            if payload is not None:
+                self._notify_observers(payload)
+                if not self.decoder.accepts(payload.type):
+                    payload = None
+        if metrics is not None:
+            metrics.record('decode', time.perf_counter() - unpacked)
+            metrics.record_exchange_latency(timestamp)
+        logger.debug('outbox message: %s', payload)
+        return outbox_id, datetime.utcfromtimestamp(timestamp), payload
+
+    def _notify_observers(self, payload: Any) -> None:
+        """
+        a failing tracker is logged and doesn't close the connection
+        """
+        for observer in self.observers:
+            try:
+                observer(payload)
+            except Exception:
+                logger.exception('outbox observer %r failed on %s', observer, payload)
+
+    async def _handle_rpc_response(self, frame: memoryview) -> None:
+        request_id, message = codec.decode_rpc_response(frame)
+        payload = self.serializer.loads(message)
+        logger.debug('RPC response: %s', payload)
+        result = self.rpc_futures.get(request_id)
+        if result is None or result.done():
+            logger.warning('unexpected RPC response with req id %i', request_id)
+        else:
+            result.set_result(payload)
+
+    async def _handle_error_message(self, frame: memoryview) -> None:
+        error_code, message = codec.decode_error_message(frame)
+        error_type = common.ServerErrorType.by_value(error_code)
+        message = str(message, 'utf-8')
+        if message == 'TimeoutError()':
+            logger.error('heartbeat error received')
+            raise exceptions.HeartbeatError(datetime.utcnow(), datetime.utcnow())
+        logger.error('error received: %s', message)
+
+        if error_type == common.ServerErrorType.UNKNOWN_ERROR:
+            raise exceptions.CryptologyError(message)
+        elif error_type == common.ServerErrorType.INVALID_PAYLOAD:
+            raise exceptions.InvalidPayload(message)
+        elif error_type == common.ServerErrorType.DUPLICATE_CLIENT_ORDER_ID:
+            raise exceptions.DuplicateClientOrderId()
+        elif error_type == common.ServerErrorType.TRADES_DISABLED:
+            raise exceptions.TradesDisabledError()
+
+    async def _handle_broadcast_message(self, frame: memoryview) -> None:
+        payload = self.serializer.loads(codec.decode_broadcast_message(frame))
+        if payload['@type'] == 'TradesDisabledOnPairs':
+            if self.trades_state_changed_callback:
+                await self.trades_state_changed_callback(payload['trade_pairs'], False)
             else:
-                logger.error('unsupported message type')
-                raise exceptions.UnsupportedMessageType()
-
-    async def _receive_xdr(self, *, timeout: Optional[float] = None) -> xdrlib.Unpacker:
-        return xdrlib.Unpacker(await receive_msg(self, timeout=timeout))
-
-    async def _send_xdr(self, packer: xdrlib.Packer) -> None:
-        await self.send_bytes(packer.get_buffer())
+                logger.warning('Trades disabled for pairs {},'
+                               'but trades_state_changed_callback'
+                               ' is not seted'.format(' '.join(payload['trade_pairs'])))
+        elif payload['@type'] == 'TradesEnabledOnPairs':
+            if self.trades_state_changed_callback:
+                await self.trades_state_changed_callback(payload['trade_pairs'], True)
+            else:
+                logger.warning('Trades enabled for pairs {},'
+                               'but trades_state_changed_callback'
+                               ' is not seted'.format(' '.join(payload['trade_pairs'])))
 
 
 @functools.lru_cache(typed=True)
@@ -206,30 +347,225 @@ def bind_response_class(client_id: str, client_keys: Keys, server_keys: Keys) ->
 
 
 class CryptologyClientSession(aiohttp.ClientSession):
-    def __init__(self, client_id: str, client_keys: Keys, server_keys: Keys, *,
-                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
-        super().__init__(ws_response_class=bind_response_class(client_id, client_keys, server_keys), loop=loop)
+    def __init__(self, client_id: str, client_keys: Keys, server_keys: Keys) -> None:
+        super().__init__(ws_response_class=bind_response_class(client_id, client_keys, server_keys))
+
+
+WS_CONNECT_OPTIONS: Dict[str, Any] = {'autoclose': True, 'autoping': True, 'receive_timeout': 10, 'heartbeat': 4}
+
+
+async def start_session(ws: BaseProtocolClient, *, last_seen_order: int = 0,
+                        rpc_timeout: Optional[float] = None,
+                        serializer: Optional[serialization.Serializer] = None,
+                        pacing: Optional[TokenBucket] = None,
+                        state: Optional[SessionState] = None,
+                        crypto_executor: Optional[Executor] = None,
+                        decoder: Optional[MessageDecoder] = None,
+                        metrics: Optional[PipelineMetrics] = None,
+                        round_trips: Optional[RoundTripTracker] = None,
+                        orders: Optional[OrderTracker] = None,
+                        balances: Optional[BalanceCache] = None,
+                        recorder: Optional[Recorder] = None) -> Tuple[int, crypto.Cipher]:
+    """
+    handshakes on a connected socket, returns the sequence id to continue from and the server cipher
+
+    with `state` the connection resumes after `state.last_outbox_id` instead of `last_seen_order`
+    and messages the server hasn't seen are sent again
+    """
+    ws.rpc_timeout = rpc_timeout
+    ws.crypto_executor = crypto_executor
+    ws.decoder = decoder
+    ws.metrics = metrics
+    ws.round_trips = round_trips
+    ws.orders = orders
+    ws.balances = balances
+    ws.observers = tuple(x.received for x in (round_trips, orders, balances) if x is not None)
+    # payloads the trackers need are decoded even if `decoder` doesn't subscribe to them
+    required_types: FrozenSet[str] = frozenset()
+    if round_trips is not None:
+        required_types |= round_trips.RESPONSE_TYPES
+    for tracker in (orders, balances):
+        if tracker is not None:
+            required_types |= tracker.TYPES
+    ws.required_types = required_types
+    if serializer is not None:
+        ws.serializer = serializer
+    if pacing is not None:
+        ws.outbound.bucket = pacing
+    if state is not None:
+        last_seen_order = state.last_outbox_id
+    sequence_id, server_cipher, server_version = await ws.handshake(last_seen_order)
+    logger.info('handshake succeeded, server version %i, sequence id = %i', server_version, sequence_id)
+    if recorder is not None:
+        recorder.write_key(server_cipher.key)
+        ws.recorder = recorder
+
+    if state is not None:
+        state.connections += 1
+        state.reset()
+        state.journal.acknowledge(sequence_id)
+        ws.journal = state.journal
+        for pending_id, payload in state.journal.pending():
+            logger.info('resending message with seq id %i', pending_id)
+            await ws.send_signed_message(sequence_id=pending_id, payload=payload)
+            sequence_id = max(sequence_id, pending_id)
+    return sequence_id, server_cipher
+
+
+async def load_trackers(ws: BaseProtocolClient) -> None:
+    """
+    loads the order tracker and balance cache of `ws` from the server, the reader has to run meanwhile
+    """
+    await asyncio.gather(*(x.refresh(ws) for x in (ws.orders, ws.balances) if x is not None))
+
+
+async def handled_call(state: SessionState, outbox_ids: Iterable[int], func: Callable[..., Awaitable[None]],
+                       *args: Any) -> None:
+    """
+    runs the callback of outbox messages and marks them handled in `state` unless it's cancelled
+    """
+    try:
+        await func(*args)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        for outbox_id in outbox_ids:
+            state.handled(outbox_id)
+        raise
+    for outbox_id in outbox_ids:
+        state.handled(outbox_id)
+
+
+async def serve_session(ws: BaseProtocolClient, sequence_id: int, server_cipher: crypto.Cipher, *,
+                        read_callback: Optional[ClientReadCallback] = None, writer: ClientWriter,
+                        batch_read_callback: Optional[ClientBatchReadCallback] = None,
+                        batch_size: int = 1000,
+                        batch_delay: float = 0.,
+                        throttling_callback: ClientThrottlingCallback = None,
+                        trades_state_changed_callback: TradesStateChangedCallback = None,
+                        dispatcher: Optional[CallbackDispatcher] = None,
+                        state: Optional[SessionState] = None) -> None:
+    """
+    runs the reader and `writer` of a connection after `start_session` until either exits
+
+    `batch_read_callback` gets lists of up to `batch_size` messages instead of single messages.
+    a batch holds every message that arrived while the previous batch was handled, and waits
+    up to `batch_delay` seconds for more.
+    with the order tracker or balance cache of `start_session` the writer starts once they are loaded.
+    when `writer` returns the queued callbacks get `dispatcher.drain_timeout` seconds to finish,
+    on a disconnect or cancellation they are cancelled right away
+    """
+    assert (read_callback is None) != (batch_read_callback is None), \
+        'either read_callback or batch_read_callback is required'
+    assert batch_size > 0
+    if dispatcher is None:
+        dispatcher = CallbackDispatcher()
+    batches: Optional[asyncio.Queue] = asyncio.Queue(batch_size) if batch_read_callback is not None else None
+
+    async def reader_loop() -> None:
+        async for outbox_id, ts, msg in ws.receive_iter(server_cipher, throttling_callback,
+                                                        trades_state_changed_callback):
+            logger.debug('%s new msg from server @%i: %s', ts, outbox_id, msg)
+            if msg is None:
+                if state is not None:
+                    state.handled(outbox_id)
+                continue
+            if state is not None:
+                state.received(outbox_id)
+            if batches is not None:
+                await batches.put((outbox_id, ts, msg))
+                continue
+            call: tuple = (read_callback, ws, outbox_id, ts, msg)
+            if ws.metrics is not None:
+                call = (timed_call, ws.metrics, time.perf_counter()) + call
+            if state is not None:
+                call = (handled_call, state, (outbox_id,)) + call
+            await dispatcher.submit(msg.get('trade_pair'), *call)
+
+    async def batch_loop() -> None:
+        now = asyncio.get_event_loop().time
+        while True:
+            batch = [await batches.get()]
+            deadline = now() + batch_delay
+            while len(batch) < batch_size:
+                if not batches.empty():
+                    batch.append(batches.get_nowait())
+                    continue
+                timeout = deadline - now()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(batches.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            call: tuple = (batch_read_callback, ws, batch)
+            if ws.metrics is not None:
+                call = (timed_call, ws.metrics, time.perf_counter()) + call
+            if state is not None:
+                call = (handled_call, state, [outbox_id for outbox_id, _, _ in batch]) + call
+            # at most one batch waits while another is handled, the next one keeps growing meanwhile
+            await dispatcher.submit(None, *call, max_queue_size=1)
+
+    async def writer_loop() -> None:
+        await load_trackers(ws)
+        await writer(ws, sequence_id)
+
+    coros = [reader_loop(), writer_loop()]
+    if batches is not None:
+        coros.append(batch_loop())
+    try:
+        await parallel.run_parallel(coros)
+    except BaseException:
+        # with `state` the cancelled messages are received again after a reconnect
+        await dispatcher.close()
+        raise
+    await dispatcher.shutdown()
 
 
 async def run_client(*, client_id: str, client_keys: Keys, ws_addr: str, server_keys: Keys,
-                     read_callback: ClientReadCallback, writer: ClientWriter,
+                     read_callback: Optional[ClientReadCallback] = None, writer: ClientWriter,
+                     batch_read_callback: Optional[ClientBatchReadCallback] = None,
+                     batch_size: int = 1000,
+                     batch_delay: float = 0.,
                      throttling_callback: ClientThrottlingCallback = None,
                      trades_state_changed_callback: TradesStateChangedCallback = None,
                      last_seen_order: int = 0,
-                     loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
-    async with CryptologyClientSession(client_id, client_keys, server_keys, loop=loop) as session:
-        async with session.ws_connect(ws_addr, autoclose=True, autoping=True, receive_timeout=10, heartbeat=4) as ws:
+                     rpc_timeout: Optional[float] = None,
+                     serializer: Optional[serialization.Serializer] = None,
+                     dispatcher: Optional[CallbackDispatcher] = None,
+                     pacing: Optional[TokenBucket] = None,
+                     state: Optional[SessionState] = None,
+                     crypto_executor: Optional[Executor] = None,
+                     decoder: Optional[MessageDecoder] = None,
+                     metrics: Optional[PipelineMetrics] = None,
+                     round_trips: Optional[RoundTripTracker] = None,
+                     orders: Optional[OrderTracker] = None,
+                     balances: Optional[BalanceCache] = None,
+                     recorder: Optional[Recorder] = None) -> None:
+    """
+    `read_callback` runs through `dispatcher`, in order for messages of the same trade pair,
+    `send_signed_message` and `send_signed_request` only queue the message, a writer task sends it paced by `pacing`.
+    with `state` the connection resumes after `state.last_outbox_id` instead of `last_seen_order`
+    and messages the server hasn't seen are sent again before `writer` starts.
+    the RSA handshake runs in `crypto_executor`, by default the executor of the loop.
+    with `decoder` only payloads of its types are decoded and passed to `read_callback` as typed messages.
+    `batch_read_callback` replaces `read_callback` to handle messages in batches, see `serve_session`.
+    `metrics` collects the time spent in each stage of receiving a message,
+    `round_trips` the time from sending an order request to its answer in the outbox.
+    `orders` keeps the active orders of the account from the outbox and `balances` its balances,
+    both are loaded again on every connect.
+    `recorder` writes the received frames to a file for `replay.replay_client`
+    """
+    async with CryptologyClientSession(client_id, client_keys, server_keys) as session:
+        async with session.ws_connect(ws_addr, **WS_CONNECT_OPTIONS) as ws:
             logger.info('connected to the server %s', ws_addr)
-            sequence_id, server_cipher, server_version = await ws.handshake(last_seen_order)
-            logger.info('handshake succeeded, server version %i, sequence id = %i', server_version, sequence_id)
-
-            async def reader_loop() -> None:
-                async for outbox_id, ts, msg in ws.receive_iter(server_cipher, throttling_callback,
-                                                                trades_state_changed_callback):
-                    logger.debug('%s new msg from server @%i: %s', ts, outbox_id, msg)
-                    asyncio.ensure_future(read_callback(ws, outbox_id, ts, msg))
-
-            await parallel.run_parallel((
-                reader_loop(),
-                writer(ws, sequence_id)
-            ), loop=loop)
+            sequence_id, server_cipher = await start_session(
+                ws, last_seen_order=last_seen_order, rpc_timeout=rpc_timeout, serializer=serializer,
+                pacing=pacing, state=state, crypto_executor=crypto_executor, decoder=decoder, metrics=metrics,
+                round_trips=round_trips, orders=orders, balances=balances, recorder=recorder)
+            await serve_session(ws, sequence_id, server_cipher, read_callback=read_callback, writer=writer,
+                                batch_read_callback=batch_read_callback, batch_size=batch_size,
+                                batch_delay=batch_delay,
+                                throttling_callback=throttling_callback,
+                                trades_state_changed_callback=trades_state_changed_callback,
+                                dispatcher=dispatcher, state=state)
@@ -0,0 +1,181 @@
+"""
+XDR framing of the cryptology protocol built on precompiled `struct.Struct` layouts
+
+encoders return `bytes` identical to the ones produced by `xdrlib.Packer`,
+decoders work over a `memoryview` and return payloads as views into the frame
+"""
+import struct
+
+from typing import Optional, Tuple, Union
+
+from .common import ClientMessageType, ServerMessageType
+
+__all__ = (
+    'encode_client_handshake', 'decode_client_handshake', 'encode_server_handshake', 'decode_server_handshake',
+    'encode_signed', 'decode_signed', 'encode_uint', 'decode_uint',
+    'encode_inbox_message', 'encode_rpc_request', 'decode_client_message',
+    'encode_outbox_message', 'encode_rpc_response', 'encode_error_message', 'encode_broadcast_message',
+    'encode_throttling_message', 'decode_message_type', 'decode_outbox_message', 'decode_rpc_response',
+    'decode_error_message', 'decode_broadcast_message', 'decode_throttling_message',
+)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+UINT = struct.Struct('>I')
+HYPER = struct.Struct('>q')
+MESSAGE_TYPE = struct.Struct('>i')
+
+# fixed size prefixes of each frame, including the length of the trailing opaque field
+INBOX_MESSAGE = struct.Struct('>iqI')
+RPC_REQUEST = struct.Struct('>iqI')
+OUTBOX_MESSAGE = struct.Struct('>iqdI')
+RPC_RESPONSE = struct.Struct('>iqI')
+ERROR_MESSAGE = struct.Struct('>iiI')
+BROADCAST_MESSAGE = struct.Struct('>iI')
+THROTTLING_MESSAGE = struct.Struct('>iiqq')
+
+PADDING = (b'', b'\0\0\0', b'\0\0', b'\0')
+
+
+def _unpack_from(layout: struct.Struct, view: memoryview, offset: int) -> tuple:
+    if len(view) < offset + layout.size:
+        raise EOFError()
+    return layout.unpack_from(view, offset)
+
+
+def _unpack_opaque(view: memoryview, offset: int, size: int) -> Tuple[memoryview, int]:
+    end = offset + size
+    if len(view) < end:
+        raise EOFError()
+    return view[offset:end], end + (-size & 3)
+
+
+def _read_opaque(view: memoryview, offset: int) -> Tuple[memoryview, int]:
+    return _unpack_opaque(view, offset + 4, _unpack_from(UINT, view, offset)[0])
+
+
+def _pack_opaque(data: Buffer) -> bytes:
+    size = len(data)
+    return UINT.pack(size) + data + PADDING[size & 3]
+
+
+def _frame(header: bytes, data: Buffer) -> bytes:
+    return header + data + PADDING[len(data) & 3]
+
+
+def encode_client_handshake(client_id: bytes, last_seen_order: int, aes_key: bytes, version: int) -> bytes:
+    return _pack_opaque(client_id) + HYPER.pack(last_seen_order) + _pack_opaque(aes_key) + UINT.pack(version)
+
+
+def _decode_handshake(data: Buffer) -> Tuple[memoryview, int, memoryview, Optional[int]]:
+    view = memoryview(data)
+    identity, offset = _read_opaque(view, 0)
+    last_seen = _unpack_from(HYPER, view, offset)[0]
+    aes_key, offset = _read_opaque(view, offset + HYPER.size)
+    version = _unpack_from(UINT, view, offset)[0] if len(view) > offset else None
+    return identity, last_seen, aes_key, version
+
+
+def decode_client_handshake(data: Buffer) -> Tuple[memoryview, int, memoryview, Optional[int]]:
+    return _decode_handshake(data)
+
+
+def encode_server_handshake(data_to_sign: bytes, last_seen_sequence: int, aes_key: bytes,
+                            version: Optional[int] = None) -> bytes:
+    encoded = _pack_opaque(data_to_sign) + HYPER.pack(last_seen_sequence) + _pack_opaque(aes_key)
+    if version is not None:
+        encoded += UINT.pack(version)
+    return encoded
+
+
+def decode_server_handshake(data: Buffer) -> Tuple[memoryview, int, memoryview, Optional[int]]:
+    """
+    returns `None` as the version of servers that don't send one
+    """
+    return _decode_handshake(data)
+
+
+def encode_signed(signature: bytes, data: Buffer) -> bytes:
+    return _pack_opaque(signature) + _pack_opaque(data)
+
+
+def decode_signed(data: Buffer) -> Tuple[memoryview, memoryview]:
+    view = memoryview(data)
+    signature, offset = _read_opaque(view, 0)
+    return signature, _read_opaque(view, offset)[0]
+
+
+def encode_uint(value: int) -> bytes:
+    return UINT.pack(value)
+
+
+def decode_uint(data: Buffer) -> int:
+    return _unpack_from(UINT, memoryview(data), 0)[0]
+
+
+def encode_inbox_message(sequence_id: int, payload: bytes) -> bytes:
+    return _frame(INBOX_MESSAGE.pack(ClientMessageType.INBOX_MESSAGE.value, sequence_id, len(payload)), payload)
+
+
+def encode_rpc_request(request_id: int, payload: bytes) -> bytes:
+    return _frame(RPC_REQUEST.pack(ClientMessageType.RPC_REQUEST.value, request_id, len(payload)), payload)
+
+
+def decode_client_message(data: Buffer) -> Tuple[int, int, memoryview]:
+    """
+    returns message type, sequence or request id and payload of a client frame
+    """
+    view = memoryview(data)
+    message_type, sequence_id, size = _unpack_from(INBOX_MESSAGE, view, 0)
+    payload, _ = _unpack_opaque(view, INBOX_MESSAGE.size, size)
+    return message_type, sequence_id, payload
+
+
+def encode_outbox_message(outbox_id: int, timestamp: float, payload: bytes) -> bytes:
+    return _frame(OUTBOX_MESSAGE.pack(ServerMessageType.OUTBOX_MESSAGE.value, outbox_id, timestamp, len(payload)),
+                  payload)
+
+
+def encode_rpc_response(request_id: int, payload: bytes) -> bytes:
+    return _frame(RPC_RESPONSE.pack(ServerMessageType.RPC_RESPONSE.value, request_id, len(payload)), payload)
+
+
+def encode_error_message(error_type: int, message: bytes) -> bytes:
+    return _frame(ERROR_MESSAGE.pack(ServerMessageType.ERROR_MESSAGE.value, error_type, len(message)), message)
+
+
+def encode_broadcast_message(payload: bytes) -> bytes:
+    return _frame(BROADCAST_MESSAGE.pack(ServerMessageType.BROADCAST_MESSAGE.value, len(payload)), payload)
+
+
+def encode_throttling_message(level: int, sequence_id: int, order_id: int) -> bytes:
+    return THROTTLING_MESSAGE.pack(ServerMessageType.THROTTLING_MESSAGE.value, level, sequence_id, order_id)
+
+
+def decode_message_type(view: memoryview) -> int:
+    return _unpack_from(MESSAGE_TYPE, view, 0)[0]
+
+
+def decode_outbox_message(view: memoryview) -> Tuple[int, float, memoryview]:
+    _, outbox_id, timestamp, size = _unpack_from(OUTBOX_MESSAGE, view, 0)
+    return outbox_id, timestamp, _unpack_opaque(view, OUTBOX_MESSAGE.size, size)[0]
+
+
+def decode_rpc_response(view: memoryview) -> Tuple[int, memoryview]:
+    _, request_id, size = _unpack_from(RPC_RESPONSE, view, 0)
+    return request_id, _unpack_opaque(view, RPC_RESPONSE.size, size)[0]
+
+
+def decode_error_message(view: memoryview) -> Tuple[int, memoryview]:
+    _, error_type, size = _unpack_from(ERROR_MESSAGE, view, 0)
+    return error_type, _unpack_opaque(view, ERROR_MESSAGE.size, size)[0]
+
+
+def decode_broadcast_message(view: memoryview) -> memoryview:
+    _, size = _unpack_from(BROADCAST_MESSAGE, view, 0)
+    return _unpack_opaque(view, BROADCAST_MESSAGE.size, size)[0]
+
+
+def decode_throttling_message(view: memoryview) -> Tuple[int, int, int]:
+    _, level, sequence_id, order_id = _unpack_from(THROTTLING_MESSAGE, view, 0)
+    return level, sequence_id, order_id
@@ -13,10 +13,11 @@ CLOSE_MESSAGES = (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING,
 class ByValue(Enum):
     @classmethod
     def by_value(cls, value: int) -> Any:
-        for val in cls:
-            if val.value == value:
-                return val
-        raise IndexError(value)
+        # `Enum` builds the value to member table once, when the class is defined
+        try:
+            return cls._value2member_map_[value]
+        except KeyError:
+            raise IndexError(value) from None
 
 
 @unique
@@ -1,12 +1,16 @@
+import asyncio
+import functools
 import os
 import os.path
-import xdrlib
 
+from concurrent.futures import Executor
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
-from typing import Optional, Tuple
-from . import internal
+from cryptography.hazmat.primitives.serialization import (Encoding, NoEncryption, PrivateFormat, PublicFormat,
+                                                          load_der_private_key, load_der_public_key,
+                                                          load_pem_private_key, load_pem_public_key)
+from typing import Any, Callable, Optional, Tuple, TypeVar
+from . import codec, internal
 from .exceptions import InvalidKey
 
 SIGNATURE_HASH = internal.SHA512()
@@ -23,52 +27,69 @@ ENCRYPTION_PADDING = internal.OAEP(
 
 BACKEND = default_backend()
 IV_LIFETIME = 10000
+BLOCK_SIZE = internal.AES.block_size // 8
+PADDING = tuple(bytes((size,)) * size for size in range(BLOCK_SIZE + 1))
 
 
 class Cipher:
-    __slots__ = ('key', 'iv', 'iv_counter',)
+    __slots__ = ('key', 'iv', 'iv_counter', 'algorithm', 'encryption', 'decryption_iv', 'decryption',)
 
     key: bytes
     iv: bytes
     iv_counter: int
+    algorithm: internal.AES
+    encryption: internal.Cipher
+    decryption_iv: Optional[bytes]
+    decryption: Optional[internal.Cipher]
 
     def __init__(self, key: bytes) -> None:
         assert len(key) == 32
         self.key = key
+        self.algorithm = internal.AES(key)
+        self.decryption_iv = None
+        self.decryption = None
         self.update_iv()
 
     def update_iv(self):
-        self.iv = os.urandom(16)
+        self.iv = os.urandom(BLOCK_SIZE)
         self.iv_counter = IV_LIFETIME
+        self.encryption = internal.Cipher(self.algorithm, internal.CBC(self.iv), BACKEND)
 
     def encrypt(self, data: bytes) -> bytes:
         self.iv_counter -= 1
         if not self.iv_counter:
             self.update_iv()
-        padder = internal.PKCS7(internal.AES.block_size).padder()
-        padded_data = padder.update(data) + padder.finalize()
-        encryptor = internal.Cipher(internal.AES(self.key), internal.CBC(self.iv), BACKEND).encryptor()
-        return self.iv + encryptor.update(padded_data) + encryptor.finalize()
+        # CBC output is always block aligned, so `finalize` would return nothing
+        return self.iv + self.encryption.encryptor().update(data + PADDING[BLOCK_SIZE - len(data) % BLOCK_SIZE])
 
     def decrypt(self, data: bytes) -> bytes:
-        iv, cipherdata = data[:16], data[16:]
-        decryptor = internal.Cipher(internal.AES(self.key), internal.CBC(iv), BACKEND).decryptor()
-        plaintext_padded = decryptor.update(cipherdata)
+        iv = data[:BLOCK_SIZE]
+        # the peer keeps its iv for IV_LIFETIME messages, so the cipher is usually reused
+        if iv != self.decryption_iv:
+            self.decryption = internal.Cipher(self.algorithm, internal.CBC(iv), BACKEND)
+            self.decryption_iv = iv
+        decryptor = self.decryption.decryptor()
+        plaintext_padded = decryptor.update(memoryview(data)[BLOCK_SIZE:])
         try:
-            plaintext_padded += decryptor.finalize()
+            decryptor.finalize()
         except ValueError:
             raise InvalidKey()
-        unpadder = internal.PKCS7(internal.AES.block_size).unpadder()
-
-        unpadded = unpadder.update(plaintext_padded)
-        try:
-            unpadded += unpadder.finalize()
-        except ValueError:
+        padding = plaintext_padded[-1] if plaintext_padded else 0
+        if not 0 < padding <= BLOCK_SIZE or not plaintext_padded.endswith(PADDING[padding]):
             raise InvalidKey()
-        return unpadded
+        return plaintext_padded[:-padding]
+
+
+T = TypeVar('T')
 
 
 class Keys:
+    """
+    RSA keys of one side of the handshake
+
+    keys are pickled as DER and loaded once per process, so the bound methods
+    can be sent to a `ProcessPoolExecutor`
+    """
     __slots__ = ('public', 'private',)
 
     public: Optional[internal.RSAPublicKey]
@@ -97,6 +118,13 @@ class Keys:
         self.public = public
         self.private = private
 
+    def __reduce__(self) -> Tuple[Callable[..., 'Keys'], Tuple[Optional[bytes], Optional[bytes]]]:
+        public = self.public.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo) \
+            if self.public is not None else None
+        private = self.private.private_bytes(Encoding.DER, PrivateFormat.PKCS8, NoEncryption()) \
+            if self.private is not None else None
+        return _load_der_keys, (public, private)
+
     def sign(self, data: bytes) -> bytes:
         assert self.private is not None
         return self.private.sign(data, SIGNATURE_PADDING, SIGNATURE_HASH)
@@ -118,17 +146,25 @@ class Keys:
             raise InvalidKey()
 
 
+@functools.lru_cache(maxsize=None)
+def _load_der_keys(public: Optional[bytes], private: Optional[bytes]) -> Keys:
+    return Keys(load_der_public_key(public, backend=BACKEND) if public is not None else None,
+                load_der_private_key(private, password=None, backend=BACKEND) if private is not None else None)
+
+
+async def run_in_executor(executor: Optional[Executor], func: Callable[..., T], *args: Any) -> T:
+    """
+    runs a blocking RSA operation in `executor`, `None` is the default executor of the loop
+    """
+    return await asyncio.get_event_loop().run_in_executor(executor, func, *args)
+
+
 def encrypt_and_sign(keys: Keys, cipher: Cipher, data: bytes) -> bytes:
-    xdr = xdrlib.Packer()
-    xdr.pack_bytes(keys.sign(data))
-    xdr.pack_bytes(data)
-    return cipher.encrypt(xdr.get_buffer())
+    return cipher.encrypt(codec.encode_signed(keys.sign(data), data))
 
 
 def decrypt_and_verify(keys: Keys, cipher: Cipher, encrypted: bytes) -> Tuple[bytes, bytes]:
     raw = cipher.decrypt(encrypted)
-    xdr = xdrlib.Unpacker(raw)
-    signature = xdr.unpack_bytes()
-    data = xdr.unpack_bytes()
-    keys.verify(signature, data)
-    return raw, data
+    signature, data = codec.decode_signed(raw)
+    keys.verify(bytes(signature), bytes(data))
+    return raw, bytes(data)
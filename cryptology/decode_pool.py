@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, FrozenSet, List, Optional, Tuple
+
+from . import codec, common, exceptions, serialization
+from .messages import MessageDecoder, Subscription
+
+__all__ = ('DecodePool', 'decode_frames',)
+
+SubscriptionArgs = Optional[Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]], FrozenSet[str]]]
+
+
+def decode_frames(frames: List[bytes], serializer_name: str, subscription: SubscriptionArgs,
+                  decoder_types: Optional[FrozenSet[str]], use_decoder: bool,
+                  required: FrozenSet[str]) -> Tuple[List[Any], int, int]:
+    """
+    decodes broadcast frames in a worker process
+
+    returns the payloads with `None` for the skipped ones and how many the subscription
+    and the decoder skipped
+    """
+    loads = serialization.get_serializer(serializer_name).loads
+    accepts = Subscription(*subscription).accepts if subscription is not None else None
+    decoder = MessageDecoder(decoder_types) if use_decoder else None
+    payloads: List[Any] = []
+    filtered = 0
+    for msg in frames:
+        try:
+            frame = memoryview(msg)
+            message_type = common.ServerMessageType.by_value(codec.decode_message_type(frame))
+            if message_type != common.ServerMessageType.BROADCAST_MESSAGE:
+                raise exceptions.UnsupportedMessageType()
+            data = codec.decode_broadcast_message(frame)
+            if accepts is not None and not accepts(data):
+                filtered += 1
+                payloads.append(None)
+            elif decoder is not None:
+                payloads.append(decoder.decode(data, loads, required))
+            else:
+                payloads.append(loads(data))
+        except (KeyError, ValueError, EOFError, exceptions.UnsupportedMessageType):
+            raise exceptions.CryptologyError('failed to decode data')
+    return payloads, filtered, decoder.skipped if decoder is not None else 0
+
+
+class DecodePool:
+    """
+    worker processes decoding market data frames in batches of up to `batch_size`
+
+    while the workers decode `max_pending` batches the reader stops reading the socket
+    """
+    __slots__ = ('executor', 'workers', 'batch_size', 'max_pending',)
+
+    executor: ProcessPoolExecutor
+    workers: int
+    batch_size: int
+    max_pending: int
+
+    def __init__(self, workers: Optional[int] = None, *, batch_size: int = 256,
+                 max_pending: Optional[int] = None) -> None:
+        assert batch_size > 0
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.batch_size = batch_size
+        self.max_pending = max_pending or 2 * self.workers
+
+    def __enter__(self) -> 'DecodePool':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def submit(self, frames: List[bytes], serializer: serialization.Serializer,
+               subscription: Optional[Subscription], decoder: Optional[MessageDecoder],
+               required: FrozenSet[str]) -> asyncio.Future:
+        subscription_args = None
+        if subscription is not None:
+            subscription_args = (subscription.trade_pairs, subscription.types, subscription.always)
+        return asyncio.get_event_loop().run_in_executor(
+            self.executor, decode_frames, frames, serializer.name, subscription_args,
+            decoder.types if decoder is not None else None, decoder is not None, required)
+
+    def close(self) -> None:
+        self.executor.shutdown()
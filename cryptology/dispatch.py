@@ -0,0 +1,206 @@
+import asyncio
+import logging
+
+from collections import deque
+from enum import Enum
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from .exceptions import CallbackError
+
+__all__ = ('Overflow', 'CallbackDispatcher',)
+
+logger = logging.getLogger(__name__)
+
+ErrorCallback = Callable[[BaseException], None]
+
+
+class Overflow(Enum):
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+
+
+class _Lane:
+    __slots__ = ('queue', 'worker', 'not_full',)
+
+    queue: Deque[Tuple[Callable[..., Awaitable[None]], tuple]]
+    worker: Optional[asyncio.Future]
+    not_full: asyncio.Event
+
+    def __init__(self) -> None:
+        self.queue = deque()
+        self.worker = None
+        self.not_full = asyncio.Event()
+
+
+class CallbackDispatcher:
+    """
+    runs callbacks in the background with bounded concurrency and bounded queues
+
+    callbacks submitted with the same key run one after another in submission order,
+    different keys run concurrently up to `max_concurrency`.
+    when a key has `max_queue_size` callbacks waiting `submit` either waits for
+    a free slot (`Overflow.BLOCK`), which pushes back on the caller, or discards
+    the oldest waiting callback (`Overflow.DROP_OLDEST`), counted per key in `dropped_by_key`.
+    `max_queue_size=1` with `Overflow.DROP_OLDEST` conflates a key to its latest callback.
+    callback errors are passed to `error_callback` or logged, and with `raise_errors`
+    the first one is re-raised by the next `submit` as the cause of `CallbackError`.
+    on a clean close `shutdown` waits up to `drain_timeout` seconds for submitted callbacks
+    before cancelling the rest, `close` cancels them right away
+    """
+    __slots__ = ('max_queue_size', 'overflow', 'error_callback', 'raise_errors', 'drain_timeout', 'semaphore', 'lanes',
+                 'error', 'submitted', 'completed', 'dropped', 'failed', 'cancelled', 'dropped_by_key',)
+
+    max_queue_size: int
+    overflow: Overflow
+    error_callback: Optional[ErrorCallback]
+    raise_errors: bool
+    drain_timeout: Optional[float]
+    semaphore: asyncio.Semaphore
+    lanes: Dict[Hashable, _Lane]
+    error: Optional[BaseException]
+    submitted: int
+    completed: int
+    dropped: int
+    failed: int
+    cancelled: int
+    dropped_by_key: Dict[Hashable, int]
+
+    def __init__(self, *, max_concurrency: int = 64, max_queue_size: int = 1024, overflow: Overflow = Overflow.BLOCK,
+                 error_callback: Optional[ErrorCallback] = None, raise_errors: bool = False,
+                 drain_timeout: Optional[float] = 10.) -> None:
+        assert max_concurrency > 0 and max_queue_size > 0
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.error_callback = error_callback
+        self.raise_errors = raise_errors
+        self.drain_timeout = drain_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.lanes = {}
+        self.error = None
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.dropped_by_key = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(lane.queue) for lane in self.lanes.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'queued': self.queue_depth,
+        }
+
+    async def submit(self, key: Hashable, func: Callable[..., Awaitable[None]], *args: Any,
+                     overflow: Optional[Overflow] = None, max_queue_size: Optional[int] = None) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise CallbackError(f'callback failed: {error!r}') from error
+        if overflow is None:
+            overflow = self.overflow
+        if max_queue_size is None:
+            max_queue_size = self.max_queue_size
+
+        while True:
+            lane = self.lanes.get(key)
+            if lane is None:
+                lane = self.lanes[key] = _Lane()
+            if len(lane.queue) < max_queue_size:
+                break
+            if overflow is Overflow.DROP_OLDEST:
+                dropped = len(lane.queue) - max_queue_size + 1
+                for _ in range(dropped):
+                    lane.queue.popleft()
+                self.dropped += dropped
+                self.dropped_by_key[key] = self.dropped_by_key.get(key, 0) + dropped
+                break
+            lane.not_full.clear()
+            # the lane may be finished and replaced while waiting, so look it up again
+            await lane.not_full.wait()
+
+        lane.queue.append((func, args))
+        self.submitted += 1
+        if lane.worker is None:
+            lane.worker = asyncio.ensure_future(self._run_lane(key, lane))
+
+    async def _run_lane(self, key: Hashable, lane: _Lane) -> None:
+        try:
+            while lane.queue:
+                func, args = lane.queue.popleft()
+                lane.not_full.set()
+                async with self.semaphore:
+                    try:
+                        await func(*args)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as exc:
+                        self.failed += 1
+                        self._handle_error(exc)
+                    else:
+                        self.completed += 1
+        finally:
+            if self.lanes.get(key) is lane:
+                del self.lanes[key]
+            lane.not_full.set()
+
+    def _handle_error(self, exc: BaseException) -> None:
+        if self.error_callback is not None:
+            self.error_callback(exc)
+        else:
+            logger.error('callback failed', exc_info=exc)
+        if self.raise_errors and self.error is None:
+            self.error = exc
+
+    @property
+    def pending(self) -> int:
+        """
+        callbacks that are waiting or running
+        """
+        return sum(len(lane.queue) + 1 for lane in self.lanes.values())
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        wait until every submitted callback has finished or `timeout` expires,
+        returns whether they all finished
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self.lanes:
+            remaining = None if deadline is None else max(deadline - loop.time(), 0.)
+            _, running = await asyncio.wait([lane.worker for lane in list(self.lanes.values())], timeout=remaining)
+            if running:
+                return False
+        return True
+
+    async def close(self) -> None:
+        """
+        cancel running and waiting callbacks, the dispatcher can be used again afterwards
+        """
+        cancelled = self.pending
+        if cancelled:
+            logger.warning('cancelling %i pending callbacks', cancelled)
+            self.cancelled += cancelled
+        workers = [lane.worker for lane in self.lanes.values()]
+        for lane in self.lanes.values():
+            lane.queue.clear()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        wait up to `timeout`, by default `drain_timeout`, for submitted callbacks and cancel the rest
+        """
+        if timeout is None:
+            timeout = self.drain_timeout
+        try:
+            await self.join(timeout)
+        finally:
+            await self.close()
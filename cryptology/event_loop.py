@@ -0,0 +1,67 @@
+import asyncio
+
+from typing import Awaitable, Callable, Dict, Optional, Set, TypeVar
+
+__all__ = ('available_event_loops', 'new_event_loop', 'run',)
+
+T = TypeVar('T')
+
+EVENT_LOOPS: Dict[str, Callable[[], asyncio.AbstractEventLoop]] = {'asyncio': asyncio.new_event_loop}
+
+try:
+    import uvloop
+except ImportError:
+    pass
+else:
+    EVENT_LOOPS['uvloop'] = uvloop.new_event_loop
+
+PREFERENCE = ('uvloop', 'asyncio',)
+
+
+def available_event_loops() -> Dict[str, Callable[[], asyncio.AbstractEventLoop]]:
+    return dict(EVENT_LOOPS)
+
+
+def new_event_loop(name: Optional[str] = None) -> asyncio.AbstractEventLoop:
+    """
+    creates a loop of the fastest installed implementation unless `name` is given
+    """
+    if name is None:
+        name = next(x for x in PREFERENCE if x in EVENT_LOOPS)
+    try:
+        factory = EVENT_LOOPS[name]
+    except KeyError:
+        raise ValueError(f'event loop {name!r} is not available') from None
+    return factory()
+
+
+def _all_tasks(loop: asyncio.AbstractEventLoop) -> Set[asyncio.Task]:
+    if hasattr(asyncio, 'all_tasks'):
+        return asyncio.all_tasks(loop)
+    # python 3.6 only has `Task.all_tasks`, which includes finished tasks
+    return {task for task in asyncio.Task.all_tasks(loop) if not task.done()}
+
+
+def _cancel_all_tasks(loop: asyncio.AbstractEventLoop) -> None:
+    tasks = _all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+def run(main: Awaitable[T], *, event_loop: Optional[str] = None) -> T:
+    """
+    runs `main` in a new loop of `new_event_loop(event_loop)` like `asyncio.run`,
+    tasks still running when it returns are cancelled
+    """
+    loop = new_event_loop(event_loop)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            _cancel_all_tasks(loop)
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
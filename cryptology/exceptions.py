@@ -39,6 +39,10 @@ class TradesDisabledError(CryptologyError):
     pass
 
 
+class CallbackError(CryptologyError):
+    pass
+
+
 class UnsupportedMessage(CryptologyProtocolError):
     msg: aiohttp.WSMessage
 
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+__all__ = ('OutgoingJournal', 'SessionState',)
+
+
+class OutgoingJournal:
+    """
+    signed messages the server hasn't confirmed yet, by sequence id
+
+    the server reports the last sequence it has seen on every handshake,
+    everything after it is sent again on reconnect
+    """
+    __slots__ = ('max_size', 'messages',)
+
+    max_size: int
+    messages: 'OrderedDict[int, dict]'
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self.messages = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def record(self, sequence_id: int, payload: dict) -> None:
+        self.messages[sequence_id] = payload
+        if len(self.messages) > self.max_size:
+            self.messages.popitem(last=False)
+
+    def acknowledge(self, last_seen_sequence: int) -> None:
+        messages = self.messages
+        while messages:
+            sequence_id = next(iter(messages))
+            if sequence_id > last_seen_sequence:
+                break
+            del messages[sequence_id]
+
+    def pending(self) -> List[Tuple[int, dict]]:
+        return list(self.messages.items())
+
+    @property
+    def last_sequence_id(self) -> Optional[int]:
+        return next(reversed(self.messages)) if self.messages else None
+
+
+class SessionState:
+    """
+    what `run_client` has to remember between connections to resume where it stopped
+
+    `last_outbox_id` only moves past an outbox message once it's `handled`,
+    messages still waiting for their callback are received again after a reconnect
+    """
+    __slots__ = ('last_outbox_id', 'journal', 'connections', 'unhandled',)
+
+    last_outbox_id: int
+    journal: OutgoingJournal
+    connections: int
+    unhandled: 'OrderedDict[int, bool]'
+
+    def __init__(self, last_outbox_id: int = 0, journal: Optional[OutgoingJournal] = None) -> None:
+        self.last_outbox_id = last_outbox_id
+        self.journal = journal if journal is not None else OutgoingJournal()
+        self.connections = 0
+        self.unhandled = OrderedDict()
+
+    def received(self, outbox_id: int) -> None:
+        self.unhandled[outbox_id] = False
+
+    def handled(self, outbox_id: int) -> None:
+        """
+        marks a message done, ids that weren't `received` are done in the order they arrive
+        """
+        unhandled = self.unhandled
+        unhandled[outbox_id] = True
+        while unhandled:
+            first_id, done = next(iter(unhandled.items()))
+            if not done:
+                break
+            del unhandled[first_id]
+            self.last_outbox_id = first_id
+
+    def reset(self) -> None:
+        """
+        forgets the messages of a closed connection, they'll be received again
+        """
+        self.unhandled.clear()
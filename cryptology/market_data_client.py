@@ -1,15 +1,20 @@
 import aiohttp
 import asyncio
-import json
 import logging
-import xdrlib
+import time
 
-from cryptology import exceptions, common
+from cryptology import codec, exceptions, common, serialization
+from cryptology.decode_pool import DecodePool
+from cryptology.dispatch import CallbackDispatcher, Overflow
+from cryptology.messages import MessageDecoder, Subscription
+from cryptology.metrics import PipelineMetrics, timed_call
+from cryptology.order_book import OrderBooks
+from cryptology.recording import Recorder
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional, Callable, Awaitable, List
+from typing import Any, Optional, AsyncIterator, Callable, Awaitable, Container, Hashable, Iterable, List
 
-__all__ = ('run',)
+__all__ = ('run', 'receive_broadcasts', 'receive_decoded_broadcasts',)
 
 logger = logging.getLogger(__name__)
 
@@ -28,45 +33,215 @@ OrderBookCallback = Callable[[int, str, dict, dict], Awaitable[None]]
 TradesCallback = Callable[[datetime, int, str, Decimal, Decimal], Awaitable[None]]
 TradesStateChangedCallback = Callable[[List[str], bool], Awaitable[None]]
 
+TRADES_STATE_TYPES = ('TradesDisabledOnPairs', 'TradesEnabledOnPairs',)
+
+
+async def receive_broadcasts(ws: aiohttp.ClientWebSocketResponse,
+                             serializer: Optional[serialization.Serializer] = None,
+                             subscription: Optional[Subscription] = None,
+                             decoder: Optional[MessageDecoder] = None,
+                             required: Container[str] = (),
+                             metrics: Optional[PipelineMetrics] = None,
+                             recorder: Optional[Recorder] = None) -> AsyncIterator[dict]:
+    """
+    decoded broadcast payloads, skipping the ones `subscription` or `decoder` don't accept,
+    broadcasts have no timestamp, so `metrics` gets no exchange latency.
+    `recorder` gets every frame as it was received
+    """
+    if serializer is None:
+        serializer = serialization.get_serializer()
 
-async def reader_loop(
-        ws: aiohttp.ClientWebSocketResponse,
-        market_data_callback: MarketDataCallback,
-        order_book_callback: OrderBookCallback,
-        trades_callback: TradesCallback,
-        trades_state_changed_callback: TradesStateChangedCallback) -> None:
     msg = await receive_msg(ws, timeout=3)
-    xdr = xdrlib.Unpacker(msg)
-    version = xdr.unpack_uint()
+    if recorder is not None:
+        recorder.write(msg)
+    version = codec.decode_uint(msg)
     logger.info(f'broadcast connection version {version} established')
     while True:
+        if metrics is not None:
+            started = time.perf_counter()
         msg = await receive_msg(ws)
+        if metrics is not None:
+            received = time.perf_counter()
+            metrics.record('receive', received - started)
+        if recorder is not None:
+            recorder.write(msg)
 
         try:
-            xdr = xdrlib.Unpacker(msg)
-            message_type: common.ServerMessageType = common.ServerMessageType.by_value(xdr.unpack_enum())
+            frame = memoryview(msg)
+            message_type: common.ServerMessageType = \
+                common.ServerMessageType.by_value(codec.decode_message_type(frame))
             if message_type != common.ServerMessageType.BROADCAST_MESSAGE:
                 raise exceptions.UnsupportedMessageType()
-            payload = json.loads(xdr.unpack_string().decode())
-            if market_data_callback is not None:
+            data = codec.decode_broadcast_message(frame)
+            if metrics is not None:
+                unpacked = time.perf_counter()
+                metrics.record('unpack', unpacked - received)
+            if subscription is not None and not subscription.accepts(data):
+                continue
+            if decoder is not None:
+                payload = decoder.decode(data, serializer.loads, required)
+                if payload is None:
+                    continue
+            else:
+                payload = serializer.loads(data)
+            if metrics is not None:
+                metrics.record('decode', time.perf_counter() - unpacked)
+        except (KeyError, ValueError, EOFError, exceptions.UnsupportedMessageType):
+            logger.exception('failed to decode data')
+            raise exceptions.CryptologyError('failed to decode data')
+        yield payload
+
+
+async def receive_decoded_broadcasts(ws: aiohttp.ClientWebSocketResponse, pool: DecodePool,
+                                     serializer: Optional[serialization.Serializer] = None,
+                                     subscription: Optional[Subscription] = None,
+                                     decoder: Optional[MessageDecoder] = None,
+                                     required: Container[str] = (),
+                                     metrics: Optional[PipelineMetrics] = None,
+                                     recorder: Optional[Recorder] = None) -> AsyncIterator[dict]:
+    """
+    `receive_broadcasts` with the frames decoded by the workers of `pool`, in the order they arrived
+
+    the socket is read while earlier batches are decoded, `metrics` only gets the receive time
+    """
+    if serializer is None:
+        serializer = serialization.get_serializer()
+    assert serializer.name in serialization.available_serializers(), 'workers need a registered json backend'
+    required = frozenset(required)
+
+    msg = await receive_msg(ws, timeout=3)
+    if recorder is not None:
+        recorder.write(msg)
+    version = codec.decode_uint(msg)
+    logger.info(f'broadcast connection version {version} established')
+
+    frames: asyncio.Queue = asyncio.Queue(pool.batch_size * pool.max_pending)
+    batches: asyncio.Queue = asyncio.Queue(pool.max_pending)
+
+    async def receive() -> None:
+        try:
+            while True:
+                if metrics is not None:
+                    started = time.perf_counter()
+                msg = await receive_msg(ws)
+                if metrics is not None:
+                    metrics.record('receive', time.perf_counter() - started)
+                if recorder is not None:
+                    recorder.write(msg)
+                await frames.put(msg)
+        except Exception as exc:
+            await frames.put(exc)
+
+    async def submit() -> None:
+        while True:
+            batch = [await frames.get()]
+            while len(batch) < pool.batch_size and not frames.empty() and not isinstance(batch[-1], Exception):
+                batch.append(frames.get_nowait())
+            error = batch.pop() if isinstance(batch[-1], Exception) else None
+            if batch:
+                await batches.put(pool.submit(batch, serializer, subscription, decoder, required))
+            if error is not None:
+                await batches.put(error)
+                return
+
+    tasks = [asyncio.ensure_future(receive()), asyncio.ensure_future(submit())]
+    try:
+        while True:
+            item = await batches.get()
+            if isinstance(item, Exception):
+                raise item
+            payloads, filtered, skipped = await item
+            if subscription is not None:
+                subscription.skipped += filtered
+            if decoder is not None:
+                decoder.skipped += skipped
+                decoder.decoded += len(payloads) - filtered - skipped
+            for payload in payloads:
+                if payload is not None:
+                    yield payload
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def reader_loop(
+        ws: aiohttp.ClientWebSocketResponse,
+        market_data_callback: MarketDataCallback,
+        order_book_callback: OrderBookCallback,
+        trades_callback: TradesCallback,
+        trades_state_changed_callback: TradesStateChangedCallback,
+        serializer: Optional[serialization.Serializer] = None,
+        order_books: Optional[OrderBooks] = None,
+        dispatcher: Optional[CallbackDispatcher] = None,
+        decoder: Optional[MessageDecoder] = None,
+        subscription: Optional[Subscription] = None,
+        conflate: bool = False,
+        metrics: Optional[PipelineMetrics] = None,
+        recorder: Optional[Recorder] = None,
+        decode_pool: Optional[DecodePool] = None) -> None:
+    """
+    with `conflate` a slow `order_book_callback` only gets the latest snapshot of each trade pair,
+    the skipped ones are counted in `dispatcher.dropped_by_key[(trade_pair, 'OrderBookAgg')]`
+    and in `metrics.conflated`.
+    with `decoder` only payloads of its types reach `market_data_callback`, as typed messages,
+    other payloads are decoded only if another callback needs them.
+    payloads `subscription` doesn't accept are dropped before they are decoded.
+    `metrics` collects the time spent in each stage of receiving a message,
+    `recorder` writes the received frames to a file for `replay.replay_market_data`.
+    with `decode_pool` the frames are decoded in its worker processes
+    """
+    if dispatcher is None:
+        dispatcher = CallbackDispatcher()
+
+    async def submit(key: Hashable, func: Callable[..., Awaitable[None]], *args: Any, **kwargs: Any) -> None:
+        if metrics is None:
+            await dispatcher.submit(key, func, *args, **kwargs)
+        else:
+            dropped = dispatcher.dropped_by_key.get(key, 0)
+            await dispatcher.submit(key, timed_call, metrics, time.perf_counter(), func, *args, **kwargs)
+            if dispatcher.dropped_by_key.get(key, 0) > dropped:
+                metrics.record_conflated(key, dispatcher.dropped_by_key[key] - dropped)
+
+    required = set(TRADES_STATE_TYPES)
+    if order_book_callback is not None or order_books is not None:
+        required.add('OrderBookAgg')
+    if trades_callback is not None:
+        required.add('AnonymousTrade')
+    order_book_queue_size = 1 if conflate else None
+
+    if decode_pool is None:
+        payloads = receive_broadcasts(ws, serializer, subscription, decoder, required, metrics, recorder)
+    else:
+        payloads = receive_decoded_broadcasts(ws, decode_pool, serializer, subscription, decoder, required, metrics,
+                                              recorder)
+    async for payload in payloads:
+        try:
+            if market_data_callback is not None and (decoder is None or decoder.accepts(payload['@type'])):
                 await market_data_callback(payload)
             if payload['@type'] == 'OrderBookAgg':
-                if order_book_callback is not None:
-                    asyncio.ensure_future(order_book_callback(
-                        payload['current_order_id'],
-                        payload['trade_pair'],
-                        payload.get('buy_levels', dict),
-                        payload.get('sell_levels', dict)
-                    ))
+                current_order_id = payload['current_order_id']
+                trade_pair = payload['trade_pair']
+                buy_levels = payload.get('buy_levels', {})
+                sell_levels = payload.get('sell_levels', {})
+                if order_books is not None and \
+                        order_books.apply(current_order_id, trade_pair, buy_levels, sell_levels) is None:
+                    logger.debug('skipped stale %s order book @%i', trade_pair, current_order_id)
+                elif order_book_callback is not None:
+                    await submit((trade_pair, 'OrderBookAgg'), order_book_callback,
+                                 current_order_id, trade_pair, buy_levels, sell_levels,
+                                 overflow=Overflow.DROP_OLDEST, max_queue_size=order_book_queue_size)
             elif payload['@type'] == 'AnonymousTrade':
                 if trades_callback is not None:
-                    asyncio.ensure_future(trades_callback(
+                    await submit(
+                        (payload['trade_pair'], 'AnonymousTrade'),
+                        trades_callback,
                         datetime.utcfromtimestamp(payload['time'][0]),
                         payload['current_order_id'],
                         payload['trade_pair'],
                         Decimal(payload['amount']),
                         Decimal(payload['price'])
-                    ))
+                    )
             elif payload['@type'] == 'TradesDisabledOnPairs':
                 if trades_state_changed_callback:
                     await trades_state_changed_callback(payload['trade_pairs'], False)
@@ -83,7 +258,7 @@ async def reader_loop(
                                    ' is not seted'.format(' '.join(payload['trade_pairs'])))
             else:
                 raise exceptions.UnsupportedMessageType()
-        except (KeyError, ValueError, exceptions.UnsupportedMessageType):
+        except (KeyError, ValueError, EOFError, exceptions.UnsupportedMessageType):
             logger.exception('failed to decode data')
             raise exceptions.CryptologyError('failed to decode data')
 
@@ -92,8 +267,35 @@ async def run(*, ws_addr: str, market_data_callback: MarketDataCallback = None,
               order_book_callback: OrderBookCallback = None,
               trades_callback: TradesCallback = None,
               trades_state_changed_callback: TradesStateChangedCallback = None,
-              loop: Optional[asyncio.AbstractEventLoop] = Awaitable[None]) -> None:
-    async with aiohttp.ClientSession(loop=loop) as session:
+              serializer: Optional[serialization.Serializer] = None,
+              order_books: Optional[OrderBooks] = None,
+              dispatcher: Optional[CallbackDispatcher] = None,
+              decoder: Optional[MessageDecoder] = None,
+              trade_pairs: Optional[Iterable[str]] = None,
+              message_types: Optional[Iterable[str]] = None,
+              conflate: bool = False,
+              metrics: Optional[PipelineMetrics] = None,
+              recorder: Optional[Recorder] = None,
+              decode_pool: Optional[DecodePool] = None) -> None:
+    """
+    with `trade_pairs` or `message_types` other messages are dropped before they are decoded,
+    trading state changes are always delivered.
+    with `conflate` a slow `order_book_callback` only gets the latest snapshot of each trade pair,
+    the skipped ones are counted in `metrics.conflated` and `dispatcher.dropped_by_key`.
+    `metrics` collects the time spent in each stage of receiving a message,
+    `recorder` writes the received frames to a file for `replay.replay_market_data`.
+    with `decode_pool` the frames are decoded in its worker processes
+    """
+    subscription = None
+    if trade_pairs is not None or message_types is not None:
+        subscription = Subscription(trade_pairs, message_types, TRADES_STATE_TYPES)
+    async with aiohttp.ClientSession() as session:
         async with session.ws_connect(ws_addr, receive_timeout=6, heartbeat=3) as ws:
-            await reader_loop(ws, market_data_callback, order_book_callback, trades_callback,
-                              trades_state_changed_callback)
+            if dispatcher is None:
+                dispatcher = CallbackDispatcher()
+            try:
+                await reader_loop(ws, market_data_callback, order_book_callback, trades_callback,
+                                  trades_state_changed_callback, serializer, order_books, dispatcher, decoder,
+                                  subscription, conflate, metrics, recorder, decode_pool)
+            finally:
+                await dispatcher.close()
@@ -0,0 +1,320 @@
+import re
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, ClassVar, Container, Dict, FrozenSet, Iterable, Optional, Type, Union
+
+__all__ = (
+    'Message', 'OrderPlaced', 'BuyOrderPlaced', 'SellOrderPlaced', 'OrderAmountChanged', 'BuyOrderAmountChanged',
+    'SellOrderAmountChanged', 'OrderCancelled', 'BuyOrderCancelled', 'SellOrderCancelled', 'OrderClosed',
+    'BuyOrderClosed', 'SellOrderClosed', 'OrderNotFound', 'SetBalance', 'InsufficientFunds', 'OwnTrade',
+    'OrderBookAgg', 'AnonymousTrade', 'MESSAGE_TYPES', 'classify', 'find_trade_pair', 'MessageDecoder',
+    'Subscription',
+)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+TYPE_RE = re.compile(rb'"@type"\s*:\s*"([^"]*)"')
+TRADE_PAIR_RE = re.compile(rb'"trade_pair"\s*:\s*"([^"]*)"')
+
+
+def to_datetime(time: list) -> datetime:
+    """
+    `time` is a pair of UTC seconds and microseconds
+    """
+    return datetime.utcfromtimestamp(time[0] + time[1] / 1000000)
+
+
+class Field:
+    """
+    reads `key` from the payload and converts it on every access, missing keys read as `None`
+    """
+    __slots__ = ('key', 'convert',)
+
+    key: str
+    convert: Optional[Callable[[Any], Any]]
+
+    def __init__(self, key: str, convert: Optional[Callable[[Any], Any]] = None) -> None:
+        self.key = key
+        self.convert = convert
+
+    def __get__(self, instance: Optional['Message'], owner: type) -> Any:
+        if instance is None:
+            return self
+        value = instance.payload.get(self.key)
+        if value is None or self.convert is None:
+            return value
+        return self.convert(value)
+
+
+class Message:
+    """
+    a decoded payload, typed subclasses expose the documented fields as attributes
+    and convert amounts to `Decimal` when they are read
+
+    item access goes to the payload, so code written for dicts keeps working
+    """
+    __slots__ = ('payload',)
+
+    TYPE: ClassVar[Optional[str]] = None
+
+    payload: dict
+
+    def __init__(self, payload: dict) -> None:
+        self.payload = payload
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} {self.payload!r}>'
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Message):
+            return self.payload == other.payload
+        return self.payload == other
+
+    def __getitem__(self, key: str) -> Any:
+        return self.payload[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.payload
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.payload.get(key, default)
+
+    @property
+    def type(self) -> str:
+        return self.payload['@type']
+
+
+class OrderPlaced(Message):
+    __slots__ = ()
+
+    order_id = Field('order_id')
+    client_order_id = Field('client_order_id')
+    trade_pair = Field('trade_pair')
+    amount = Field('amount', Decimal)
+    initial_amount = Field('initial_amount', Decimal)
+    price = Field('price', Decimal)
+    closed_inline = Field('closed_inline')
+    time = Field('time', to_datetime)
+
+
+class BuyOrderPlaced(OrderPlaced):
+    __slots__ = ()
+    TYPE = 'BuyOrderPlaced'
+
+
+class SellOrderPlaced(OrderPlaced):
+    __slots__ = ()
+    TYPE = 'SellOrderPlaced'
+
+
+class OrderAmountChanged(Message):
+    __slots__ = ()
+
+    order_id = Field('order_id')
+    client_order_id = Field('client_order_id')
+    trade_pair = Field('trade_pair')
+    amount = Field('amount', Decimal)
+    fee = Field('fee', Decimal)
+    time = Field('time', to_datetime)
+
+
+class BuyOrderAmountChanged(OrderAmountChanged):
+    __slots__ = ()
+    TYPE = 'BuyOrderAmountChanged'
+
+
+class SellOrderAmountChanged(OrderAmountChanged):
+    __slots__ = ()
+    TYPE = 'SellOrderAmountChanged'
+
+
+class OrderCancelled(Message):
+    __slots__ = ()
+
+    order_id = Field('order_id')
+    client_order_id = Field('client_order_id')
+    trade_pair = Field('trade_pair')
+    time = Field('time', to_datetime)
+
+
+class BuyOrderCancelled(OrderCancelled):
+    __slots__ = ()
+    TYPE = 'BuyOrderCancelled'
+
+
+class SellOrderCancelled(OrderCancelled):
+    __slots__ = ()
+    TYPE = 'SellOrderCancelled'
+
+
+class OrderClosed(Message):
+    __slots__ = ()
+
+    order_id = Field('order_id')
+    client_order_id = Field('client_order_id')
+    trade_pair = Field('trade_pair')
+    time = Field('time', to_datetime)
+
+
+class BuyOrderClosed(OrderClosed):
+    __slots__ = ()
+    TYPE = 'BuyOrderClosed'
+
+
+class SellOrderClosed(OrderClosed):
+    __slots__ = ()
+    TYPE = 'SellOrderClosed'
+
+
+class OrderNotFound(Message):
+    __slots__ = ()
+    TYPE = 'OrderNotFound'
+
+    order_id = Field('order_id')
+
+
+class SetBalance(Message):
+    __slots__ = ()
+    TYPE = 'SetBalance'
+
+    currency = Field('currency')
+    balance = Field('balance', Decimal)
+    change = Field('change', Decimal)
+    reason = Field('reason')
+    time = Field('time', to_datetime)
+
+
+class InsufficientFunds(Message):
+    __slots__ = ()
+    TYPE = 'InsufficientFunds'
+
+    order_id = Field('order_id')
+    currency = Field('currency')
+
+
+class OwnTrade(Message):
+    __slots__ = ()
+    TYPE = 'OwnTrade'
+
+    order_id = Field('order_id')
+    client_order_id = Field('client_order_id')
+    trade_pair = Field('trade_pair')
+    amount = Field('amount', Decimal)
+    price = Field('price', Decimal)
+    maker = Field('maker')
+    maker_buy = Field('maker_buy')
+    time = Field('time', to_datetime)
+
+
+class OrderBookAgg(Message):
+    __slots__ = ()
+    TYPE = 'OrderBookAgg'
+
+    trade_pair = Field('trade_pair')
+    current_order_id = Field('current_order_id')
+    buy_levels = Field('buy_levels')
+    sell_levels = Field('sell_levels')
+
+
+class AnonymousTrade(Message):
+    __slots__ = ()
+    TYPE = 'AnonymousTrade'
+
+    trade_pair = Field('trade_pair')
+    current_order_id = Field('current_order_id')
+    amount = Field('amount', Decimal)
+    price = Field('price', Decimal)
+    maker_buy = Field('maker_buy')
+    time = Field('time', to_datetime)
+
+
+MESSAGE_TYPES: Dict[str, Type[Message]] = {
+    cls.TYPE: cls for cls in (
+        BuyOrderPlaced, SellOrderPlaced, BuyOrderAmountChanged, SellOrderAmountChanged, BuyOrderCancelled,
+        SellOrderCancelled, BuyOrderClosed, SellOrderClosed, OrderNotFound, SetBalance, InsufficientFunds, OwnTrade,
+        OrderBookAgg, AnonymousTrade,
+    )
+}
+
+
+def classify(data: Buffer) -> Optional[str]:
+    """
+    the first `@type` of an encoded payload, found without decoding it
+    """
+    match = TYPE_RE.search(data)
+    return str(match.group(1), 'utf-8') if match is not None else None
+
+
+def find_trade_pair(data: Buffer) -> Optional[str]:
+    """
+    the first `trade_pair` of an encoded payload, found without decoding it
+    """
+    match = TRADE_PAIR_RE.search(data)
+    return str(match.group(1), 'utf-8') if match is not None else None
+
+
+class Subscription:
+    """
+    filters encoded payloads by `@type` and `trade_pair` before they are decoded
+
+    `None` accepts everything, payloads without a trade pair pass the pair filter
+    and `always` types pass the type filter
+    """
+    __slots__ = ('trade_pairs', 'types', 'always', 'skipped',)
+
+    trade_pairs: Optional[FrozenSet[str]]
+    types: Optional[FrozenSet[str]]
+    always: FrozenSet[str]
+    skipped: int
+
+    def __init__(self, trade_pairs: Optional[Iterable[str]] = None, types: Optional[Iterable[str]] = None,
+                 always: Iterable[str] = ()) -> None:
+        self.trade_pairs = frozenset(trade_pairs) if trade_pairs is not None else None
+        self.types = frozenset(types) if types is not None else None
+        self.always = frozenset(always)
+        self.skipped = 0
+
+    def accepts(self, data: Buffer) -> bool:
+        if self.types is not None:
+            message_type = classify(data)
+            if message_type not in self.types and message_type not in self.always:
+                self.skipped += 1
+                return False
+        if self.trade_pairs is not None:
+            trade_pair = find_trade_pair(data)
+            if trade_pair is not None and trade_pair not in self.trade_pairs:
+                self.skipped += 1
+                return False
+        return True
+
+
+class MessageDecoder:
+    """
+    decodes only payloads of the subscribed `types` (all when `None`) into typed messages,
+    `decode` returns `None` for the other payloads
+    """
+    __slots__ = ('types', 'decoded', 'skipped',)
+
+    types: Optional[FrozenSet[str]]
+    decoded: int
+    skipped: int
+
+    def __init__(self, types: Optional[Iterable[str]] = None) -> None:
+        self.types = frozenset(types) if types is not None else None
+        self.decoded = 0
+        self.skipped = 0
+
+    def accepts(self, message_type: Optional[str]) -> bool:
+        return self.types is None or message_type in self.types
+
+    def decode(self, data: Buffer, loads: Callable[[Buffer], Any], required: Container[str] = ()) -> Optional[Message]:
+        """
+        payloads of `required` types are decoded even if they aren't subscribed
+        """
+        message_type = classify(data)
+        if not self.accepts(message_type) and message_type not in required:
+            self.skipped += 1
+            return None
+        self.decoded += 1
+        return MESSAGE_TYPES.get(message_type, Message)(loads(data))
@@ -0,0 +1,323 @@
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, ClassVar, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple, Union
+
+__all__ = ('Histogram', 'PipelineMetrics', 'RoundTripTracker', 'timed_call',)
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# nanoseconds up to 2 ** 40, about 18 minutes, larger values go to the last bucket
+BUCKETS = (40 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+QUANTILES = (.5, .9, .99, .999)
+
+
+def bucket_index(nanoseconds: int) -> int:
+    if nanoseconds < 2 * SUB_BUCKETS:
+        return max(nanoseconds, 0)
+    shift = nanoseconds.bit_length() - SUB_BUCKET_BITS - 1
+    return min((shift + 1) * SUB_BUCKETS + (nanoseconds >> shift) - SUB_BUCKETS, BUCKETS - 1)
+
+
+def bucket_value(index: int) -> int:
+    """
+    the lowest value in nanoseconds that falls into bucket `index`
+    """
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+
+
+class Histogram:
+    """
+    log-linear histogram of durations in the spirit of HdrHistogram
+
+    values are counted in buckets with a relative error of at most 1/16,
+    recording is an index computation and a list increment
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max',)
+
+    counts: List[int]
+    count: int
+    total: float
+    min: float
+    max: float
+
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKETS
+        self.reset()
+
+    def reset(self) -> None:
+        for index in range(BUCKETS):
+            self.counts[index] = 0
+        self.count = 0
+        self.total = 0.
+        self.min = float('inf')
+        self.max = 0.
+
+    def merge(self, other: 'Histogram') -> None:
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def record(self, seconds: float) -> None:
+        self.counts[bucket_index(int(seconds * 1e9))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, quantile: float) -> float:
+        """
+        an upper estimate in seconds of the value below which `quantile` of the values fall
+        """
+        if not self.count:
+            return 0.
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bucket_value(index + 1) / 1e9, self.max)
+        return self.max
+
+    def to_dict(self, quantiles: Iterable[float] = QUANTILES) -> Dict[str, float]:
+        result = {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.,
+            'min': self.min if self.count else 0.,
+            'max': self.max,
+        }
+        for quantile in quantiles:
+            result[f'p{quantile * 100:g}'] = self.percentile(quantile)
+        return result
+
+
+def summary_lines(name: str, labels: Dict[str, str], histogram: Histogram) -> List[str]:
+    labels = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    lines = [f'{name}{{{labels},quantile="{quantile:g}"}} {histogram.percentile(quantile):.9f}'
+             for quantile in QUANTILES]
+    lines.append(f'{name}_sum{{{labels}}} {histogram.total:.9f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+class PipelineMetrics:
+    """
+    timing histograms of the stages between a frame arriving and its callback running
+
+    - `receive`: waiting for and reading the next frame, includes idle time
+    - `decrypt`: `Cipher.decrypt`
+    - `unpack`: the frame header
+    - `decode`: json decoding of the payload
+    - `dispatch`: from handing the message to the dispatcher to the callback starting
+    - `callback`: the callback itself
+    - `exchange`: from the outbox message timestamp to the message being decoded,
+      this includes the clock difference to the exchange
+
+    `conflated` counts the callbacks conflation skipped by dispatcher key, like `(trade_pair, 'OrderBookAgg')`.
+    instrumented code checks for `None` once per message, so there is no cost without metrics
+    """
+    __slots__ = ('stages', 'conflated',)
+
+    STAGES = ('receive', 'decrypt', 'unpack', 'decode', 'dispatch', 'callback', 'exchange',)
+
+    stages: Dict[str, Histogram]
+    conflated: Dict[Hashable, int]
+
+    def __init__(self) -> None:
+        self.stages = {stage: Histogram() for stage in self.STAGES}
+        self.conflated = {}
+
+    def __getitem__(self, stage: str) -> Histogram:
+        return self.stages[stage]
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage].record(seconds)
+
+    def record_exchange_latency(self, timestamp: float) -> None:
+        self.stages['exchange'].record(max(time.time() - timestamp, 0.))
+
+    def record_conflated(self, key: Hashable, count: int) -> None:
+        self.conflated[key] = self.conflated.get(key, 0) + count
+
+    def reset(self) -> None:
+        for histogram in self.stages.values():
+            histogram.reset()
+        self.conflated.clear()
+
+    def to_dict(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        return {stage: histogram.to_dict() for stage, histogram in self.stages.items()}
+
+    def to_prometheus(self, name: str = 'cryptology_stage_seconds', labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        the histograms as prometheus summaries in the text exposition format
+        """
+        lines = [f'# HELP {name} time spent in a stage of the receive pipeline', f'# TYPE {name} summary']
+        for stage, histogram in self.stages.items():
+            lines.extend(summary_lines(name, dict(stage=stage, **(labels or {})), histogram))
+        return '\n'.join(lines) + '\n'
+
+
+class _Pending:
+    __slots__ = ('sent_at', 'sequence_id', 'trade_pair', 'order_type',)
+
+    sent_at: float
+    sequence_id: int
+    trade_pair: Optional[str]
+    order_type: str
+
+    def __init__(self, sent_at: float, sequence_id: int, trade_pair: Optional[str], order_type: str) -> None:
+        self.sent_at = sent_at
+        self.sequence_id = sequence_id
+        self.trade_pair = trade_pair
+        self.order_type = order_type
+
+
+class RoundTripTracker:
+    """
+    times order requests from `send_signed_message` to the first outbox message answering them
+
+    placements are matched by `client_order_id` and answered by `BuyOrderPlaced`, `SellOrderPlaced`
+    or `InsufficientFunds`, cancellations by `order_id` and answered by the `OrderCancelled` messages
+    or `OrderNotFound`. `InsufficientFunds` only has an `order_id`, the rejected order never got one
+    of the exchange, so it is taken as the `client_order_id` of the placement.
+    placements without a `client_order_id` can't be matched and aren't timed.
+    a request sent again with the same sequence id after a reconnect keeps its original send time.
+
+    requests without an answer after `timeout` seconds are dropped and counted in `expired`,
+    pending requests are kept in send order so that costs O(1) per request.
+    percentiles per trade pair and request type cover the last one to two `window`s of seconds
+    """
+    __slots__ = ('timeout', 'window', 'pending', 'expired', 'current', 'previous', 'window_started',)
+
+    RESPONSE_TYPES: ClassVar[FrozenSet[str]] = frozenset((
+        'BuyOrderPlaced', 'SellOrderPlaced', 'InsufficientFunds', 'BuyOrderCancelled', 'SellOrderCancelled',
+        'OrderNotFound',
+    ))
+
+    timeout: float
+    window: float
+    pending: 'OrderedDict[Tuple[str, int], _Pending]'
+    expired: int
+    current: Dict[Tuple[Optional[str], str], Histogram]
+    previous: Dict[Tuple[Optional[str], str], Histogram]
+    window_started: float
+
+    def __init__(self, timeout: float = 60., window: float = 60.) -> None:
+        self.timeout = timeout
+        self.window = window
+        self.pending = OrderedDict()
+        self.expired = 0
+        self.current = {}
+        self.previous = {}
+        self.window_started = time.perf_counter()
+
+    def _expire(self, now: float) -> None:
+        pending = self.pending
+        while pending:
+            key, entry = next(iter(pending.items()))
+            if now - entry.sent_at < self.timeout:
+                break
+            del pending[key]
+            self.expired += 1
+
+    def _rotate(self, now: float) -> None:
+        elapsed = now - self.window_started
+        if elapsed >= self.window:
+            self.previous = self.current if elapsed < 2 * self.window else {}
+            self.current = {}
+            self.window_started = now
+
+    def sent(self, sequence_id: int, payload: dict) -> None:
+        order_type = payload.get('@type')
+        if order_type == 'CancelOrder':
+            key = ('order_id', payload.get('order_id'))
+        elif isinstance(order_type, str) and order_type.startswith('Place') \
+                and payload.get('client_order_id') is not None:
+            key = ('client_order_id', payload['client_order_id'])
+        else:
+            return
+        now = time.perf_counter()
+        self._expire(now)
+        entry = self.pending.get(key)
+        if entry is not None and entry.sequence_id == sequence_id:
+            return
+        if entry is not None:
+            del self.pending[key]
+        self.pending[key] = _Pending(now, sequence_id, payload.get('trade_pair'), order_type)
+
+    def received(self, payload: Any) -> None:
+        """
+        `payload` is a decoded outbox payload or typed message
+        """
+        message_type = payload.get('@type')
+        if message_type not in self.RESPONSE_TYPES:
+            return
+        if message_type == 'InsufficientFunds':
+            key = ('client_order_id', payload.get('order_id'))
+        elif message_type == 'OrderNotFound' or payload.get('client_order_id') is None:
+            key = ('order_id', payload.get('order_id'))
+        else:
+            key = ('client_order_id', payload.get('client_order_id'))
+            if key not in self.pending:
+                key = ('order_id', payload.get('order_id'))
+        entry = self.pending.pop(key, None)
+        if entry is None:
+            return
+        now = time.perf_counter()
+        self._rotate(now)
+        stats_key = (entry.trade_pair or payload.get('trade_pair'), entry.order_type)
+        histogram = self.current.get(stats_key)
+        if histogram is None:
+            histogram = self.current[stats_key] = Histogram()
+        histogram.record(now - entry.sent_at)
+
+    def histograms(self) -> Dict[Tuple[Optional[str], str], Histogram]:
+        """
+        round trip times by trade pair and request type
+        """
+        self._rotate(time.perf_counter())
+        result: Dict[Tuple[Optional[str], str], Histogram] = {}
+        for window in (self.previous, self.current):
+            for key, histogram in window.items():
+                if key not in result:
+                    result[key] = Histogram()
+                result[key].merge(histogram)
+        return result
+
+    def to_dict(self) -> Dict[Optional[str], Dict[str, Dict[str, Union[int, float]]]]:
+        result: Dict[Optional[str], Dict[str, Dict[str, Union[int, float]]]] = {}
+        for (trade_pair, order_type), histogram in self.histograms().items():
+            result.setdefault(trade_pair, {})[order_type] = histogram.to_dict()
+        return result
+
+    def to_prometheus(self, name: str = 'cryptology_order_round_trip_seconds',
+                      labels: Optional[Dict[str, str]] = None) -> str:
+        lines = [f'# HELP {name} time from sending an order request to its answer in the outbox',
+                 f'# TYPE {name} summary']
+        for (trade_pair, order_type), histogram in self.histograms().items():
+            lines.extend(summary_lines(name, dict(trade_pair=trade_pair or '', order_type=order_type,
+                                                  **(labels or {})), histogram))
+        return '\n'.join(lines) + '\n'
+
+
+async def timed_call(metrics: PipelineMetrics, submitted: float, func: Callable[..., Awaitable[None]],
+                     *args: Any) -> None:
+    """
+    runs `func` recording the time since `submitted`, a `time.perf_counter()` value, and the time it takes
+    """
+    started = time.perf_counter()
+    metrics.record('dispatch', started - submitted)
+    try:
+        await func(*args)
+    finally:
+        metrics.record('callback', time.perf_counter() - started)
@@ -0,0 +1,161 @@
+import bisect
+
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+
+__all__ = ('OrderBookSide', 'OrderBook', 'OrderBooks',)
+
+Level = Tuple[Decimal, Decimal]
+
+
+class OrderBookSide:
+    """
+    price levels of one side of a book kept in a price-sorted array
+
+    `OrderBookAgg` snapshots are applied as a diff against the previous one,
+    so only changed levels are parsed and moved
+    """
+    __slots__ = ('descending', 'prices', 'amounts', 'levels',)
+
+    descending: bool
+    prices: List[Decimal]
+    amounts: Dict[Decimal, Decimal]
+    levels: Dict[str, str]
+
+    def __init__(self, descending: bool) -> None:
+        self.descending = descending
+        self.prices = []
+        self.amounts = {}
+        self.levels = {}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __iter__(self) -> Iterator[Level]:
+        return iter(self.top(len(self.prices)))
+
+    def update(self, levels: Dict[str, str]) -> None:
+        previous = self.levels
+        for raw_price in previous.keys() - levels.keys():
+            price = Decimal(raw_price)
+            del self.prices[bisect.bisect_left(self.prices, price)]
+            del self.amounts[price]
+        for raw_price, raw_amount in levels.items():
+            previous_amount = previous.get(raw_price)
+            if previous_amount == raw_amount:
+                continue
+            price = Decimal(raw_price)
+            if previous_amount is None:
+                bisect.insort(self.prices, price)
+            self.amounts[price] = Decimal(raw_amount)
+        self.levels = levels
+
+    def best(self) -> Optional[Level]:
+        if not self.prices:
+            return None
+        price = self.prices[-1] if self.descending else self.prices[0]
+        return price, self.amounts[price]
+
+    def amount_at(self, price: Decimal) -> Decimal:
+        return self.amounts.get(price, Decimal(0))
+
+    def top(self, depth: int) -> List[Level]:
+        if self.descending:
+            prices = self.prices[:-depth - 1:-1] if depth > 0 else []
+        else:
+            prices = self.prices[:depth]
+        amounts = self.amounts
+        return [(price, amounts[price]) for price in prices]
+
+    def volume_to(self, price: Decimal) -> Decimal:
+        """
+        total amount of the levels at `price` or better
+        """
+        if self.descending:
+            prices = self.prices[bisect.bisect_left(self.prices, price):]
+        else:
+            prices = self.prices[:bisect.bisect_right(self.prices, price)]
+        amounts = self.amounts
+        return sum((amounts[x] for x in prices), Decimal(0))
+
+
+class OrderBook:
+    __slots__ = ('trade_pair', 'current_order_id', 'bids', 'asks',)
+
+    trade_pair: str
+    current_order_id: Optional[int]
+    bids: OrderBookSide
+    asks: OrderBookSide
+
+    def __init__(self, trade_pair: str) -> None:
+        self.trade_pair = trade_pair
+        self.current_order_id = None
+        self.bids = OrderBookSide(descending=True)
+        self.asks = OrderBookSide(descending=False)
+
+    def __repr__(self) -> str:
+        return f'<OrderBook {self.trade_pair} @{self.current_order_id} bid {self.best_bid()} ask {self.best_ask()}>'
+
+    def apply(self, current_order_id: int, buy_levels: Dict[str, str], sell_levels: Dict[str, str]) -> bool:
+        """
+        returns `False` if the snapshot is older than the book
+        """
+        if self.current_order_id is not None and current_order_id < self.current_order_id:
+            return False
+        self.bids.update(buy_levels)
+        self.asks.update(sell_levels)
+        self.current_order_id = current_order_id
+        return True
+
+    def best_bid(self) -> Optional[Level]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[Level]:
+        return self.asks.best()
+
+    def spread(self) -> Optional[Decimal]:
+        if not self.bids or not self.asks:
+            return None
+        return self.asks.prices[0] - self.bids.prices[-1]
+
+
+class OrderBooks:
+    """
+    local order books by trade pair, can be passed to `run_market_data` as `order_books`
+    """
+    __slots__ = ('books', 'stale',)
+
+    books: Dict[str, OrderBook]
+    stale: int
+
+    def __init__(self) -> None:
+        self.books = {}
+        self.stale = 0
+
+    def __getitem__(self, trade_pair: str) -> OrderBook:
+        return self.books[trade_pair]
+
+    def __contains__(self, trade_pair: str) -> bool:
+        return trade_pair in self.books
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.books)
+
+    def __len__(self) -> int:
+        return len(self.books)
+
+    def get(self, trade_pair: str) -> Optional[OrderBook]:
+        return self.books.get(trade_pair)
+
+    def apply(self, current_order_id: int, trade_pair: str, buy_levels: Dict[str, str],
+              sell_levels: Dict[str, str]) -> Optional[OrderBook]:
+        """
+        returns `None` when the snapshot was skipped as stale
+        """
+        book = self.books.get(trade_pair)
+        if book is None:
+            book = self.books[trade_pair] = OrderBook(trade_pair)
+        if not book.apply(current_order_id, buy_levels, sell_levels):
+            self.stale += 1
+            return None
+        return book
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, FrozenSet, Iterator, List, Optional
+
+from . import exceptions
+
+if TYPE_CHECKING:
+    from .client import ClientWriterStub
+
+__all__ = ('Order', 'OrderTracker',)
+
+PLACED_TYPES = frozenset(('BuyOrderPlaced', 'SellOrderPlaced',))
+AMOUNT_CHANGED_TYPES = frozenset(('BuyOrderAmountChanged', 'SellOrderAmountChanged',))
+FINISHED_TYPES = frozenset(('BuyOrderCancelled', 'SellOrderCancelled', 'BuyOrderClosed', 'SellOrderClosed',))
+
+
+class Order:
+    """
+    an active order of the account, `amount` is the part left in the order book
+    and `filled` the amount of the `OwnTrade` messages received while it was tracked.
+    `initial_amount` is unknown for orders loaded from `UserOrdersResponse`
+    """
+    __slots__ = ('order_id', 'client_order_id', 'trade_pair', 'buy', 'price', 'amount', 'initial_amount', 'filled',)
+
+    order_id: int
+    client_order_id: Optional[int]
+    trade_pair: str
+    buy: bool
+    price: Decimal
+    amount: Decimal
+    initial_amount: Optional[Decimal]
+    filled: Decimal
+
+    def __init__(self, order_id: int, client_order_id: Optional[int], trade_pair: str, buy: bool, price: Decimal,
+                 amount: Decimal, initial_amount: Optional[Decimal] = None) -> None:
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.trade_pair = trade_pair
+        self.buy = buy
+        self.price = price
+        self.amount = amount
+        self.initial_amount = initial_amount
+        self.filled = Decimal(0)
+
+    def __repr__(self) -> str:
+        side = 'buy' if self.buy else 'sell'
+        return f'<Order {self.order_id} {side} {self.amount} {self.trade_pair} @ {self.price}>'
+
+
+class OrderTracker:
+    """
+    active orders of the account kept from the outbox, looked up by order id,
+    client order id or trade pair without asking the server
+
+    `refresh` loads the orders from `UserOrdersRequest`, `run_client` does it on every
+    connect before the writer starts. messages that arrive while the request is in flight
+    are applied again on top of the response, which is safe because placing a known order
+    is ignored, amounts only decrease and the ids of the last `history` finished orders are
+    kept so that a late message doesn't bring one back
+    """
+    __slots__ = ('history', 'orders', 'client_orders', 'trade_pairs', 'finished', 'replay',)
+
+    TYPES: ClassVar[FrozenSet[str]] = PLACED_TYPES | AMOUNT_CHANGED_TYPES | FINISHED_TYPES | {'OwnTrade'}
+
+    history: int
+    orders: Dict[int, Order]
+    client_orders: Dict[int, Order]
+    trade_pairs: Dict[str, Dict[int, Order]]
+    finished: 'OrderedDict[int, None]'
+    replay: Optional[List[Any]]
+
+    def __init__(self, history: int = 10000) -> None:
+        self.history = history
+        self.orders = {}
+        self.client_orders = {}
+        self.trade_pairs = {}
+        self.finished = OrderedDict()
+        self.replay = None
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def __iter__(self) -> Iterator[Order]:
+        return iter(list(self.orders.values()))
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self.orders
+
+    def get(self, order_id: int) -> Optional[Order]:
+        return self.orders.get(order_id)
+
+    def get_by_client_order_id(self, client_order_id: int) -> Optional[Order]:
+        return self.client_orders.get(client_order_id)
+
+    def by_trade_pair(self, trade_pair: str) -> List[Order]:
+        return list(self.trade_pairs.get(trade_pair, {}).values())
+
+    def _add(self, order: Order) -> None:
+        self.orders[order.order_id] = order
+        if order.client_order_id is not None:
+            self.client_orders[order.client_order_id] = order
+        self.trade_pairs.setdefault(order.trade_pair, {})[order.order_id] = order
+
+    def _finish(self, order_id: int) -> None:
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            if self.client_orders.get(order.client_order_id) is order:
+                del self.client_orders[order.client_order_id]
+            pair_orders = self.trade_pairs[order.trade_pair]
+            del pair_orders[order_id]
+            if not pair_orders:
+                del self.trade_pairs[order.trade_pair]
+        self.finished[order_id] = None
+        if len(self.finished) > self.history:
+            self.finished.popitem(last=False)
+
+    def _apply(self, message_type: str, payload: Any) -> None:
+        order_id = payload.get('order_id')
+        order = self.orders.get(order_id)
+        if message_type in PLACED_TYPES:
+            if order is not None or order_id in self.finished:
+                return
+            if payload.get('closed_inline'):
+                self._finish(order_id)
+                return
+            initial_amount = payload.get('initial_amount')
+            self._add(Order(order_id, payload.get('client_order_id'), payload['trade_pair'],
+                            message_type == 'BuyOrderPlaced', Decimal(payload['price']), Decimal(payload['amount']),
+                            Decimal(initial_amount) if initial_amount is not None else None))
+        elif order is None:
+            return
+        elif message_type in AMOUNT_CHANGED_TYPES:
+            order.amount = min(order.amount, Decimal(payload['amount']))
+        elif message_type == 'OwnTrade':
+            order.filled += Decimal(payload['amount'])
+        else:
+            self._finish(order_id)
+
+    def received(self, payload: Any) -> None:
+        """
+        `payload` is a decoded outbox payload or typed message
+        """
+        message_type = payload.get('@type')
+        if message_type not in self.TYPES:
+            return
+        if self.replay is not None:
+            self.replay.append(payload)
+        self._apply(message_type, payload)
+
+    def seed(self, response: Any) -> None:
+        """
+        replaces the orders with the ones of a `UserOrdersResponse`
+        """
+        if response.get('@type') != 'UserOrdersResponse':
+            raise exceptions.CryptologyError(f'unexpected response to UserOrdersRequest: {response!r}')
+        self.orders = {}
+        self.client_orders = {}
+        self.trade_pairs = {}
+        for trade_pair, book in response['order_books'].items():
+            for side in ('buy', 'sell'):
+                for item in book.get(side, ()):
+                    if item['order_id'] not in self.finished:
+                        self._add(Order(item['order_id'], item.get('client_order_id'), trade_pair, side == 'buy',
+                                        Decimal(str(item['price'])), Decimal(str(item['amount']))))
+        for payload in self.replay or ():
+            self._apply(payload['@type'], payload)
+
+    async def refresh(self, ws: 'ClientWriterStub', timeout: Optional[float] = None) -> None:
+        self.replay = []
+        try:
+            self.seed(await ws.send_signed_request(payload={'@type': 'UserOrdersRequest'}, timeout=timeout))
+        finally:
+            self.replay = None
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from . import exceptions
+
+__all__ = ('TokenBucket', 'OutboundQueue',)
+
+logger = logging.getLogger(__name__)
+
+SendBytes = Callable[[bytes], Awaitable[None]]
+
+
+class TokenBucket:
+    """
+    paces sends to `rate` per second with bursts of up to `burst` frames,
+    `rate=None` doesn't limit the rate and only applies `postpone`
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'paused_until',)
+
+    rate: Optional[float]
+    burst: float
+    tokens: float
+    updated: float
+    paused_until: float
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1) -> None:
+        assert rate is None or rate > 0
+        assert burst >= 1
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = 0.
+        self.paused_until = 0.
+
+    def postpone(self, now: float, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def take(self, now: float) -> float:
+        """
+        takes a token and returns how long to wait before sending
+        """
+        delay = max(self.paused_until - now, 0.)
+        if self.rate is None:
+            return delay
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            delay = max(delay, -self.tokens / self.rate)
+        return delay
+
+
+class OutboundQueue:
+    """
+    bounded queue of encrypted frames written to the socket by a single writer task
+
+    `put` returns as soon as the frame is queued and only waits while the queue is full.
+    the writer takes up to `max_batch` queued frames at a time and sends them one `send_bytes`
+    call per frame, paced through `bucket`, frames aren't merged into one socket write.
+    `close` waits up to `drain_timeout` seconds for queued frames to be sent
+    """
+    __slots__ = ('send_bytes', 'queue', 'bucket', 'max_batch', 'drain_timeout', 'writer', 'error',
+                 'sent', 'dropped', 'total_latency', 'max_latency', 'last_latency',)
+
+    send_bytes: SendBytes
+    queue: asyncio.Queue
+    bucket: TokenBucket
+    max_batch: int
+    drain_timeout: Optional[float]
+    writer: Optional[asyncio.Future]
+    error: Optional[BaseException]
+    sent: int
+    dropped: int
+    total_latency: float
+    max_latency: float
+    last_latency: float
+
+    def __init__(self, send_bytes: SendBytes, *, max_size: int = 1024, max_batch: int = 64,
+                 bucket: Optional[TokenBucket] = None, drain_timeout: Optional[float] = 10.) -> None:
+        self.send_bytes = send_bytes
+        self.queue = asyncio.Queue(max_size)
+        self.bucket = bucket if bucket is not None else TokenBucket()
+        self.max_batch = max_batch
+        self.drain_timeout = drain_timeout
+        self.writer = None
+        self.error = None
+        self.sent = 0
+        self.dropped = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+        self.last_latency = 0.
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'queued': self.queue_depth,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'mean_latency': self.total_latency / self.sent if self.sent else 0.,
+            'max_latency': self.max_latency,
+            'last_latency': self.last_latency,
+        }
+
+    def postpone(self, seconds: float) -> None:
+        self.bucket.postpone(asyncio.get_event_loop().time(), seconds)
+
+    async def put(self, frame: bytes) -> None:
+        if self.error is not None:
+            raise exceptions.CryptologyConnectionError('outbound writer failed') from self.error
+        await self.queue.put((asyncio.get_event_loop().time(), frame))
+        if self.error is not None:
+            raise exceptions.CryptologyConnectionError('outbound writer failed') from self.error
+        if self.writer is None:
+            self.writer = asyncio.ensure_future(self._write_loop())
+
+    async def flush(self) -> None:
+        await self.queue.join()
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        waits up to `timeout`, by default `drain_timeout`, for queued frames to be sent before
+        stopping the writer, frames that are still queued then are dropped and logged
+        """
+        if self.writer is None:
+            return
+        if timeout is None:
+            timeout = self.drain_timeout
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            dropped = self.dropped
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+            self.writer = None
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+            if self.dropped > dropped:
+                logger.error('dropped %i queued frames on close', self.dropped - dropped)
+
+    async def _next_batch(self) -> List[Tuple[float, bytes]]:
+        batch = [await self.queue.get()]
+        while len(batch) < self.max_batch and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        batch: List[Tuple[float, bytes]] = []
+        try:
+            while True:
+                batch = await self._next_batch()
+                while batch:
+                    enqueued, frame = batch[0]
+                    delay = self.bucket.take(loop.time())
+                    if delay > 0:
+                        logger.debug('pacing for %f seconds', delay)
+                        await asyncio.sleep(delay)
+                    await self.send_bytes(frame)
+                    del batch[0]
+                    latency = loop.time() - enqueued
+                    self.sent += 1
+                    self.total_latency += latency
+                    self.last_latency = latency
+                    if latency > self.max_latency:
+                        self.max_latency = latency
+                    self.queue.task_done()
+        except asyncio.CancelledError:
+            # frames of the current batch are no longer queued, `close` counts the rest
+            self.dropped += len(batch)
+            for _ in batch:
+                self.queue.task_done()
+            raise
+        except Exception as exc:
+            logger.error('failed to send a message', exc_info=exc)
+            self.error = exc
+            # release `flush` and blocked `put` callers, they'll see the error
+            for _ in batch:
+                self.queue.task_done()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.queue.task_done()
@@ -1,19 +1,18 @@
 import asyncio
-from typing import Awaitable, Iterable, Optional
+from typing import Awaitable, Iterable
 
 __all__ = ('run_parallel',)
 
 
 async def run_parallel(coros: Iterable[Awaitable[None]],
                        *,
-                       raise_canceled: bool = False,
-                       loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+                       raise_canceled: bool = False) -> None:
     """
     run coros in parallel, cancel all on first exit
     raises first non-canceled exception
     may raise `asyncio.CanceledError` when `raise_canceled` is set
     """
-    tasks = list(asyncio.Task(x, loop=loop) for x in coros)
+    tasks = list(asyncio.ensure_future(x) for x in coros)
 
     if not tasks:
         return
@@ -26,7 +25,7 @@ async def run_parallel(coros: Iterable[Awaitable[None]],
     for task in tasks:
         task.add_done_callback(cancel_others)
 
-    result = await asyncio.gather(*tasks, return_exceptions=True, loop=loop)
+    result = await asyncio.gather(*tasks, return_exceptions=True)
 
     exception = None
     for err in filter(None, result):
@@ -0,0 +1,223 @@
+import aiohttp
+import asyncio
+import logging
+
+from concurrent.futures import Executor
+from typing import Any, Dict, Iterator, Optional
+
+from . import exceptions, serialization
+from .client import (BaseProtocolClient, ClientReadCallback, ClientThrottlingCallback, ClientWriter, ClientWriterStub,
+                     Keys, TradesStateChangedCallback, WS_CONNECT_OPTIONS, serve_session, start_session)
+from .dispatch import CallbackDispatcher
+from .journal import SessionState
+from .messages import MessageDecoder
+from .outbound import TokenBucket
+from .reconnect import Backoff, reconnect_loop
+
+__all__ = ('ClientPool',)
+
+logger = logging.getLogger(__name__)
+
+
+async def idle_writer(ws: ClientWriterStub, sequence_id: int) -> None:
+    await asyncio.get_event_loop().create_future()
+
+
+class _Account:
+    __slots__ = ('client_id', 'client_keys', 'writer', 'state', 'pacing', 'backoff', 'dispatcher',)
+
+    client_id: str
+    client_keys: Keys
+    writer: ClientWriter
+    state: SessionState
+    pacing: Optional[TokenBucket]
+    backoff: Backoff
+    dispatcher: CallbackDispatcher
+
+    def __init__(self, client_id: str, client_keys: Keys, writer: ClientWriter, state: SessionState,
+                 pacing: Optional[TokenBucket], backoff: Backoff) -> None:
+        self.client_id = client_id
+        self.client_keys = client_keys
+        self.writer = writer
+        self.state = state
+        self.pacing = pacing
+        self.backoff = backoff
+        self.dispatcher = CallbackDispatcher()
+
+
+class ClientPool:
+    """
+    many accounts connected through one aiohttp session and connector
+
+    at most `max_handshakes` connections handshake at the same time and at most `max_connections`
+    are open, `0` doesn't limit them. every account reconnects on its own and resumes from its
+    `SessionState`, its backoff is reset after a connection stayed up for `stable_after` seconds.
+    `read_callback` gets the connection of the account, its `client_id` tells them apart.
+    an account that fails with an error that isn't retried is dropped and the error
+    is kept in `errors`, `run` returns once no account is left
+    """
+    __slots__ = ('ws_addr', 'server_keys', 'read_callback', 'throttling_callback', 'trades_state_changed_callback',
+                 'rpc_timeout', 'serializer', 'crypto_executor', 'decoder', 'max_connections', 'stable_after',
+                 'handshakes', 'accounts', 'connections', 'errors', 'tasks', 'session',)
+
+    ws_addr: str
+    server_keys: Keys
+    read_callback: ClientReadCallback
+    throttling_callback: Optional[ClientThrottlingCallback]
+    trades_state_changed_callback: Optional[TradesStateChangedCallback]
+    rpc_timeout: Optional[float]
+    serializer: Optional[serialization.Serializer]
+    crypto_executor: Optional[Executor]
+    decoder: Optional[MessageDecoder]
+    max_connections: int
+    stable_after: float
+    handshakes: asyncio.Semaphore
+    accounts: Dict[str, _Account]
+    connections: Dict[str, BaseProtocolClient]
+    errors: Dict[str, BaseException]
+    tasks: Dict[str, asyncio.Future]
+    session: Optional[aiohttp.ClientSession]
+
+    def __init__(self, *, ws_addr: str, server_keys: Keys, read_callback: ClientReadCallback,
+                 throttling_callback: ClientThrottlingCallback = None,
+                 trades_state_changed_callback: TradesStateChangedCallback = None,
+                 rpc_timeout: Optional[float] = None,
+                 serializer: Optional[serialization.Serializer] = None,
+                 crypto_executor: Optional[Executor] = None,
+                 decoder: Optional[MessageDecoder] = None,
+                 max_handshakes: int = 16,
+                 max_connections: int = 0,
+                 stable_after: float = 60.) -> None:
+        assert max_handshakes > 0 and max_connections >= 0
+        self.ws_addr = ws_addr
+        self.server_keys = server_keys
+        self.read_callback = read_callback
+        self.throttling_callback = throttling_callback
+        self.trades_state_changed_callback = trades_state_changed_callback
+        self.rpc_timeout = rpc_timeout
+        self.serializer = serializer
+        self.crypto_executor = crypto_executor
+        self.decoder = decoder
+        self.max_connections = max_connections
+        self.stable_after = stable_after
+        self.handshakes = asyncio.Semaphore(max_handshakes)
+        self.accounts = {}
+        self.connections = {}
+        self.errors = {}
+        self.tasks = {}
+        self.session = None
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.accounts)
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self.accounts
+
+    def __getitem__(self, client_id: str) -> BaseProtocolClient:
+        """
+        the current connection of the account
+        """
+        try:
+            return self.connections[client_id]
+        except KeyError:
+            raise exceptions.CryptologyConnectionError(f'{client_id} is not connected') from None
+
+    def add(self, client_id: str, client_keys: Keys, *, writer: Optional[ClientWriter] = None,
+            state: Optional[SessionState] = None, pacing: Optional[TokenBucket] = None,
+            backoff: Optional[Backoff] = None) -> None:
+        """
+        `writer` is optional, messages can be sent through `send_signed_message` as well
+        """
+        if client_id in self.accounts:
+            raise ValueError(f'account {client_id} is already in the pool')
+        account = _Account(client_id, client_keys, writer if writer is not None else idle_writer,
+                           state if state is not None else SessionState(), pacing,
+                           backoff if backoff is not None else Backoff())
+        self.accounts[client_id] = account
+        if self.session is not None:
+            self._start(account)
+
+    async def remove(self, client_id: str) -> None:
+        self.accounts.pop(client_id)
+        task = self.tasks.get(client_id)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def send_signed_message(self, client_id: str, *, sequence_id: int, payload: dict) -> None:
+        """
+        while the account is reconnecting the message waits in its journal and is sent after the handshake
+        """
+        ws = self.connections.get(client_id)
+        if ws is None or ws.closed:
+            self.accounts[client_id].state.journal.record(sequence_id, payload)
+        else:
+            await ws.send_signed_message(sequence_id=sequence_id, payload=payload)
+
+    async def send_signed_request(self, client_id: str, *, payload: dict, request_id: Optional[int] = None,
+                                  timeout: Optional[float] = None) -> Any:
+        return await self[client_id].send_signed_request(payload=payload, request_id=request_id, timeout=timeout)
+
+    async def run(self) -> None:
+        # the default connector would stop at 100 connections
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        async with aiohttp.ClientSession(ws_response_class=BaseProtocolClient, connector=connector) as session:
+            self.session = session
+            try:
+                for account in self.accounts.values():
+                    self._start(account)
+                while self.tasks:
+                    await asyncio.wait(list(self.tasks.values()))
+            finally:
+                self.session = None
+                tasks = list(self.tasks.values())
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, account: _Account) -> None:
+        task = asyncio.ensure_future(self._run_account(account))
+        self.tasks[account.client_id] = task
+
+        def forget(_: asyncio.Future) -> None:
+            if self.tasks.get(account.client_id) is task:
+                del self.tasks[account.client_id]
+
+        task.add_done_callback(forget)
+
+    async def _run_account(self, account: _Account) -> None:
+        try:
+            await reconnect_loop(lambda: self._connect(account), account.backoff, None, self.stable_after)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error('account %s stopped', account.client_id, exc_info=exc)
+            self.errors[account.client_id] = exc
+            self.accounts.pop(account.client_id, None)
+
+    async def _connect(self, account: _Account) -> None:
+        ws = await self.session.ws_connect(self.ws_addr, **WS_CONNECT_OPTIONS)
+        try:
+            ws.bind(account.client_id, account.client_keys, self.server_keys)
+            async with self.handshakes:
+                sequence_id, server_cipher = await start_session(
+                    ws, rpc_timeout=self.rpc_timeout, serializer=self.serializer, pacing=account.pacing,
+                    state=account.state, crypto_executor=self.crypto_executor, decoder=self.decoder)
+        except BaseException:
+            await ws.close()
+            raise
+        logger.info('account %s connected', account.client_id)
+
+        self.connections[account.client_id] = ws
+        try:
+            await serve_session(ws, sequence_id, server_cipher, read_callback=self.read_callback,
+                                writer=account.writer, throttling_callback=self.throttling_callback,
+                                trades_state_changed_callback=self.trades_state_changed_callback,
+                                dispatcher=account.dispatcher, state=account.state)
+        finally:
+            if self.connections.get(account.client_id) is ws:
+                del self.connections[account.client_id]
+            await ws.close()
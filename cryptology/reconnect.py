@@ -0,0 +1,123 @@
+import aiohttp
+import asyncio
+import logging
+import random
+
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+from . import exceptions
+from .client import run_client
+from .journal import SessionState
+from .market_data_client import run as run_market_data
+
+__all__ = ('Backoff', 'reconnect_loop', 'run_resilient_client', 'run_resilient_market_data',)
+
+logger = logging.getLogger(__name__)
+
+RETRY_ON: Tuple[Type[BaseException], ...] = (
+    # `ServerRestart`, `RateLimit`, `Disconnected`, `HeartbeatError` and a writer sending on a closed socket
+    exceptions.CryptologyConnectionError,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+# another connection of the same account took over, reconnecting would take it back
+FATAL: Tuple[Type[BaseException], ...] = (
+    exceptions.ConcurrentConnection,
+)
+
+
+class Backoff:
+    """
+    exponential backoff with full jitter between `initial` and `maximum` seconds
+
+    the server asks to wait at least `restart_delay` after `ServerRestart` and
+    `rate_limit_delay` after `RateLimit`, the delay never goes below them
+    """
+    __slots__ = ('initial', 'maximum', 'factor', 'restart_delay', 'rate_limit_delay', 'attempt',)
+
+    initial: float
+    maximum: float
+    factor: float
+    restart_delay: float
+    rate_limit_delay: float
+    attempt: int
+
+    def __init__(self, *, initial: float = .5, maximum: float = 30., factor: float = 2.,
+                 restart_delay: float = 2., rate_limit_delay: float = 10.) -> None:
+        assert 0 < initial <= maximum and factor >= 1
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.restart_delay = restart_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.attempt = 0
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+    def delay(self, exc: Optional[BaseException] = None) -> float:
+        ceiling = min(self.maximum, self.initial * self.factor ** self.attempt)
+        self.attempt += 1
+        delay = random.uniform(self.initial, ceiling)
+        if isinstance(exc, exceptions.ServerRestart):
+            delay = max(delay, self.restart_delay)
+        elif isinstance(exc, exceptions.RateLimit):
+            delay = max(delay, self.rate_limit_delay)
+        return delay
+
+
+async def reconnect_loop(connect: Callable[[], Awaitable[None]], backoff: Backoff,
+                         max_attempts: Optional[int], stable_after: float) -> None:
+    """
+    awaits `connect()` again after errors in `RETRY_ON` until it returns,
+    the backoff is reset after a connection stayed up for `stable_after` seconds,
+    after `max_attempts` failures in a row the last error is raised
+    """
+    loop = asyncio.get_event_loop()
+    attempts = 0
+    while True:
+        started = loop.time()
+        try:
+            await connect()
+            return
+        except FATAL:
+            raise
+        except RETRY_ON as exc:
+            if loop.time() - started >= stable_after:
+                backoff.reset()
+                attempts = 0
+            attempts += 1
+            if max_attempts is not None and attempts >= max_attempts:
+                raise
+            delay = backoff.delay(exc)
+            logger.warning('connection lost (%r), reconnecting in %.2f seconds', exc, delay)
+            await asyncio.sleep(delay)
+
+
+async def run_resilient_client(*, state: Optional[SessionState] = None, backoff: Optional[Backoff] = None,
+                               max_attempts: Optional[int] = None, stable_after: float = 60.,
+                               **kwargs: Any) -> None:
+    """
+    `run_client` reconnecting after connection errors, `kwargs` are passed to `run_client`
+
+    every connection resumes after the last received outbox message and resends
+    signed messages the server hasn't seen, both tracked in `state`.
+    the backoff is reset after a connection stayed up for `stable_after` seconds,
+    after `max_attempts` failures in a row the last error is raised
+    """
+    if state is None:
+        state = SessionState(last_outbox_id=kwargs.pop('last_seen_order', 0))
+    if backoff is None:
+        backoff = Backoff()
+    await reconnect_loop(lambda: run_client(state=state, **kwargs), backoff, max_attempts, stable_after)
+
+
+async def run_resilient_market_data(*, backoff: Optional[Backoff] = None, max_attempts: Optional[int] = None,
+                                    stable_after: float = 60., **kwargs: Any) -> None:
+    """
+    `run_market_data` reconnecting after connection errors, `kwargs` are passed to `run_market_data`
+    """
+    if backoff is None:
+        backoff = Backoff()
+    await reconnect_loop(lambda: run_market_data(**kwargs), backoff, max_attempts, stable_after)
@@ -0,0 +1,94 @@
+import logging
+import struct
+import time
+
+from typing import Any, BinaryIO, Iterator, Optional, Tuple, Union
+
+__all__ = ('Recorder', 'read_recording', 'FRAME', 'KEY',)
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CRYREC\x01'
+HEADER = struct.Struct('<7sB')
+RECORD = struct.Struct('<BdI')
+
+FLAG_DECRYPTED = 1
+FRAME = 0
+KEY = 1
+
+
+class Recorder:
+    """
+    appends received frames with their arrival time to a binary file
+
+    client frames are written encrypted along with the key of each session, or decrypted
+    with `decrypted`. market data frames aren't encrypted. every record is a type byte,
+    the arrival time as a little endian double and the length of the data as a uint32
+    """
+    __slots__ = ('file', 'decrypted', 'frames',)
+
+    file: BinaryIO
+    decrypted: bool
+    frames: int
+
+    def __init__(self, path: str, *, decrypted: bool = False) -> None:
+        self.file = open(path, 'ab')
+        self.decrypted = decrypted
+        self.frames = 0
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, FLAG_DECRYPTED if decrypted else 0))
+        else:
+            with open(path, 'rb') as f:
+                assert _read_header(f) == decrypted, 'the file has frames recorded with another `decrypted`'
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _write(self, record_type: int, data: Union[bytes, memoryview], arrival: Optional[float]) -> None:
+        self.file.write(RECORD.pack(record_type, time.time() if arrival is None else arrival, len(data)))
+        self.file.write(data)
+
+    def write_key(self, key: bytes) -> None:
+        """
+        starts a client session, frames after it are decrypted with `key` when replayed
+        """
+        if not self.decrypted:
+            self._write(KEY, key, None)
+
+    def write(self, data: Union[bytes, memoryview], arrival: Optional[float] = None) -> None:
+        self._write(FRAME, data, arrival)
+        self.frames += 1
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _read_header(f: BinaryIO) -> bool:
+    magic, flags = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('not a recording')
+    return bool(flags & FLAG_DECRYPTED)
+
+
+def read_recording(path: str) -> Iterator[Tuple[int, float, bytes]]:
+    """
+    the type, arrival time and data of the records in `path`
+    """
+    with open(path, 'rb') as f:
+        _read_header(f)
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            record_type, arrival, size = RECORD.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                logger.warning('recording %s ends with a partial frame', path)
+                return
+            yield record_type, arrival, data
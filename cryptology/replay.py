@@ -0,0 +1,162 @@
+import aiohttp
+import asyncio
+import logging
+
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterator, Optional, Tuple
+
+from . import crypto, exceptions
+from .client import BaseProtocolClient, ClientReadCallback, ClientWriter, ClientWriterStub, serve_session
+from .dispatch import CallbackDispatcher
+from .market_data_client import MarketDataCallback, OrderBookCallback, TradesCallback, TradesStateChangedCallback, \
+    reader_loop
+from .recording import KEY, read_recording
+
+__all__ = ('ReplayWebSocket', 'ReplayProtocolClient', 'replay_client', 'replay_market_data',)
+
+logger = logging.getLogger(__name__)
+
+
+class _ReplayCipher:
+    """
+    decrypts with the key of the current session of an encrypted recording
+    """
+    __slots__ = ('cipher',)
+
+    cipher: Optional[crypto.Cipher]
+
+    def __init__(self) -> None:
+        self.cipher = None
+
+    def decrypt(self, data: bytes) -> bytes:
+        return self.cipher.decrypt(data) if self.cipher is not None else data
+
+
+class ReplayWebSocket:
+    """
+    feeds recorded frames to `receive`, `speed` times faster than they arrived or as fast as possible
+    when `None`, and a close message at the end
+    """
+    __slots__ = ('records', 'speed', 'cipher', 'first_arrival', 'started', 'closed',)
+
+    records: Iterator[Tuple[int, float, bytes]]
+    speed: Optional[float]
+    cipher: _ReplayCipher
+    first_arrival: Optional[float]
+    started: float
+    closed: bool
+
+    def __init__(self, path: str, *, speed: Optional[float] = None) -> None:
+        assert speed is None or speed > 0
+        self.records = read_recording(path)
+        self.speed = speed
+        self.cipher = _ReplayCipher()
+        self.first_arrival = None
+        self.started = 0.
+        self.closed = False
+
+    async def receive(self, timeout: Optional[float] = None) -> aiohttp.WSMessage:
+        for record_type, arrival, data in self.records:
+            if record_type == KEY:
+                self.cipher.cipher = crypto.Cipher(data)
+                continue
+            if self.speed is not None:
+                loop = asyncio.get_event_loop()
+                if self.first_arrival is None:
+                    self.first_arrival, self.started = arrival, loop.time()
+                delay = self.started + (arrival - self.first_arrival) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            return aiohttp.WSMessage(aiohttp.WSMsgType.BINARY, data, None)
+        self.closed = True
+        return aiohttp.WSMessage(aiohttp.WSMsgType.CLOSED, None, None)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class ReplayProtocolClient(BaseProtocolClient):
+    """
+    a client reading frames from a `ReplayWebSocket`, sent messages are dropped
+    """
+    replay: ReplayWebSocket
+
+    def __init__(self, replay: ReplayWebSocket) -> None:
+        # no aiohttp connection behind it, only the protocol state
+        self._init_protocol()
+        self.replay = replay
+
+    @property
+    def closed(self) -> bool:
+        return self.replay.closed
+
+    async def receive(self, timeout: Optional[float] = None) -> aiohttp.WSMessage:
+        return await self.replay.receive(timeout)
+
+    async def send_bytes(self, data: bytes, compress: Optional[int] = None) -> None:
+        pass
+
+    async def receive_iter(self, *args: Any) -> AsyncIterator[Tuple[int, datetime, dict]]:
+        """
+        ends without an error at the end of the recording, so the session closes cleanly
+        """
+        try:
+            async for item in super().receive_iter(*args):
+                yield item
+        except exceptions.Disconnected:
+            if not self.replay.closed:
+                raise
+
+    async def close(self, **kwargs: Any) -> bool:
+        await self.outbound.close()
+        await self.replay.close()
+        return True
+
+
+async def idle_writer(ws: ClientWriterStub, sequence_id: int) -> None:
+    await asyncio.Event().wait()
+
+
+async def replay_client(path: str, *, read_callback: Optional[ClientReadCallback] = None,
+                        writer: ClientWriter = idle_writer, speed: Optional[float] = None,
+                        **options: Any) -> None:
+    """
+    runs `read_callback` for the outbox messages of a recording like `run_client` does, until it ends
+    and every callback has finished
+
+    `options` are the ones of `serve_session` and `serializer`, `decoder` and `metrics`
+    """
+    ws = ReplayProtocolClient(ReplayWebSocket(path, speed=speed))
+    for name in ('serializer', 'decoder', 'metrics'):
+        value = options.pop(name, None)
+        if value is not None:
+            setattr(ws, name, value)
+    if options.get('dispatcher') is None:
+        options['dispatcher'] = CallbackDispatcher(drain_timeout=None)
+    try:
+        await serve_session(ws, 0, ws.replay.cipher, read_callback=read_callback, writer=writer, **options)
+        logger.info('replay of %s finished', path)
+    finally:
+        await ws.close()
+
+
+async def replay_market_data(path: str, *, market_data_callback: MarketDataCallback = None,
+                             order_book_callback: OrderBookCallback = None, trades_callback: TradesCallback = None,
+                             trades_state_changed_callback: TradesStateChangedCallback = None,
+                             speed: Optional[float] = None, **options: Any) -> None:
+    """
+    runs the callbacks for the broadcasts of a recording like `run_market_data` does, until it ends
+    and every callback has finished
+
+    `options` are the ones of `reader_loop`
+    """
+    dispatcher = options.pop('dispatcher', None)
+    if dispatcher is None:
+        dispatcher = CallbackDispatcher(drain_timeout=None)
+    try:
+        await reader_loop(ReplayWebSocket(path, speed=speed), market_data_callback, order_book_callback,
+                          trades_callback, trades_state_changed_callback, dispatcher=dispatcher, **options)
+    except exceptions.Disconnected:
+        logger.info('replay of %s finished', path)
+    finally:
+        await dispatcher.shutdown()
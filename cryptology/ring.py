@@ -0,0 +1,424 @@
+import abc
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from decimal import Decimal
+from typing import Any, AsyncIterator, ClassVar, Dict, Iterator, List, Optional, Tuple, Type
+
+__all__ = ('RingPublisher', 'RingSubscriber', 'Record', 'OrderBookRecord', 'TradeRecord', 'TradesStateRecord',
+           'default_path',)
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CRYRING1'
+# magic, slot size, slot count, sequence number of the last published record, then the closed flag
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+PUBLISHED_OFFSET = 16
+CLOSED_OFFSET = 24
+# sequence number, record type, body length
+SLOT = struct.Struct('<QB3xI')
+SEQUENCE = struct.Struct('<Q')
+
+TRADE_PAIR_SIZE = 16
+DECIMAL_SIZE = 24
+
+
+def default_path(name: str) -> str:
+    """
+    a file in memory where there is /dev/shm
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else os.path.join(os.path.expanduser('~'), '.cryptology')
+    return os.path.join(directory, f'cryptology-{name}.ring')
+
+
+def _text(data: bytes) -> str:
+    return str(data.rstrip(b'\0'), 'ascii')
+
+
+def _field(value: Any, size: int) -> bytes:
+    data = str(value).encode('ascii')
+    if len(data) > size:
+        raise ValueError(f'{value!r} is longer than {size} bytes')
+    return data
+
+
+def _mark_closed(path: str) -> None:
+    """
+    tells the subscribers of the ring at `path`, if there is one, that nothing is published to it anymore
+    """
+    try:
+        with open(path, 'r+b') as file, mmap.mmap(file.fileno(), 0) as ring:
+            if ring[:len(MAGIC)] == MAGIC:
+                ring[CLOSED_OFFSET] = 1
+    except (OSError, ValueError):
+        pass
+
+
+class Record(abc.ABC):
+    """
+    a view of a record in the ring buffer, fields are read from shared memory when accessed
+
+    the publisher overwrites the slot after `slot_count` newer records, `valid()`
+    tells whether the values read so far belong to this record
+    """
+    __slots__ = ('view', 'offset', 'sequence',)
+
+    TYPE: ClassVar[int]
+
+    view: memoryview
+    offset: int
+    sequence: int
+
+    def __init__(self, view: memoryview, offset: int, sequence: int) -> None:
+        self.view = view
+        self.offset = offset
+        self.sequence = sequence
+
+    def valid(self) -> bool:
+        return SEQUENCE.unpack_from(self.view, self.offset)[0] == self.sequence
+
+    @classmethod
+    @abc.abstractmethod
+    def write(cls, view: memoryview, offset: int, size: int, payload: dict) -> Tuple[int, bool]:
+        """
+        writes `payload` to the body at `offset`, returns the length and whether it was truncated,
+        raises `ValueError` if a field doesn't fit
+        """
+
+
+class OrderBookRecord(Record):
+    """
+    `buy_levels` and `sell_levels` keep the best levels that fit in a slot
+    """
+    __slots__ = ()
+    TYPE = 1
+
+    BODY: ClassVar[struct.Struct] = struct.Struct(f'<{TRADE_PAIR_SIZE}sqHH')
+    LEVEL: ClassVar[struct.Struct] = struct.Struct(f'<{DECIMAL_SIZE}s{DECIMAL_SIZE}s')
+
+    @property
+    def trade_pair(self) -> str:
+        return _text(self.BODY.unpack_from(self.view, self.offset + SLOT.size)[0])
+
+    @property
+    def current_order_id(self) -> int:
+        return self.BODY.unpack_from(self.view, self.offset + SLOT.size)[1]
+
+    def _levels(self, first: int, count: int) -> Dict[str, str]:
+        offset = self.offset + SLOT.size + self.BODY.size + first * self.LEVEL.size
+        return {_text(price): _text(amount)
+                for price, amount in self.LEVEL.iter_unpack(self.view[offset:offset + count * self.LEVEL.size])}
+
+    @property
+    def buy_levels(self) -> Dict[str, str]:
+        _, _, buys, _ = self.BODY.unpack_from(self.view, self.offset + SLOT.size)
+        return self._levels(0, buys)
+
+    @property
+    def sell_levels(self) -> Dict[str, str]:
+        _, _, buys, sells = self.BODY.unpack_from(self.view, self.offset + SLOT.size)
+        return self._levels(buys, sells)
+
+    @classmethod
+    def write(cls, view: memoryview, offset: int, size: int, payload: dict) -> Tuple[int, bool]:
+        buy_levels = payload.get('buy_levels') or {}
+        sell_levels = payload.get('sell_levels') or {}
+        room = (size - cls.BODY.size) // cls.LEVEL.size
+        truncated = len(buy_levels) + len(sell_levels) > room
+        if truncated:
+            buys = sorted(buy_levels, key=Decimal, reverse=True)[:max(room - len(sell_levels), room // 2)]
+            sells = sorted(sell_levels, key=Decimal)[:room - len(buys)]
+        else:
+            buys, sells = list(buy_levels), list(sell_levels)
+        cls.BODY.pack_into(view, offset, _field(payload['trade_pair'], TRADE_PAIR_SIZE),
+                           payload['current_order_id'], len(buys), len(sells))
+        position = offset + cls.BODY.size
+        for levels, prices in ((buy_levels, buys), (sell_levels, sells)):
+            for price in prices:
+                cls.LEVEL.pack_into(view, position, _field(price, DECIMAL_SIZE),
+                                    _field(levels[price], DECIMAL_SIZE))
+                position += cls.LEVEL.size
+        return position - offset, truncated
+
+
+class TradeRecord(Record):
+    __slots__ = ()
+    TYPE = 2
+
+    BODY: ClassVar[struct.Struct] = struct.Struct(f'<{TRADE_PAIR_SIZE}sqqq{DECIMAL_SIZE}s{DECIMAL_SIZE}s?')
+
+    def _unpack(self) -> tuple:
+        return self.BODY.unpack_from(self.view, self.offset + SLOT.size)
+
+    @property
+    def trade_pair(self) -> str:
+        return _text(self._unpack()[0])
+
+    @property
+    def current_order_id(self) -> int:
+        return self._unpack()[1]
+
+    @property
+    def time(self) -> List[int]:
+        return list(self._unpack()[2:4])
+
+    @property
+    def amount(self) -> Decimal:
+        return Decimal(_text(self._unpack()[4]))
+
+    @property
+    def price(self) -> Decimal:
+        return Decimal(_text(self._unpack()[5]))
+
+    @property
+    def maker_buy(self) -> bool:
+        return self._unpack()[6]
+
+    @classmethod
+    def write(cls, view: memoryview, offset: int, size: int, payload: dict) -> Tuple[int, bool]:
+        seconds, fraction = payload.get('time') or (0, 0)
+        cls.BODY.pack_into(view, offset, _field(payload['trade_pair'], TRADE_PAIR_SIZE),
+                           payload['current_order_id'], seconds, fraction,
+                           _field(payload['amount'], DECIMAL_SIZE), _field(payload['price'], DECIMAL_SIZE),
+                           bool(payload.get('maker_buy')))
+        return cls.BODY.size, False
+
+
+class TradesStateRecord(Record):
+    __slots__ = ()
+    TYPE = 3
+
+    BODY: ClassVar[struct.Struct] = struct.Struct('<?H')
+    PAIR: ClassVar[struct.Struct] = struct.Struct(f'<{TRADE_PAIR_SIZE}s')
+
+    @property
+    def enabled(self) -> bool:
+        return self.BODY.unpack_from(self.view, self.offset + SLOT.size)[0]
+
+    @property
+    def trade_pairs(self) -> List[str]:
+        _, count = self.BODY.unpack_from(self.view, self.offset + SLOT.size)
+        offset = self.offset + SLOT.size + self.BODY.size
+        return [_text(pair) for pair, in self.PAIR.iter_unpack(self.view[offset:offset + count * self.PAIR.size])]
+
+    @classmethod
+    def write(cls, view: memoryview, offset: int, size: int, payload: dict) -> Tuple[int, bool]:
+        pairs = payload['trade_pairs'][:(size - cls.BODY.size) // cls.PAIR.size]
+        cls.BODY.pack_into(view, offset, payload['@type'] == 'TradesEnabledOnPairs', len(pairs))
+        for n, pair in enumerate(pairs):
+            cls.PAIR.pack_into(view, offset + cls.BODY.size + n * cls.PAIR.size, _field(pair, TRADE_PAIR_SIZE))
+        return cls.BODY.size + len(pairs) * cls.PAIR.size, len(pairs) < len(payload['trade_pairs'])
+
+
+RECORD_CLASSES: Dict[str, Type[Record]] = {
+    'OrderBookAgg': OrderBookRecord,
+    'AnonymousTrade': TradeRecord,
+    'TradesDisabledOnPairs': TradesStateRecord,
+    'TradesEnabledOnPairs': TradesStateRecord,
+}
+RECORD_TYPES: Dict[int, Type[Record]] = {cls.TYPE: cls for cls in RECORD_CLASSES.values()}
+
+
+class RingPublisher:
+    """
+    writes market data to a ring buffer in a memory mapped file for `RingSubscriber`s in other processes
+
+    `publish` is a `market_data_callback`, one publisher keeps the only upstream connection:
+
+        with RingPublisher(default_path('md')) as ring:
+            await run_resilient_market_data(ws_addr=..., market_data_callback=ring.publish)
+
+    there is a single writer and no locks, readers detect records overwritten under them by sequence numbers.
+    a new publisher replaces the file at `path` instead of reusing it, subscribers of the previous one
+    see it `closed` and have to open the path again
+    """
+    __slots__ = ('path', 'slot_size', 'slot_count', 'file', 'map', 'view', 'body', 'sequence', 'truncated',
+                 'skipped',)
+
+    path: str
+    slot_size: int
+    slot_count: int
+    file: Any
+    map: mmap.mmap
+    view: memoryview
+    body: memoryview
+    sequence: int
+    truncated: int
+    skipped: int
+
+    def __init__(self, path: str, *, slot_count: int = 65536, slot_size: int = 2048) -> None:
+        assert slot_count > 0
+        assert slot_size >= SLOT.size + OrderBookRecord.BODY.size + 2 * OrderBookRecord.LEVEL.size
+        self.path = path
+        self.slot_size = slot_size
+        self.slot_count = slot_count
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # truncating a file subscribers have mapped would crash them with SIGBUS
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', dir=directory)
+        self.file = os.fdopen(fd, 'w+b')
+        try:
+            self.file.truncate(HEADER_SIZE + slot_count * slot_size)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            HEADER.pack_into(self.map, 0, MAGIC, slot_size, slot_count, 0)
+            _mark_closed(path)
+            os.replace(temp_path, path)
+        except BaseException:
+            self.file.close()
+            os.unlink(temp_path)
+            raise
+        self.view = memoryview(self.map)
+        self.body = memoryview(bytearray(slot_size - SLOT.size))
+        self.sequence = 0
+        self.truncated = 0
+        self.skipped = 0
+
+    def __enter__(self) -> 'RingPublisher':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write(self, payload: dict) -> bool:
+        """
+        returns whether `payload` was published, payloads of other types or with a field
+        that doesn't fit in its record are skipped, the latter are logged and counted in `skipped`
+        """
+        cls = RECORD_CLASSES.get(payload['@type'])
+        if cls is None:
+            return False
+        body = self.body
+        try:
+            # written aside first, so a payload that doesn't fit leaves the slot alone
+            length, truncated = cls.write(body, 0, len(body), payload)
+        except ValueError as error:
+            self.skipped += 1
+            logger.warning('%s not published: %s', payload['@type'], error)
+            return False
+        sequence = self.sequence + 1
+        offset = HEADER_SIZE + (sequence % self.slot_count) * self.slot_size
+        view = self.view
+        # readers of the previous record in the slot see it is gone before the body changes
+        SEQUENCE.pack_into(view, offset, 0)
+        view[offset + SLOT.size:offset + SLOT.size + length] = body[:length]
+        SLOT.pack_into(view, offset, sequence, cls.TYPE, length)
+        SEQUENCE.pack_into(view, PUBLISHED_OFFSET, sequence)
+        self.sequence = sequence
+        if truncated:
+            self.truncated += 1
+        return True
+
+    async def publish(self, payload: dict) -> None:
+        self.write(payload)
+
+    def close(self, unlink: bool = False) -> None:
+        """
+        marks the ring closed for its subscribers, `unlink` removes the file as well
+        """
+        self.view[CLOSED_OFFSET] = 1
+        self.view.release()
+        self.map.close()
+        self.file.close()
+        if unlink:
+            os.unlink(self.path)
+
+
+class RingSubscriber:
+    """
+    reads the records of a `RingPublisher` without copying them, starting with the next one published
+
+    a subscriber that falls more than `slot_count` records behind skips to the oldest record still
+    in the buffer and counts the skipped ones in `lost`
+    """
+    __slots__ = ('path', 'file', 'map', 'view', 'slot_size', 'slot_count', 'next_sequence', 'lost',)
+
+    path: str
+    file: Any
+    map: mmap.mmap
+    view: memoryview
+    slot_size: int
+    slot_count: int
+    next_sequence: int
+    lost: int
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, self.slot_size, self.slot_count, published = HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a ring buffer')
+        self.next_sequence = published + 1
+        self.lost = 0
+
+    def __enter__(self) -> 'RingSubscriber':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def published(self) -> int:
+        return SEQUENCE.unpack_from(self.view, PUBLISHED_OFFSET)[0]
+
+    @property
+    def closed(self) -> bool:
+        """
+        whether the publisher closed the ring or a new one replaced it, the remaining records can still be read
+        """
+        return bool(self.view[CLOSED_OFFSET])
+
+    def read(self) -> Optional[Record]:
+        """
+        the next record or `None` if there is nothing new
+        """
+        while True:
+            published = self.published
+            if self.next_sequence > published:
+                return None
+            oldest = published - self.slot_count + 1
+            if self.next_sequence < oldest:
+                self.lost += oldest - self.next_sequence
+                self.next_sequence = oldest
+            offset = HEADER_SIZE + (self.next_sequence % self.slot_count) * self.slot_size
+            sequence, record_type, _ = SLOT.unpack_from(self.view, offset)
+            if sequence != self.next_sequence:
+                # overwritten since `published` was read
+                continue
+            self.next_sequence += 1
+            return RECORD_TYPES[record_type](self.view, offset, sequence)
+
+    def __iter__(self) -> Iterator[Record]:
+        """
+        the records published so far
+        """
+        while True:
+            record = self.read()
+            if record is None:
+                return
+            yield record
+
+    async def records(self, interval: float = .001) -> AsyncIterator[Record]:
+        """
+        polls for new records every `interval` seconds while there are none
+        """
+        while True:
+            record = self.read()
+            if record is None:
+                await asyncio.sleep(interval)
+            else:
+                yield record
+
+    def close(self) -> None:
+        """
+        records read before must not be used afterwards
+        """
+        self.view.release()
+        self.map.close()
+        self.file.close()
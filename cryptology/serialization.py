@@ -0,0 +1,89 @@
+import json
+
+from typing import Any, Callable, Dict, Optional, Union
+
+__all__ = ('Serializer', 'get_serializer', 'available_serializers',)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class Serializer:
+    """
+    a pair of functions converting payloads to and from utf-8 encoded json
+
+    `loads` has to accept any bytes-like object since frames are decoded
+    from views into the decrypted message
+    """
+    __slots__ = ('name', 'dumps', 'loads',)
+
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Buffer], Any]
+
+    def __init__(self, name: str, dumps: Callable[[Any], bytes], loads: Callable[[Buffer], Any]) -> None:
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self) -> str:
+        return f'<Serializer {self.name}>'
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode('utf-8')
+
+
+def _json_loads(data: Buffer) -> Any:
+    return json.loads(str(data, 'utf-8'))
+
+
+SERIALIZERS: Dict[str, Serializer] = {'json': Serializer('json', _json_dumps, _json_loads)}
+
+try:
+    import ujson
+except ImportError:
+    pass
+else:
+    def _ujson_dumps(obj: Any) -> bytes:
+        try:
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+        except OverflowError:
+            # integers over 64 bits
+            return _json_dumps(obj)
+
+    def _ujson_loads(data: Buffer) -> Any:
+        return ujson.loads(str(data, 'utf-8'))
+
+    SERIALIZERS['ujson'] = Serializer('ujson', _ujson_dumps, _ujson_loads)
+
+try:
+    import orjson
+except ImportError:
+    pass
+else:
+    def _orjson_dumps(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # integers over 64 bits and other values only the stdlib encoder accepts
+            return _json_dumps(obj)
+
+    SERIALIZERS['orjson'] = Serializer('orjson', _orjson_dumps, orjson.loads)
+
+PREFERENCE = ('orjson', 'ujson', 'json',)
+
+
+def available_serializers() -> Dict[str, Serializer]:
+    return dict(SERIALIZERS)
+
+
+def get_serializer(name: Optional[str] = None) -> Serializer:
+    """
+    returns the fastest installed backend unless `name` is given
+    """
+    if name is None:
+        return next(SERIALIZERS[x] for x in PREFERENCE if x in SERIALIZERS)
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f'json backend {name!r} is not available') from None
@@ -0,0 +1,326 @@
+import abc
+import aiohttp
+import asyncio
+import logging
+
+from collections import deque
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Iterable, Optional, Tuple
+
+from . import crypto, serialization
+from .client import (BaseProtocolClient, ClientThrottlingCallback, CryptologyClientSession, Keys,
+                     TradesStateChangedCallback, WS_CONNECT_OPTIONS, load_trackers, start_session)
+from .balances import BalanceCache
+from .journal import SessionState
+from .market_data_client import TRADES_STATE_TYPES, receive_broadcasts
+from .messages import AnonymousTrade, MessageDecoder, Subscription
+from .metrics import PipelineMetrics, RoundTripTracker
+from .order_book import OrderBook, OrderBooks
+from .orders import OrderTracker
+from .outbound import TokenBucket
+
+__all__ = ('Connection', 'MarketDataConnection', 'connect', 'connect_market_data',)
+
+logger = logging.getLogger(__name__)
+
+
+class _Stream(abc.ABC):
+    """
+    a reader task filling a bounded buffer, the reader stops reading the socket while the buffer is full
+
+    while `bounded` is off the items go to `backlog` instead, which is iterated first
+    """
+    __slots__ = ('buffer', 'backlog', 'bounded', 'reader',)
+
+    buffer: asyncio.Queue
+    backlog: Deque[Any]
+    bounded: bool
+    reader: Optional[asyncio.Future]
+
+    def __init__(self, buffer_size: int) -> None:
+        self.buffer = asyncio.Queue(buffer_size)
+        self.backlog = deque()
+        self.bounded = True
+        self.reader = None
+
+    @abc.abstractmethod
+    async def _read(self) -> None:
+        pass
+
+    async def _put(self, item: Any) -> None:
+        if self.bounded:
+            await self.buffer.put(item)
+        else:
+            self.backlog.append(item)
+
+    def _start(self) -> None:
+        self.reader = asyncio.ensure_future(self._read())
+
+    async def _stop(self) -> None:
+        if self.reader is not None:
+            self.reader.cancel()
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        """
+        buffered items, then the error that stopped the reader
+        """
+        buffer, backlog, reader = self.buffer, self.backlog, self.reader
+        assert reader is not None, 'the connection is not open'
+        while True:
+            if backlog:
+                yield backlog.popleft()
+                continue
+            if not buffer.empty():
+                yield buffer.get_nowait()
+                continue
+            if reader.done():
+                if not reader.cancelled():
+                    reader.result()
+                return
+            getter = asyncio.ensure_future(buffer.get())
+            try:
+                await asyncio.wait((getter, reader), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not getter.done():
+                    getter.cancel()
+            if getter.done() and not getter.cancelled():
+                yield getter.result()
+
+
+class Connection(_Stream):
+    """
+    a client connection consumed by iterating `outbox()` instead of callbacks
+
+        async with cryptology.connect(...) as conn:
+            async for outbox_id, ts, payload in conn.outbox():
+                ...
+
+    RPC responses are read by the same task, so they wait as well while the outbox buffer is full.
+    with `orders` or `balances` entering loads them, the messages arriving meanwhile are kept
+    outside of the buffer until they are iterated.
+    with `state` an outbox message counts as handled once the loop asks for the next one
+    """
+    __slots__ = ('client_id', 'client_keys', 'ws_addr', 'server_keys', 'last_seen_order', 'options', 'state',
+                 'throttling_callback', 'trades_state_changed_callback', 'session', 'ws', 'sequence_id',
+                 'server_cipher',)
+
+    client_id: str
+    client_keys: Keys
+    ws_addr: str
+    server_keys: Keys
+    last_seen_order: int
+    options: dict
+    state: Optional[SessionState]
+    throttling_callback: Optional[ClientThrottlingCallback]
+    trades_state_changed_callback: Optional[TradesStateChangedCallback]
+    session: Optional[aiohttp.ClientSession]
+    ws: Optional[BaseProtocolClient]
+    sequence_id: int
+    server_cipher: Optional[crypto.Cipher]
+
+    def __init__(self, *, client_id: str, client_keys: Keys, ws_addr: str, server_keys: Keys,
+                 last_seen_order: int = 0, state: Optional[SessionState] = None,
+                 throttling_callback: ClientThrottlingCallback = None,
+                 trades_state_changed_callback: TradesStateChangedCallback = None,
+                 buffer_size: int = 1024, **options: Any) -> None:
+        """
+        `options` are passed to `start_session`
+        """
+        super().__init__(buffer_size)
+        self.client_id = client_id
+        self.client_keys = client_keys
+        self.ws_addr = ws_addr
+        self.server_keys = server_keys
+        self.last_seen_order = last_seen_order
+        self.options = options
+        self.state = state
+        self.throttling_callback = throttling_callback
+        self.trades_state_changed_callback = trades_state_changed_callback
+        self.session = None
+        self.ws = None
+        self.sequence_id = 0
+        self.server_cipher = None
+
+    async def __aenter__(self) -> 'Connection':
+        self.session = CryptologyClientSession(self.client_id, self.client_keys, self.server_keys)
+        try:
+            self.ws = await self.session.ws_connect(self.ws_addr, **WS_CONNECT_OPTIONS)
+            logger.info('connected to the server %s', self.ws_addr)
+            self.sequence_id, self.server_cipher = await start_session(
+                self.ws, last_seen_order=self.last_seen_order, state=self.state, **self.options)
+        except BaseException:
+            await self.close()
+            raise
+        self.bounded = False
+        self._start()
+        try:
+            await load_trackers(self.ws)
+        except BaseException:
+            await self.close()
+            raise
+        finally:
+            self.bounded = True
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self._stop()
+        if self.ws is not None:
+            await self.ws.close()
+        if self.session is not None:
+            await self.session.close()
+
+    async def _read(self) -> None:
+        async for outbox_id, ts, msg in self.ws.receive_iter(self.server_cipher, self.throttling_callback,
+                                                             self.trades_state_changed_callback):
+            if msg is None:
+                if self.state is not None:
+                    self.state.handled(outbox_id)
+                continue
+            if self.state is not None:
+                self.state.received(outbox_id)
+            await self._put((outbox_id, ts, msg))
+
+    async def outbox(self) -> AsyncIterator[Tuple[int, datetime, dict]]:
+        state = self.state
+        async for item in self._iterate():
+            yield item
+            if state is not None:
+                state.handled(item[0])
+
+    async def send(self, payload: dict) -> int:
+        """
+        sends `payload` with the next sequence id and returns it
+        """
+        self.sequence_id += 1
+        await self.ws.send_signed_message(sequence_id=self.sequence_id, payload=payload)
+        return self.sequence_id
+
+    async def send_signed_message(self, *, sequence_id: int, payload: dict) -> None:
+        self.sequence_id = max(self.sequence_id, sequence_id)
+        await self.ws.send_signed_message(sequence_id=sequence_id, payload=payload)
+
+    async def send_signed_request(self, *, payload: dict, request_id: Optional[int] = None,
+                                  timeout: Optional[float] = None) -> Any:
+        return await self.ws.send_signed_request(payload=payload, request_id=request_id, timeout=timeout)
+
+
+class MarketDataConnection(_Stream):
+    """
+    market data consumed by iterating `messages()`, `order_books()` or `trades()`
+
+    all of them read from the same buffer, so only one should be iterated at a time
+    """
+    __slots__ = ('ws_addr', 'serializer', 'subscription', 'decoder', 'books', 'metrics', 'session', 'ws',)
+
+    ws_addr: str
+    serializer: Optional[serialization.Serializer]
+    subscription: Optional[Subscription]
+    decoder: Optional[MessageDecoder]
+    books: OrderBooks
+    metrics: Optional[PipelineMetrics]
+    session: Optional[aiohttp.ClientSession]
+    ws: Optional[aiohttp.ClientWebSocketResponse]
+
+    def __init__(self, *, ws_addr: str, serializer: Optional[serialization.Serializer] = None,
+                 trade_pairs: Optional[Iterable[str]] = None, message_types: Optional[Iterable[str]] = None,
+                 decoder: Optional[MessageDecoder] = None, order_books: Optional[OrderBooks] = None,
+                 metrics: Optional[PipelineMetrics] = None, buffer_size: int = 1024) -> None:
+        super().__init__(buffer_size)
+        self.ws_addr = ws_addr
+        self.serializer = serializer
+        self.subscription = None
+        if trade_pairs is not None or message_types is not None:
+            self.subscription = Subscription(trade_pairs, message_types, TRADES_STATE_TYPES)
+        self.decoder = decoder
+        self.books = order_books if order_books is not None else OrderBooks()
+        self.metrics = metrics
+        self.session = None
+        self.ws = None
+
+    async def __aenter__(self) -> 'MarketDataConnection':
+        self.session = aiohttp.ClientSession()
+        try:
+            self.ws = await self.session.ws_connect(self.ws_addr, receive_timeout=6, heartbeat=3)
+        except BaseException:
+            await self.close()
+            raise
+        self._start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self._stop()
+        if self.ws is not None:
+            await self.ws.close()
+        if self.session is not None:
+            await self.session.close()
+
+    async def _read(self) -> None:
+        async for payload in receive_broadcasts(self.ws, self.serializer, self.subscription, self.decoder,
+                                                ('OrderBookAgg', 'AnonymousTrade',) + TRADES_STATE_TYPES,
+                                                self.metrics):
+            await self._put(payload)
+
+    def messages(self) -> AsyncIterator[dict]:
+        return self._iterate()
+
+    async def order_books(self, trade_pairs: Optional[Iterable[str]] = None) -> AsyncIterator[OrderBook]:
+        """
+        the local book of one of `trade_pairs` after every snapshot applied to it,
+        books of the other pairs are kept up to date in `books` as well
+        """
+        pairs = frozenset(trade_pairs) if trade_pairs is not None else None
+        async for payload in self._iterate():
+            if payload['@type'] != 'OrderBookAgg':
+                continue
+            book = self.books.apply(payload['current_order_id'], payload['trade_pair'],
+                                    payload.get('buy_levels', {}), payload.get('sell_levels', {}))
+            if book is not None and (pairs is None or book.trade_pair in pairs):
+                yield book
+
+    async def trades(self, trade_pairs: Optional[Iterable[str]] = None) -> AsyncIterator[AnonymousTrade]:
+        pairs = frozenset(trade_pairs) if trade_pairs is not None else None
+        async for payload in self._iterate():
+            if payload['@type'] != 'AnonymousTrade' or pairs is not None and payload['trade_pair'] not in pairs:
+                continue
+            yield payload if isinstance(payload, AnonymousTrade) else AnonymousTrade(payload)
+
+
+def connect(*, client_id: str, client_keys: Keys, ws_addr: str, server_keys: Keys, last_seen_order: int = 0,
+            rpc_timeout: Optional[float] = None, serializer: Optional[serialization.Serializer] = None,
+            pacing: Optional[TokenBucket] = None, state: Optional[SessionState] = None,
+            crypto_executor: Optional[Executor] = None, decoder: Optional[MessageDecoder] = None,
+            metrics: Optional[PipelineMetrics] = None, round_trips: Optional[RoundTripTracker] = None,
+            orders: Optional[OrderTracker] = None, balances: Optional[BalanceCache] = None,
+            throttling_callback: ClientThrottlingCallback = None,
+            trades_state_changed_callback: TradesStateChangedCallback = None,
+            buffer_size: int = 1024) -> Connection:
+    """
+    `async with connect(...) as conn` connects and handshakes, the arguments are the ones of `run_client`
+    """
+    return Connection(client_id=client_id, client_keys=client_keys, ws_addr=ws_addr, server_keys=server_keys,
+                      last_seen_order=last_seen_order, state=state, throttling_callback=throttling_callback,
+                      trades_state_changed_callback=trades_state_changed_callback, buffer_size=buffer_size,
+                      rpc_timeout=rpc_timeout, serializer=serializer, pacing=pacing,
+                      crypto_executor=crypto_executor, decoder=decoder, metrics=metrics,
+                      round_trips=round_trips, orders=orders, balances=balances)
+
+
+def connect_market_data(*, ws_addr: str, serializer: Optional[serialization.Serializer] = None,
+                        trade_pairs: Optional[Iterable[str]] = None, message_types: Optional[Iterable[str]] = None,
+                        decoder: Optional[MessageDecoder] = None, order_books: Optional[OrderBooks] = None,
+                        metrics: Optional[PipelineMetrics] = None, buffer_size: int = 1024) -> MarketDataConnection:
+    """
+    `async with connect_market_data(...) as md`, messages of other `trade_pairs` and `message_types`
+    are dropped before they are decoded
+    """
+    return MarketDataConnection(ws_addr=ws_addr, serializer=serializer, trade_pairs=trade_pairs,
+                                message_types=message_types, decoder=decoder, order_books=order_books,
+                                metrics=metrics, buffer_size=buffer_size)
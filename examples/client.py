@@ -4,7 +4,7 @@ import os
 import pprint
 
 from collections import namedtuple
-from cryptology import ClientWriterStub, Keys, run_client, exceptions
+from cryptology import ClientWriterStub, Keys, run, run_resilient_client
 from datetime import datetime
 from decimal import Decimal
 from typing import Iterable
@@ -72,21 +72,16 @@ async def main():
                         sid += 1
                         await ws.send_signed_message(sequence_id=sid, payload={'@type': 'CancelOrder', 'order_id': order.order_id})
 
-    while True:
-        try:
-            await run_client(
-                client_id='test',
-                client_keys=client_keys,
-                ws_addr=SERVER,
-                server_keys=server_keys,
-                writer=writer,
-                read_callback=read_callback,
-                last_seen_order=0
-            )
-        except exceptions.ServerRestart:
-            asyncio.sleep(60)
+    await run_resilient_client(
+        client_id='test',
+        client_keys=client_keys,
+        ws_addr=SERVER,
+        server_keys=server_keys,
+        writer=writer,
+        read_callback=read_callback,
+        last_seen_order=0
+    )
 
 
 if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    run(main())
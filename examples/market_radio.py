@@ -1,28 +1,25 @@
-import asyncio
 import cryptology
 import logging
 import os
-from aiohttp import WSServerHandshakeError
 from datetime import datetime
 from decimal import Decimal
 from pathlib import Path
-from typing import Optional
 
 
 SERVER = os.getenv('SERVER', 'ws://127.0.0.1:8080')
 NAME = Path(__file__).stem
+TRADE_PAIRS = ('BTC_USD', 'ETH_USD', 'BTC_EUR', 'ETH_EUR',)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(NAME)
 
 
 async def read_order_book(order_id: int, pair: str, buy: dict, sell: dict) -> None:
-    if pair in ('BTC_USD', 'ETH_USD', 'BTC_EUR', 'ETH_EUR',):
-        if len(buy) == 0:
-            logger.error('%s buy order book has size %i @ order %i', pair, len(buy), order_id)
-        if len(sell) == 0:
-            logger.error('%s sell order book has size %i @ order %i', pair, len(sell), order_id)
-        logger.info(f'order book @{order_id}')
+    if len(buy) == 0:
+        logger.error('%s buy order book has size %i @ order %i', pair, len(buy), order_id)
+    if len(sell) == 0:
+        logger.error('%s sell order book has size %i @ order %i', pair, len(sell), order_id)
+    logger.info(f'order book @{order_id}')
     logger.info(f'sell orders of {pair} @{order_id}: {sell}')
     logger.info(f'buy orders of {pair} @{order_id}: {buy}')
 
@@ -32,28 +29,17 @@ async def read_trades(ts: datetime, order_id: int, pair: str, amount: Decimal, p
     logger.info(f'{ts}@{order_id} a buy of {amount} {currencies[0]} for {price} {currencies[1]} took place')
 
 
-async def main(loop: Optional[asyncio.AbstractEventLoop] = None):
+async def main():
     logger.info(f'connecting to {SERVER}')
 
-    while True:
-        try:
-            await cryptology.run_market_data(
-                ws_addr=SERVER,
-                market_data_callback=None,
-                order_book_callback=read_order_book,
-                trades_callback=read_trades,
-                loop=loop
-            )
-        except cryptology.exceptions.RateLimit:
-            logger.error('rate limit reached')
-        except cryptology.exceptions.ServerRestart:
-            logger.warning('server restart')
-            await asyncio.sleep(80)
-        except (cryptology.exceptions.Disconnected, WSServerHandshakeError) as ex:
-            logger.error(ex)
-            await asyncio.sleep(30)
+    await cryptology.run_resilient_market_data(
+        ws_addr=SERVER,
+        market_data_callback=None,
+        order_book_callback=read_order_book,
+        trades_callback=read_trades,
+        trade_pairs=TRADE_PAIRS
+    )
 
 
 if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main(loop=loop))
+    cryptology.run(main())
@@ -3,12 +3,10 @@ import logging
 import os
 import random
 
-from aiohttp import WSServerHandshakeError, ClientConnectorError
-from cryptology import ClientWriterStub, Keys, run_client, exceptions
+from cryptology import ClientWriterStub, Keys, run, run_resilient_client, exceptions
 from datetime import datetime
 from decimal import Context, ROUND_DOWN, Decimal
 from pathlib import Path
-from typing import Optional
 
 
 SERVER = os.getenv('SERVER', 'ws://127.0.0.1:8080')
@@ -53,39 +51,27 @@ async def throttling(level: int, sequence_id: int, order_id: int) -> bool:
     return False
 
 
-async def main(loop: Optional[asyncio.AbstractEventLoop] = None):
+async def main():
     random.seed()
     client_keys = Keys.load(NAME + '.pub', NAME + '.priv')
     server_keys = Keys.load('cryptology.pub', None)
 
     logger.info(f'connecting to {SERVER}')
 
-    while True:
-        try:
-            await run_client(
-                client_id=NAME,
-                client_keys=client_keys,
-                ws_addr=SERVER,
-                server_keys=server_keys,
-                writer=writer,
-                read_callback=read_callback,
-                throttling_callback=throttling,
-                last_seen_order=-1,
-                loop=loop
-            )
-        except exceptions.RateLimit:
-            logger.error('rate limit reached')
-        except exceptions.ServerRestart:
-            logger.warning('server restart')
-            await asyncio.sleep(80)
-        except exceptions.InvalidKey:
-            logger.critical('the public key does not match client name')
-            break
-        except (exceptions.CryptologyConnectionError, ClientConnectorError, WSServerHandshakeError) as ex:
-            logger.error(ex)
-            await asyncio.sleep(30)
+    try:
+        await run_resilient_client(
+            client_id=NAME,
+            client_keys=client_keys,
+            ws_addr=SERVER,
+            server_keys=server_keys,
+            writer=writer,
+            read_callback=read_callback,
+            throttling_callback=throttling,
+            last_seen_order=-1
+        )
+    except exceptions.InvalidKey:
+        logger.critical('the public key does not match client name')
 
 
 if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main(loop=loop))
+    run(main())
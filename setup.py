@@ -22,6 +22,9 @@ setup(
     extras_require={
         'devel': ['pytz',
                   'pytest-aiohttp'
-                  ]
+                  ],
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'uvloop': ['uvloop'],
     }
 )
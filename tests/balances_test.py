@@ -0,0 +1,106 @@
+import pytest
+
+from decimal import Decimal
+from typing import Any, Optional
+
+from cryptology import CryptologyError
+from cryptology.balances import BalanceCache
+from cryptology.messages import SetBalance
+
+
+def set_balance(currency: str, balance: str, change: str, reason: str = 'trade') -> dict:
+    return {'@type': 'SetBalance', 'currency': currency, 'balance': balance, 'change': change, 'reason': reason,
+            'time': [946684800, 0]}
+
+
+def own_trade(maker: bool, maker_buy: bool) -> dict:
+    return {'@type': 'OwnTrade', 'trade_pair': 'BTC_USD', 'amount': '2', 'price': '10', 'maker': maker,
+            'maker_buy': maker_buy, 'order_id': 1, 'client_order_id': 1, 'time': [946684800, 0]}
+
+
+def test_received() -> None:
+    balances = BalanceCache()
+    changes = []
+
+    def on_change(balance: Any, payload: Any) -> None:
+        changes.append((balance.currency, balance.available, balance.reserved))
+
+    balances.subscribe(on_change)
+    balances.received(set_balance('USD', '100', '100', 'transfer'))
+    balances.received(SetBalance(set_balance('USD', '70', '-30', 'on_hold')))
+    balances.received(set_balance('BTC', '1', '1', 'transfer'))
+    balances.received(set_balance('BTC', '0.5', '-0.5', 'on_hold'))
+    assert balances.available('USD') == Decimal(70) and balances.reserved('USD') == Decimal(30)
+    assert balances.get('USD').total == Decimal(100)
+    assert balances.available('EUR') == balances.reserved('EUR') == Decimal(0)
+
+    # a buy as maker and a buy as taker release the quote currency, a sell the base one
+    balances.received(own_trade(True, True))
+    balances.received(own_trade(False, False))
+    assert balances.reserved('USD') == Decimal(0)
+    balances.received(own_trade(True, False))
+    assert balances.reserved('BTC') == Decimal(0)
+
+    balances.received({'@type': 'DepositTransactionAccepted', 'currency': 'ETH', 'amount': '1'})
+    assert balances.available('ETH') == Decimal(0) and 'ETH' in balances
+
+    balances.unsubscribe(on_change)
+    balances.received(set_balance('USD', '1', '-69'))
+    balances.received({'@type': 'BuyOrderPlaced', 'order_id': 1})
+    assert changes == [
+        ('USD', 100, 0), ('USD', 70, 30), ('BTC', 1, 0), ('BTC', Decimal('0.5'), Decimal('0.5')),
+        ('USD', 70, 10), ('USD', 70, 0), ('BTC', Decimal('0.5'), 0), ('ETH', 0, 0),
+    ]
+
+
+class Server:
+    """
+    answers `UserBalanceRequest` with `response` after delivering `during` to `balances`
+    """
+    def __init__(self, balances: BalanceCache, response: Any, *during: dict) -> None:
+        self.balances = balances
+        self.response = response
+        self.during = during
+
+    async def send_signed_request(self, *, payload: dict, request_id: Optional[int] = None,
+                                  timeout: Optional[float] = None) -> Any:
+        assert payload == {'@type': 'UserBalanceRequest'}
+        for message in self.during:
+            self.balances.received(message)
+        return self.response
+
+
+@pytest.mark.asyncio
+async def test_refresh() -> None:
+    balances = BalanceCache()
+    balances.received(set_balance('EUR', '5', '5'))
+    # the response already includes the USD funds put on hold, but not the BTC ones
+    response = {'@type': 'UserBalanceResponse', 'account_id': 'user', 'balances': {
+        'BTC': {'available': '3.1415', 'on_hold': '42'},
+        'USD': {'available': 900, 'on_hold': 100},
+    }}
+    await balances.refresh(Server(balances, response, set_balance('USD', '900', '-100', 'on_hold'),
+                                  own_trade(False, True), set_balance('BTC', '1.1415', '-2', 'on_hold')))
+    assert sorted(x.currency for x in balances) == ['BTC', 'USD']
+    # only the available funds are applied again, the reserved funds are the ones of the response
+    assert balances.available('BTC') == Decimal('1.1415') and balances.reserved('BTC') == Decimal(42)
+    assert balances.available('USD') == Decimal(900) and balances.reserved('USD') == Decimal(100)
+    assert balances.replay is None
+
+    with pytest.raises(CryptologyError):
+        await balances.refresh(Server(balances, {'@type': 'EchoResponse'}))
+    assert balances.replay is None
+
+
+def test_callback_errors() -> None:
+    balances = BalanceCache()
+    changes = []
+
+    def broken(balance: Any, payload: Any) -> None:
+        raise KeyError('test')
+
+    balances.subscribe(broken)
+    balances.subscribe(lambda balance, payload: changes.append(balance.currency))
+    balances.received(set_balance('USD', '100', '100', 'transfer'))
+    assert changes == ['USD']
+    assert balances.available('USD') == Decimal(100)
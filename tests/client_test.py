@@ -3,17 +3,20 @@ import json
 import os
 from collections import namedtuple
 from datetime import datetime
+from decimal import Decimal
 from typing import Tuple, ClassVar, Any
 
-import xdrlib
 import aiohttp
 import asyncio
 import pytest
 import pytz as pytz
 
-from cryptology import ClientWriterStub, Keys, run_client, exceptions, crypto, RateLimit, CryptologyError, \
-    InvalidSequence
-from cryptology.common import ServerMessageType
+from cryptology import ClientWriterStub, codec, Keys, run_client, exceptions, crypto, RateLimit, CryptologyError, \
+    InvalidSequence, Backoff, ClientPool, MessageDecoder, SessionState, run_resilient_client, messages, parallel, \
+    connect, BalanceCache, OrderTracker, PipelineMetrics, Recorder, RoundTripTracker, replay_client
+from cryptology.common import ClientMessageType
+from cryptology.outbound import TokenBucket
+from cryptology.replay import ReplayProtocolClient
 
 
 SERVER_PORT = 8082
@@ -55,6 +58,11 @@ class AuthProtocol(aiohttp.web.WebSocketResponse):
     server_cipher: crypto.Cipher
     client_id: str
     ACTIVE_HANDLERS: ClassVar[TrackingList] = TrackingList()
+    RECEIVED_MESSAGES: ClassVar[list] = []
+    HANDSHAKES: ClassVar[list] = []
+    USER_ORDERS: ClassVar[dict] = {}
+    USER_BALANCES: ClassVar[dict] = {}
+    BALANCE_UPDATES: ClassVar[list] = []
     error_code: ClassVar[int] = None
 
     def __init__(self, server_keys: crypto.Keys) -> None:
@@ -65,8 +73,8 @@ class AuthProtocol(aiohttp.web.WebSocketResponse):
         self.server_cipher = crypto.Cipher(self.symmetric_key)
         self.client_version = 1
 
-    async def send_message(self, xdr: xdrlib.Packer) -> None:
-        await self.send_bytes(self.server_cipher.encrypt(xdr.get_buffer()))
+    async def send_message(self, frame: bytes) -> None:
+        await self.send_bytes(self.server_cipher.encrypt(frame))
 
     async def run(self, request: aiohttp.web.BaseRequest) -> 'AuthProtocol':
         await self.prepare(request)
@@ -74,20 +82,21 @@ class AuthProtocol(aiohttp.web.WebSocketResponse):
         with self.ACTIVE_HANDLERS.track(self):
             self.client_id, sequence_id, last_seen_order, client_keys, client_cipher = \
                 await self._crypto_handshake()
-            await self.process_error_code()
+            self.HANDSHAKES.append(last_seen_order)
+            client_messages = asyncio.ensure_future(self.process_client_messages(client_cipher))
+            try:
+                await self.process_error_code()
+            finally:
+                client_messages.cancel()
         return self
 
     async def _crypto_handshake(self) -> Tuple[str, int, int, crypto.Keys, crypto.Cipher]:
         data = await self.receive_bytes(timeout=3)
-        unpacker = xdrlib.Unpacker(self.server_keys.decrypt(data))
-        client_id = unpacker.unpack_bytes().decode('ascii')
-
-        last_seen_order = unpacker.unpack_hyper()
-        client_aes_key = unpacker.unpack_bytes()
-        try:
-            self.client_version = unpacker.unpack_uint()
-        except EOFError:
-            pass
+        client_id, last_seen_order, client_aes_key, client_version = \
+            codec.decode_client_handshake(self.server_keys.decrypt(data))
+        client_id = str(client_id, 'ascii')
+        if client_version is not None:
+            self.client_version = client_version
 
         client_keys = CLIENT_TEST_KEYS
         if client_keys is None:
@@ -96,16 +105,36 @@ class AuthProtocol(aiohttp.web.WebSocketResponse):
         sequence_id = 1
 
         data_to_sign = os.urandom(32)
-        packer = xdrlib.Packer()
-        packer.pack_bytes(data_to_sign)
-        packer.pack_hyper(sequence_id)
-        packer.pack_bytes(self.symmetric_key)
-        await self.send_bytes(client_keys.encrypt(packer.get_buffer()))
+        await self.send_bytes(client_keys.encrypt(
+            codec.encode_server_handshake(data_to_sign, sequence_id, self.symmetric_key)))
 
         signature = await self.receive_bytes(timeout=3)
         client_keys.verify(signature, data_to_sign)
 
-        return client_id, sequence_id, last_seen_order, client_keys, crypto.Cipher(client_aes_key)
+        return client_id, sequence_id, last_seen_order, client_keys, crypto.Cipher(bytes(client_aes_key))
+
+    async def process_client_messages(self, client_cipher: crypto.Cipher) -> None:
+        async for msg in self:
+            if msg.type != aiohttp.WSMsgType.BINARY:
+                break
+            message_type, request_id, payload = codec.decode_client_message(client_cipher.decrypt(msg.data))
+            payload = json.loads(str(payload, 'utf-8'))
+            if message_type == ClientMessageType.RPC_REQUEST.value:
+                asyncio.ensure_future(self._send_rpc_response(request_id, payload))
+            else:
+                self.RECEIVED_MESSAGES.append((request_id, payload))
+
+    async def _send_rpc_response(self, request_id: int, payload: dict) -> None:
+        await asyncio.sleep(payload.get('delay', 0))
+        if payload.get('@type') == 'UserOrdersRequest':
+            response = {'@type': 'UserOrdersResponse', 'order_books': self.USER_ORDERS}
+        elif payload.get('@type') == 'UserBalanceRequest':
+            for order_id, update in self.BALANCE_UPDATES:
+                await self._send_test_order(order_id, datetime.now(), update)
+            response = {'@type': 'UserBalanceResponse', 'balances': self.USER_BALANCES}
+        else:
+            response = {'@type': 'EchoResponse', 'request': payload}
+        await self.send_message(codec.encode_rpc_response(request_id, json.dumps(response).encode('utf-8')))
 
     async def process_error_code(self):
         while True:
@@ -119,10 +148,7 @@ class AuthProtocol(aiohttp.web.WebSocketResponse):
     @classmethod
     async def shutdown(cls):
         assert cls.ACTIVE_HANDLERS
-        await asyncio.wait(
-            [ws.close(code=1012) for ws in cls.ACTIVE_HANDLERS],
-            return_when=asyncio.ALL_COMPLETED
-        )
+        await asyncio.gather(*[ws.close(code=1012) for ws in cls.ACTIVE_HANDLERS])
 
     @classmethod
     def prepare_error_code(cls, error_code):
@@ -134,18 +160,11 @@ class AuthProtocol(aiohttp.web.WebSocketResponse):
     @classmethod
     async def send_test_order(cls, order_id: int, ts: datetime, payload: dict):
         assert cls.ACTIVE_HANDLERS
-        await asyncio.wait(
-            [ws._send_test_order(order_id, ts, payload) for ws in cls.ACTIVE_HANDLERS],
-            return_when=asyncio.ALL_COMPLETED
-        )
+        await asyncio.gather(*[ws._send_test_order(order_id, ts, payload) for ws in cls.ACTIVE_HANDLERS])
 
     async def _send_test_order(self, order_id: int, ts: datetime, payload: dict):
-        packer = xdrlib.Packer()
-        packer.pack_enum(ServerMessageType.OUTBOX_MESSAGE.value)
-        packer.pack_hyper(order_id)
-        packer.pack_double(ts.timestamp())
-        packer.pack_string(json.dumps(payload).encode('utf-8'))
-        await self.send_message(packer)
+        await self.send_message(codec.encode_outbox_message(order_id, ts.timestamp(),
+                                                            json.dumps(payload).encode('utf-8')))
 
 
 async def create_test_server(loop: asyncio.AbstractEventLoop) -> asyncio.AbstractServer:
@@ -165,11 +184,12 @@ async def test_connect() -> None:
 
     loop = asyncio.get_event_loop()
 
-    try:
-        server = await create_test_server(loop)
-        loop.call_later(1, server.close)
+    server = await create_test_server(loop)
+    loop.call_later(1, server.close)
 
-        client_coro = run_client(
+    try:
+        # the session ends without an error once the writer returns
+        await asyncio.wait_for(run_client(
             client_id='test',
             client_keys=CLIENT_TEST_KEYS,
             ws_addr=SERVER_URL,
@@ -177,16 +197,7 @@ async def test_connect() -> None:
             writer=writer,
             read_callback=read_callback,
             last_seen_order=0
-        )
-
-        task = loop.create_task(client_coro)
-        loop.call_later(2, task.cancel)
-
-        try:
-            with pytest.raises(exceptions.Disconnected):
-                await task
-        except asyncio.CancelledError:
-            pass
+        ), 1)
     finally:
         await server.wait_closed()
 
@@ -337,3 +348,681 @@ async def test_order_receiving() -> None:
         raise assertion_error
     assert test_finished
 
+
+async def test_rpc_requests() -> None:
+    responses = {}
+    timed_out = False
+    pending_after_timeout = None
+    rpc_sent = 0
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        async def request(n: int) -> None:
+            responses[n] = await ws.send_signed_request(payload={'@type': 'Echo', 'n': n, 'delay': (20 - n) / 100})
+
+        await asyncio.gather(*(request(n) for n in range(20)))
+        nonlocal rpc_sent
+        rpc_sent = ws.outbound.sent
+
+        try:
+            await ws.send_signed_request(payload={'@type': 'Echo', 'delay': 1}, timeout=.1)
+        except asyncio.TimeoutError:
+            nonlocal timed_out, pending_after_timeout
+            timed_out = True
+            pending_after_timeout = len(ws.rpc_futures)
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(4, server.close)
+
+    client_coro = run_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        last_seen_order=0
+    )
+
+    task = loop.create_task(client_coro)
+    loop.call_later(3, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert sorted(responses) == list(range(20))
+    for n, response in responses.items():
+        assert response['@type'] == 'EchoResponse'
+        assert response['request']['n'] == n
+    assert timed_out
+    assert pending_after_timeout == 0
+    # requests go through the paced outbound queue
+    assert rpc_sent == 20
+
+
+async def test_message_sending() -> None:
+    AuthProtocol.RECEIVED_MESSAGES.clear()
+    outbound_stats = None
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        for n in range(50):
+            sequence_id += 1
+            await ws.send_signed_message(sequence_id=sequence_id, payload={'@type': 'CancelOrder', 'order_id': n})
+        await ws.outbound.flush()
+        nonlocal outbound_stats
+        outbound_stats = ws.outbound.stats()
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+
+    client_coro = run_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        last_seen_order=0
+    )
+
+    task = loop.create_task(client_coro)
+    loop.call_later(2, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert [sequence_id for sequence_id, _ in AuthProtocol.RECEIVED_MESSAGES] == list(range(2, 52))
+    assert [payload['order_id'] for _, payload in AuthProtocol.RECEIVED_MESSAGES] == list(range(50))
+    assert outbound_stats['sent'] == 50
+
+
+async def test_close_flushes_outbound() -> None:
+    AuthProtocol.RECEIVED_MESSAGES.clear()
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        for n in range(200):
+            sequence_id += 1
+            await ws.send_signed_message(sequence_id=sequence_id, payload={'@type': 'CancelOrder', 'order_id': n})
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+
+    await asyncio.wait_for(run_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        last_seen_order=0,
+        pacing=TokenBucket(rate=500)
+    ), 2)
+    await server.wait_closed()
+
+    assert [payload['order_id'] for _, payload in AuthProtocol.RECEIVED_MESSAGES] == list(range(200))
+
+
+async def test_close_after_disconnect() -> None:
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        for n in range(100):
+            sequence_id += 1
+            await ws.send_signed_message(sequence_id=sequence_id, payload={'@type': 'CancelOrder', 'order_id': n})
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+    loop.call_later(1, lambda: loop.create_task(AuthProtocol.shutdown()))
+
+    # frames the server won't take anymore don't hold up the close
+    with pytest.raises(exceptions.ServerRestart):
+        await asyncio.wait_for(run_client(
+            client_id='test',
+            client_keys=CLIENT_TEST_KEYS,
+            ws_addr=SERVER_URL,
+            server_keys=SERVER_TEST_KEYS,
+            writer=writer,
+            read_callback=read_callback,
+            pacing=TokenBucket(rate=10)
+        ), 2)
+    await server.wait_closed()
+
+
+async def test_resume() -> None:
+    AuthProtocol.RECEIVED_MESSAGES.clear()
+    AuthProtocol.HANDSHAKES.clear()
+    state = SessionState()
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        if state.connections == 1:
+            for n in range(3):
+                sequence_id += 1
+                await ws.send_signed_message(sequence_id=sequence_id, payload={'@type': 'CancelOrder', 'order_id': n})
+        else:
+            await ws.send_signed_message(sequence_id=sequence_id + 1, payload={'@type': 'CancelOrder', 'order_id': 3})
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(4, server.close)
+    loop.call_later(.5, lambda: loop.create_task(AuthProtocol.send_test_order(1000, datetime.now(), {'test': 1})))
+    loop.call_later(1, lambda: loop.create_task(AuthProtocol.shutdown()))
+
+    client_coro = run_resilient_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        state=state,
+        backoff=Backoff(initial=.05, maximum=.1, restart_delay=.1)
+    )
+
+    task = loop.create_task(client_coro)
+    loop.call_later(3, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert state.connections == 2
+    assert AuthProtocol.HANDSHAKES == [0, 1000]
+    # the test server never acknowledges, so the second connection resends everything
+    assert [sequence_id for sequence_id, _ in AuthProtocol.RECEIVED_MESSAGES] == [2, 3, 4, 2, 3, 4, 5]
+    assert [payload['order_id'] for _, payload in AuthProtocol.RECEIVED_MESSAGES] == [0, 1, 2, 0, 1, 2, 3]
+
+
+async def test_reconnect_after_writer_error() -> None:
+    state = SessionState()
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        if state.connections == 1:
+            # the socket fails under the writer before the reader notices
+            async def send_bytes(data: bytes) -> None:
+                raise ConnectionResetError()
+
+            ws.outbound.send_bytes = send_bytes
+            for n in range(2):
+                sequence_id += 1
+                await ws.send_signed_message(sequence_id=sequence_id, payload={'@type': 'CancelOrder', 'order_id': n})
+                await ws.outbound.flush()
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+
+    task = loop.create_task(run_resilient_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        state=state,
+        backoff=Backoff(initial=.05, maximum=.1)
+    ))
+    loop.call_later(2, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert state.connections == 2
+
+
+async def test_resume_after_queued_callbacks() -> None:
+    state = SessionState()
+    handled = []
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        await asyncio.sleep(.05)
+        handled.append(order)
+
+    async def send_orders() -> None:
+        for order in range(1, 101):
+            await AuthProtocol.send_test_order(order, datetime.now(), {'@type': 'OwnTrade', 'order_id': order})
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+    loop.call_later(.5, lambda: loop.create_task(send_orders()))
+    loop.call_later(1, lambda: loop.create_task(AuthProtocol.shutdown()))
+
+    with pytest.raises(exceptions.ServerRestart):
+        await asyncio.wait_for(run_client(
+            client_id='test',
+            client_keys=CLIENT_TEST_KEYS,
+            ws_addr=SERVER_URL,
+            server_keys=SERVER_TEST_KEYS,
+            writer=writer,
+            read_callback=read_callback,
+            state=state
+        ), 2)
+    await server.wait_closed()
+
+    # the callbacks still queued at the disconnect are cancelled, so their messages are received again
+    assert 0 < len(handled) < 100
+    assert state.last_outbox_id == len(handled)
+    assert handled == list(range(1, len(handled) + 1))
+
+
+async def test_pool() -> None:
+    AuthProtocol.RECEIVED_MESSAGES.clear()
+    AuthProtocol.HANDSHAKES.clear()
+    # more accounts than the 100 connections of aiohttp's default connector
+    client_ids = sorted(f'test{n}' for n in range(110))
+    responses = {}
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(5, server.close)
+
+    pool = ClientPool(ws_addr=SERVER_URL, server_keys=SERVER_TEST_KEYS, read_callback=read_callback,
+                      max_handshakes=2)
+    for client_id in client_ids:
+        pool.add(client_id, CLIENT_TEST_KEYS)
+
+    async def drive() -> None:
+        while len(pool.connections) < len(client_ids):
+            await asyncio.sleep(.05)
+        for client_id in client_ids:
+            await pool.send_signed_message(client_id, sequence_id=2, payload={'@type': 'Ping', 'client': client_id})
+            responses[client_id] = await pool.send_signed_request(client_id, payload={'client': client_id})
+        await asyncio.sleep(10)
+
+    task = loop.create_task(parallel.run_parallel((pool.run(), drive())))
+    loop.call_later(4, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert len(AuthProtocol.HANDSHAKES) == len(client_ids)
+    assert sorted(payload['client'] for _, payload in AuthProtocol.RECEIVED_MESSAGES) == client_ids
+    assert {client_id: response['request']['client'] for client_id, response in responses.items()} == \
+        {client_id: client_id for client_id in client_ids}
+    assert not pool.connections and not pool.tasks
+
+
+async def test_typed_messages() -> None:
+    received = []
+    state = SessionState()
+    metrics = PipelineMetrics()
+    round_trips = RoundTripTracker()
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        await ws.send_signed_message(sequence_id=sequence_id + 1, payload={
+            '@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'amount': '1.5', 'price': '1',
+            'client_order_id': 7, 'ttl': 0})
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        received.append((order, payload))
+
+    async def send_orders() -> None:
+        await AuthProtocol.send_test_order(1, datetime.now(), {'@type': 'SetBalance', 'balance': '1'})
+        await AuthProtocol.send_test_order(2, datetime.now(), {'@type': 'BuyOrderPlaced', 'amount': '1.5',
+                                                               'trade_pair': 'BTC_USD', 'client_order_id': 7})
+        await AuthProtocol.send_test_order(3, datetime.now(), {'@type': 'SetBalance', 'balance': '2'})
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+    loop.call_later(1, lambda: loop.create_task(send_orders()))
+
+    client_coro = run_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        state=state,
+        decoder=MessageDecoder(['BuyOrderPlaced']),
+        metrics=metrics,
+        round_trips=round_trips
+    )
+
+    task = loop.create_task(client_coro)
+    loop.call_later(2, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert len(received) == 1
+    order, payload = received[0]
+    assert order == 2
+    assert isinstance(payload, messages.BuyOrderPlaced)
+    assert payload.amount == Decimal('1.5')
+    assert metrics['decode'].count == metrics['exchange'].count == 3
+    assert metrics['callback'].count == 1
+    assert round_trips.to_dict()['BTC_USD']['PlaceBuyLimitOrder']['count'] == 1
+    assert state.last_outbox_id == 3
+
+
+async def test_order_tracker() -> None:
+    orders = OrderTracker()
+    loaded = []
+    AuthProtocol.USER_ORDERS = {'BTC_USD': {'buy': [{'order_id': 1, 'amount': 2, 'price': 3, 'client_order_id': 5}],
+                                            'sell': []}}
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        loaded.append([order.order_id for order in orders])
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        pass
+
+    async def send_orders() -> None:
+        await AuthProtocol.send_test_order(1, datetime.now(), {
+            '@type': 'SellOrderPlaced', 'order_id': 2, 'client_order_id': 7, 'trade_pair': 'BTC_USD',
+            'amount': '1.5', 'initial_amount': '1.5', 'price': '4', 'closed_inline': False})
+        await AuthProtocol.send_test_order(2, datetime.now(), {
+            '@type': 'SellOrderAmountChanged', 'order_id': 2, 'client_order_id': 7, 'trade_pair': 'BTC_USD',
+            'amount': '0.5', 'fee': '0'})
+        await AuthProtocol.send_test_order(3, datetime.now(), {
+            '@type': 'BuyOrderCancelled', 'order_id': 1, 'client_order_id': 5, 'trade_pair': 'BTC_USD'})
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+    loop.call_later(1, lambda: loop.create_task(send_orders()))
+
+    client_coro = run_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        read_callback=read_callback,
+        decoder=MessageDecoder(['SetBalance']),
+        orders=orders
+    )
+
+    task = loop.create_task(client_coro)
+    loop.call_later(2, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        AuthProtocol.USER_ORDERS = {}
+    await server.wait_closed()
+
+    assert loaded == [[1]]
+    assert [order.order_id for order in orders] == [2]
+    order = orders.get_by_client_order_id(7)
+    assert not order.buy and order.amount == Decimal('0.5') and order.initial_amount == Decimal('1.5')
+    assert orders.get(1) is None
+
+
+async def test_observer_errors() -> None:
+    ws = ReplayProtocolClient(None)
+    seen = []
+
+    def broken(payload: dict) -> None:
+        raise KeyError('test')
+
+    ws.observers = (broken, seen.append)
+    frame = codec.encode_outbox_message(1, datetime.now().timestamp(), b'{"@type": "OwnTrade"}')
+    outbox_id, _, payload = await ws._handle_outbox_message(memoryview(frame))
+    assert outbox_id == 1
+    assert seen == [payload] == [{'@type': 'OwnTrade'}]
+
+
+async def test_batch_read_callback() -> None:
+    batches = []
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        await asyncio.sleep(10)
+
+    async def batch_read_callback(ws: ClientWriterStub, batch: list) -> None:
+        batches.append([order for order, _, _ in batch])
+        await asyncio.sleep(.01)
+
+    async def send_orders() -> None:
+        for order in range(1, 201):
+            await AuthProtocol.send_test_order(order, datetime.now(), {'@type': 'OwnTrade', 'order_id': order})
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+    loop.call_later(1, lambda: loop.create_task(send_orders()))
+
+    client_coro = run_client(
+        client_id='test',
+        client_keys=CLIENT_TEST_KEYS,
+        ws_addr=SERVER_URL,
+        server_keys=SERVER_TEST_KEYS,
+        writer=writer,
+        batch_read_callback=batch_read_callback,
+        batch_size=50
+    )
+
+    task = loop.create_task(client_coro)
+    loop.call_later(2, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert [order for batch in batches for order in batch] == list(range(1, 201))
+    assert all(0 < len(batch) <= 50 for batch in batches)
+    assert len(batches) < 200
+
+
+async def test_stream() -> None:
+    AuthProtocol.RECEIVED_MESSAGES.clear()
+    received = []
+
+    async def send_orders() -> None:
+        for order in range(1, 11):
+            await AuthProtocol.send_test_order(order, datetime.now(), {'@type': 'OwnTrade', 'order_id': order})
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+
+    async def consume() -> None:
+        async with connect(client_id='test', client_keys=CLIENT_TEST_KEYS, ws_addr=SERVER_URL,
+                           server_keys=SERVER_TEST_KEYS, buffer_size=4) as conn:
+            assert await conn.send({'@type': 'CancelOrder', 'order_id': 1}) == 2
+            response = await conn.send_signed_request(payload={'@type': 'Echo'})
+            assert response['@type'] == 'EchoResponse'
+            loop.create_task(send_orders())
+            async for order, ts, payload in conn.outbox():
+                received.append((order, payload['order_id']))
+
+    task = loop.create_task(consume())
+    loop.call_later(2, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await server.wait_closed()
+
+    assert received == [(order, order) for order in range(1, 11)]
+    assert AuthProtocol.RECEIVED_MESSAGES == [(2, {'@type': 'CancelOrder', 'order_id': 1})]
+
+
+async def test_balance_cache() -> None:
+    balances = BalanceCache()
+    changes = []
+    balances.subscribe(lambda balance, payload: changes.append((balance.currency, payload['@type'])))
+    AuthProtocol.USER_BALANCES = {'USD': {'available': '100', 'on_hold': '10'}}
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+
+    try:
+        async with connect(client_id='test', client_keys=CLIENT_TEST_KEYS, ws_addr=SERVER_URL,
+                           server_keys=SERVER_TEST_KEYS, decoder=MessageDecoder(['OwnTrade']),
+                           balances=balances) as conn:
+            assert balances.available('USD') == Decimal(100) and balances.reserved('USD') == Decimal(10)
+            await AuthProtocol.send_test_order(1, datetime.now(), {
+                '@type': 'SetBalance', 'currency': 'USD', 'balance': '90', 'change': '-10', 'reason': 'on_hold'})
+            await AuthProtocol.send_test_order(2, datetime.now(), {
+                '@type': 'OwnTrade', 'trade_pair': 'BTC_USD', 'amount': '2', 'price': '5', 'maker': False,
+                'maker_buy': False, 'order_id': 1, 'client_order_id': 1})
+            async for order, ts, payload in conn.outbox():
+                assert order == 2 and payload.type == 'OwnTrade'
+                break
+    finally:
+        AuthProtocol.USER_BALANCES = {}
+        server.close()
+    await server.wait_closed()
+
+    assert balances.available('USD') == Decimal(90) and balances.reserved('USD') == Decimal(10)
+    assert changes == [('USD', 'UserBalanceResponse'), ('USD', 'SetBalance'), ('USD', 'OwnTrade')]
+
+
+async def test_stream_loading_trackers() -> None:
+    state = SessionState()
+    received = []
+    AuthProtocol.USER_BALANCES = {'USD': {'available': '100', 'on_hold': '0'}}
+    # more messages arrive while the balances are loaded than fit in the buffer
+    AuthProtocol.BALANCE_UPDATES = [(order, {'@type': 'SetBalance', 'currency': 'USD', 'balance': str(100 - order),
+                                             'change': '-1', 'reason': 'on_hold'}) for order in range(1, 11)]
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+
+    async def consume() -> None:
+        async with connect(client_id='test', client_keys=CLIENT_TEST_KEYS, ws_addr=SERVER_URL,
+                           server_keys=SERVER_TEST_KEYS, balances=BalanceCache(), state=state,
+                           buffer_size=2) as conn:
+            async for order, ts, payload in conn.outbox():
+                # the message being handled isn't counted yet
+                assert state.last_outbox_id == order - 1
+                received.append(order)
+                if order == 10:
+                    break
+
+    try:
+        await asyncio.wait_for(consume(), 2)
+    finally:
+        AuthProtocol.USER_BALANCES = {}
+        AuthProtocol.BALANCE_UPDATES = []
+        server.close()
+    await server.wait_closed()
+
+    assert received == list(range(1, 11))
+    assert state.last_outbox_id == 9
+
+
+async def test_recording(tmpdir) -> None:
+    path = str(tmpdir.join('client.rec'))
+    received = []
+    replayed = []
+
+    async def writer(ws: ClientWriterStub, sequence_id: int) -> None:
+        await asyncio.sleep(10)
+
+    async def read_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        received.append((order, payload['order_id']))
+
+    async def replay_callback(ws: ClientWriterStub, order: int, ts: datetime, payload: dict) -> None:
+        await asyncio.sleep(.01)
+        replayed.append((order, payload['order_id']))
+
+    async def send_orders() -> None:
+        for order in range(1, 11):
+            await AuthProtocol.send_test_order(order, datetime.now(), {'@type': 'OwnTrade', 'order_id': order})
+
+    loop = asyncio.get_event_loop()
+
+    server = await create_test_server(loop)
+    loop.call_later(3, server.close)
+    loop.call_later(1, lambda: loop.create_task(send_orders()))
+
+    with Recorder(path) as recorder:
+        task = loop.create_task(run_client(
+            client_id='test',
+            client_keys=CLIENT_TEST_KEYS,
+            ws_addr=SERVER_URL,
+            server_keys=SERVER_TEST_KEYS,
+            writer=writer,
+            read_callback=read_callback,
+            recorder=recorder
+        ))
+        loop.call_later(2, task.cancel)
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await server.wait_closed()
+
+    await replay_client(path, read_callback=replay_callback, speed=100)
+    assert received == [(order, order) for order in range(1, 11)]
+    assert replayed == received
+
+    # at full speed every callback is still queued when the recording ends
+    replayed.clear()
+    await replay_client(path, read_callback=replay_callback)
+    assert replayed == received
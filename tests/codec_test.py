@@ -0,0 +1,109 @@
+import os
+import warnings
+
+import pytest
+
+from cryptology import codec
+from cryptology.common import ClientMessageType, ServerMessageType
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    xdrlib = pytest.importorskip('xdrlib')
+
+PAYLOADS = (b'', b'{}', b'{"@type": "BuyOrderPlaced"}', os.urandom(1023))
+
+
+def test_client_frames() -> None:
+    for payload in PAYLOADS:
+        for message_type, encode in ((ClientMessageType.INBOX_MESSAGE, codec.encode_inbox_message),
+                                     (ClientMessageType.RPC_REQUEST, codec.encode_rpc_request)):
+            packer = xdrlib.Packer()
+            packer.pack_enum(message_type.value)
+            packer.pack_hyper(2 ** 40 + 1)
+            packer.pack_bytes(payload)
+            encoded = encode(2 ** 40 + 1, payload)
+            assert encoded == packer.get_buffer()
+            assert codec.decode_client_message(encoded) == (message_type.value, 2 ** 40 + 1, payload)
+
+
+def test_server_frames() -> None:
+    for payload in PAYLOADS:
+        packer = xdrlib.Packer()
+        packer.pack_enum(ServerMessageType.OUTBOX_MESSAGE.value)
+        packer.pack_hyper(42)
+        packer.pack_double(1530093825.5)
+        packer.pack_string(payload)
+        frame = memoryview(codec.encode_outbox_message(42, 1530093825.5, payload))
+        assert frame == packer.get_buffer()
+        assert codec.decode_message_type(frame) == ServerMessageType.OUTBOX_MESSAGE.value
+        assert codec.decode_outbox_message(frame) == (42, 1530093825.5, payload)
+
+        packer = xdrlib.Packer()
+        packer.pack_enum(ServerMessageType.RPC_RESPONSE.value)
+        packer.pack_hyper(7)
+        packer.pack_string(payload)
+        frame = memoryview(codec.encode_rpc_response(7, payload))
+        assert frame == packer.get_buffer()
+        assert codec.decode_rpc_response(frame) == (7, payload)
+
+        packer = xdrlib.Packer()
+        packer.pack_enum(ServerMessageType.ERROR_MESSAGE.value)
+        packer.pack_int(-1)
+        packer.pack_string(payload)
+        frame = memoryview(codec.encode_error_message(-1, payload))
+        assert frame == packer.get_buffer()
+        assert codec.decode_error_message(frame) == (-1, payload)
+
+        packer = xdrlib.Packer()
+        packer.pack_enum(ServerMessageType.BROADCAST_MESSAGE.value)
+        packer.pack_string(payload)
+        frame = memoryview(codec.encode_broadcast_message(payload))
+        assert frame == packer.get_buffer()
+        assert codec.decode_broadcast_message(frame) == payload
+
+    packer = xdrlib.Packer()
+    packer.pack_enum(ServerMessageType.THROTTLING_MESSAGE.value)
+    packer.pack_int(10)
+    packer.pack_hyper(3)
+    packer.pack_hyper(4)
+    frame = memoryview(codec.encode_throttling_message(10, 3, 4))
+    assert frame == packer.get_buffer()
+    assert codec.decode_throttling_message(frame) == (10, 3, 4)
+
+
+def test_handshake() -> None:
+    key = os.urandom(32)
+
+    packer = xdrlib.Packer()
+    packer.pack_bytes(b'client')
+    packer.pack_hyper(-1)
+    packer.pack_bytes(key)
+    packer.pack_uint(5)
+    encoded = codec.encode_client_handshake(b'client', -1, key, 5)
+    assert encoded == packer.get_buffer()
+    assert codec.decode_client_handshake(encoded) == (b'client', -1, key, 5)
+
+    packer = xdrlib.Packer()
+    packer.pack_bytes(b'sign me')
+    packer.pack_hyper(10)
+    packer.pack_bytes(key)
+    encoded = codec.encode_server_handshake(b'sign me', 10, key)
+    assert encoded == packer.get_buffer()
+    assert codec.decode_server_handshake(encoded) == (b'sign me', 10, key, None)
+    assert codec.decode_server_handshake(codec.encode_server_handshake(b'sign me', 10, key, 5))[3] == 5
+
+
+def test_signed() -> None:
+    packer = xdrlib.Packer()
+    packer.pack_bytes(b'signature')
+    packer.pack_bytes(b'data')
+    encoded = codec.encode_signed(b'signature', b'data')
+    assert encoded == packer.get_buffer()
+    assert codec.decode_signed(encoded) == (b'signature', b'data')
+
+
+def test_truncated_frames() -> None:
+    frame = codec.encode_outbox_message(42, 1530093825.5, b'{"@type": "OwnTrade"}')
+    for size in (0, 3, 10, len(frame) - 4):
+        with pytest.raises(EOFError):
+            codec.decode_outbox_message(memoryview(frame[:size]))
@@ -0,0 +1,12 @@
+import pytest
+
+from cryptology.common import ServerErrorType, ServerMessageType
+
+
+def test_by_value() -> None:
+    for message_type in ServerMessageType:
+        assert ServerMessageType.by_value(message_type.value) is message_type
+    assert ServerErrorType.by_value(-1) is ServerErrorType.UNKNOWN_ERROR
+
+    with pytest.raises(IndexError):
+        ServerMessageType.by_value(0)
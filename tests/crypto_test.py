@@ -1,7 +1,11 @@
+import os
+import pickle
 import pytest
 
-from cryptology import InvalidKey
-from cryptology.crypto import Keys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cryptology import InvalidKey, internal
+from cryptology.crypto import BACKEND, Cipher, Keys, run_in_executor
 
 
 def test_encryption() -> None:
@@ -23,3 +27,75 @@ def test_signing() -> None:
 
     with pytest.raises(InvalidKey):
         assert keys.verify(other_signature, b'test')
+
+
+def test_pickling() -> None:
+    keys = Keys.load('./tests/server_test.pub', './tests/server_test.priv')
+    loaded = pickle.loads(pickle.dumps(keys))
+    assert pickle.loads(pickle.dumps(keys)) is loaded
+    loaded.verify(keys.sign(b'test'), b'test')
+    assert keys.decrypt(loaded.encrypt(b'test')) == b'test'
+
+    public = pickle.loads(pickle.dumps(Keys.load('./tests/server_test.pub', None)))
+    assert public.private is None
+    public.verify(keys.sign(b'test'), b'test')
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('executor_class', (ThreadPoolExecutor, ProcessPoolExecutor))
+async def test_executor(executor_class) -> None:
+    keys = Keys.load('./tests/server_test.pub', './tests/server_test.priv')
+    with executor_class(max_workers=2) as executor:
+        signature = await run_in_executor(executor, keys.sign, b'test')
+        keys.verify(signature, b'test')
+        assert await run_in_executor(executor, keys.decrypt, keys.encrypt(b'test')) == b'test'
+        with pytest.raises(InvalidKey):
+            await run_in_executor(executor, keys.decrypt, b'\0' * 256)
+
+
+def reference_encrypt(key: bytes, iv: bytes, data: bytes) -> bytes:
+    padder = internal.PKCS7(internal.AES.block_size).padder()
+    padded_data = padder.update(data) + padder.finalize()
+    encryptor = internal.Cipher(internal.AES(key), internal.CBC(iv), BACKEND).encryptor()
+    return iv + encryptor.update(padded_data) + encryptor.finalize()
+
+
+def reference_decrypt(key: bytes, data: bytes) -> bytes:
+    decryptor = internal.Cipher(internal.AES(key), internal.CBC(data[:16]), BACKEND).decryptor()
+    plaintext_padded = decryptor.update(data[16:]) + decryptor.finalize()
+    unpadder = internal.PKCS7(internal.AES.block_size).unpadder()
+    return unpadder.update(plaintext_padded) + unpadder.finalize()
+
+
+def test_cipher_wire_compatibility() -> None:
+    key = os.urandom(32)
+    cipher = Cipher(key)
+    for size in range(0, 70):
+        data = os.urandom(size)
+        encrypted = cipher.encrypt(data)
+        assert encrypted == reference_encrypt(key, cipher.iv, data)
+        assert reference_decrypt(key, encrypted) == data
+        assert cipher.decrypt(reference_encrypt(key, os.urandom(16), data)) == data
+        assert cipher.decrypt(encrypted) == data
+
+
+def test_cipher_iv_rotation() -> None:
+    cipher = Cipher(os.urandom(32))
+    cipher.iv_counter = 2
+    first_iv = cipher.iv
+    assert cipher.encrypt(b'test')[:16] == first_iv
+    assert cipher.encrypt(b'test')[:16] != first_iv
+    assert cipher.decrypt(cipher.encrypt(b'test')) == b'test'
+
+
+def test_cipher_invalid_key() -> None:
+    key, iv = os.urandom(32), os.urandom(16)
+    cipher = Cipher(key)
+
+    with pytest.raises(InvalidKey):
+        cipher.decrypt(cipher.encrypt(b'test' * 10)[:-1])
+
+    for block in (b'\x00' * 16, b'\x00' * 15 + b'\x11', b'\x00' * 14 + b'\x01\x02'):
+        encryptor = internal.Cipher(internal.AES(key), internal.CBC(iv), BACKEND).encryptor()
+        with pytest.raises(InvalidKey):
+            cipher.decrypt(iv + encryptor.update(block) + encryptor.finalize())
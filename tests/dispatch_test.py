@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+
+from cryptology.dispatch import CallbackDispatcher, Overflow
+from cryptology.exceptions import CallbackError
+from typing import List
+
+
+@pytest.mark.asyncio
+async def test_ordering_and_concurrency() -> None:
+    dispatcher = CallbackDispatcher(max_concurrency=2)
+    running = 0
+    max_running = 0
+    calls: List[tuple] = []
+
+    async def callback(key: str, n: int) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(.01 * (n % 3))
+        calls.append((key, n))
+        running -= 1
+
+    for n in range(10):
+        for key in ('BTC_USD', 'ETH_USD', 'LTC_USD'):
+            await dispatcher.submit(key, callback, key, n)
+    await dispatcher.join()
+
+    assert max_running == 2
+    assert dispatcher.completed == dispatcher.submitted == 30
+    assert not dispatcher.lanes
+    for key in ('BTC_USD', 'ETH_USD', 'LTC_USD'):
+        assert [n for k, n in calls if k == key] == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_backpressure() -> None:
+    dispatcher = CallbackDispatcher(max_queue_size=2)
+    release = asyncio.Event()
+
+    async def callback() -> None:
+        await release.wait()
+
+    for _ in range(3):
+        await dispatcher.submit(None, callback)
+    assert dispatcher.queue_depth == 2
+
+    blocked = asyncio.ensure_future(dispatcher.submit(None, callback))
+    await asyncio.sleep(.01)
+    assert not blocked.done()
+
+    release.set()
+    await asyncio.wait_for(blocked, 1)
+    await dispatcher.join()
+    assert dispatcher.completed == 4
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest() -> None:
+    dispatcher = CallbackDispatcher()
+    release = asyncio.Event()
+    seen = []
+
+    async def callback(n: int) -> None:
+        await release.wait()
+        seen.append(n)
+
+    for n in range(5):
+        await dispatcher.submit('BTC_USD', callback, n, overflow=Overflow.DROP_OLDEST, max_queue_size=1)
+        if not n:
+            await asyncio.sleep(0)
+    release.set()
+    await dispatcher.join()
+
+    assert seen == [0, 4]
+    assert dispatcher.dropped == 3
+    assert dispatcher.dropped_by_key == {'BTC_USD': 3}
+
+
+@pytest.mark.asyncio
+async def test_errors() -> None:
+    errors = []
+    dispatcher = CallbackDispatcher(error_callback=errors.append, raise_errors=True)
+
+    async def callback() -> None:
+        raise KeyError('test')
+
+    await dispatcher.submit(None, callback)
+    await dispatcher.join()
+    assert dispatcher.failed == 1
+    assert isinstance(errors[0], KeyError)
+
+    with pytest.raises(CallbackError):
+        await dispatcher.submit(None, callback)
+    await dispatcher.submit(None, callback)
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_close() -> None:
+    dispatcher = CallbackDispatcher()
+
+    async def callback() -> None:
+        await asyncio.sleep(10)
+
+    for _ in range(3):
+        await dispatcher.submit(None, callback)
+    await asyncio.sleep(0)
+    await asyncio.wait_for(dispatcher.close(), 1)
+    assert not dispatcher.lanes
+    assert dispatcher.completed == 0
+
+
+@pytest.mark.asyncio
+async def test_shutdown() -> None:
+    dispatcher = CallbackDispatcher(max_concurrency=1)
+    seen = []
+
+    async def callback(n: int) -> None:
+        await asyncio.sleep(.01 if n < 3 else 10)
+        seen.append(n)
+
+    for n in range(5):
+        await dispatcher.submit(None, callback, n)
+    await asyncio.wait_for(dispatcher.shutdown(.2), 1)
+    assert seen == [0, 1, 2]
+    assert dispatcher.cancelled == 2
+    assert not dispatcher.lanes
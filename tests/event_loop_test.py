@@ -0,0 +1,33 @@
+import asyncio
+import pytest
+
+from cryptology import event_loop
+
+
+@pytest.mark.parametrize('name', sorted(event_loop.available_event_loops()))
+def test_run(name: str) -> None:
+    started = []
+
+    async def forever() -> None:
+        started.append(True)
+        await asyncio.sleep(3600)
+
+    async def main() -> int:
+        asyncio.ensure_future(forever())
+        await asyncio.sleep(0)
+        return 42
+
+    assert event_loop.run(main(), event_loop=name) == 42
+    assert started
+
+
+def test_new_event_loop() -> None:
+    loop = event_loop.new_event_loop()
+    try:
+        expected = next(x for x in event_loop.PREFERENCE if x in event_loop.available_event_loops())
+        assert type(loop).__module__.split('.')[0] == expected
+    finally:
+        loop.close()
+
+    with pytest.raises(ValueError):
+        event_loop.new_event_loop('tokio')
@@ -0,0 +1,220 @@
+import aiohttp
+import asyncio
+import json
+import pytest
+
+from decimal import Decimal
+from typing import List, Optional
+
+from cryptology import codec, exceptions
+from cryptology.decode_pool import DecodePool
+from cryptology.dispatch import CallbackDispatcher
+from cryptology.market_data_client import reader_loop
+from cryptology.messages import AnonymousTrade, Subscription
+from cryptology.metrics import PipelineMetrics
+from cryptology.recording import Recorder
+from cryptology.replay import replay_market_data
+from cryptology.stream import MarketDataConnection
+
+
+def order_book(trade_pair: str, order_id: int) -> dict:
+    return {
+        '@type': 'OrderBookAgg',
+        'buy_levels': {'1': '1'},
+        'sell_levels': {'2': '1'},
+        'trade_pair': trade_pair,
+        'current_order_id': order_id,
+    }
+
+
+def trade(trade_pair: str, order_id: int) -> dict:
+    return {
+        '@type': 'AnonymousTrade',
+        'time': [1530093825, 0],
+        'trade_pair': trade_pair,
+        'current_order_id': order_id,
+        'amount': '42.42',
+        'price': '555',
+        'maker_buy': False,
+    }
+
+
+class FakeWebSocket:
+    """
+    replays broadcast payloads and closes the connection
+    """
+    messages: List[aiohttp.WSMessage]
+
+    def __init__(self, payloads: List[dict]) -> None:
+        self.messages = [aiohttp.WSMessage(aiohttp.WSMsgType.BINARY, codec.encode_uint(1), None)]
+        self.messages.extend(
+            aiohttp.WSMessage(aiohttp.WSMsgType.BINARY,
+                              codec.encode_broadcast_message(json.dumps(payload).encode('utf-8')), None)
+            for payload in payloads)
+        self.messages.append(aiohttp.WSMessage(aiohttp.WSMsgType.CLOSE, 1000, None))
+
+    async def receive(self, timeout: Optional[float] = None) -> aiohttp.WSMessage:
+        return self.messages.pop(0)
+
+    async def close(self) -> None:
+        pass
+
+
+PAYLOADS = [
+    order_book('BTC_USD', 1),
+    order_book('ETH_USD', 2),
+    trade('BTC_USD', 3),
+    trade('LTC_USD', 4),
+    {'@type': 'TradesDisabledOnPairs', 'trade_pairs': ['LTC_USD']},
+    order_book('BTC_EUR', 5),
+]
+
+
+async def read(subscription: Optional[Subscription], decode_pool: Optional[DecodePool] = None) -> List[tuple]:
+    received = []
+
+    async def market_data_callback(payload: dict) -> None:
+        received.append(('market_data', payload['@type'], payload.get('trade_pair')))
+
+    async def order_book_callback(order_id: int, pair: str, buy: dict, sell: dict) -> None:
+        received.append(('order_book', order_id, pair))
+
+    async def trades_callback(ts, order_id: int, pair: str, amount: Decimal, price: Decimal) -> None:
+        received.append(('trade', order_id, pair, amount))
+
+    async def trades_state_changed_callback(pairs: List[str], enabled: bool) -> None:
+        received.append(('trades_state', pairs, enabled))
+
+    dispatcher = CallbackDispatcher()
+    with pytest.raises(exceptions.Disconnected):
+        await reader_loop(FakeWebSocket(PAYLOADS), market_data_callback, order_book_callback, trades_callback,
+                          trades_state_changed_callback, dispatcher=dispatcher, subscription=subscription,
+                          decode_pool=decode_pool)
+    await dispatcher.join()
+    return received
+
+
+@pytest.mark.asyncio
+async def test_unfiltered() -> None:
+    received = await read(None)
+    assert [x for x in received if x[0] == 'order_book'] == \
+        [('order_book', 1, 'BTC_USD'), ('order_book', 2, 'ETH_USD'), ('order_book', 5, 'BTC_EUR')]
+    assert len([x for x in received if x[0] == 'market_data']) == len(PAYLOADS)
+
+
+@pytest.mark.asyncio
+async def test_subscription() -> None:
+    subscription = Subscription(['BTC_USD', 'BTC_EUR'], ['OrderBookAgg'], ['TradesDisabledOnPairs'])
+    received = await read(subscription)
+    # trading state callbacks run inline, the others through the dispatcher
+    assert [x for x in received if x[0] == 'order_book'] == [('order_book', 1, 'BTC_USD'), ('order_book', 5, 'BTC_EUR')]
+    assert [x for x in received if x[0] == 'trades_state'] == [('trades_state', ['LTC_USD'], False)]
+    assert not [x for x in received if x[0] == 'trade']
+    assert subscription.skipped == 3
+
+    subscription = Subscription(['LTC_USD'])
+    received = await read(subscription)
+    assert sorted(x for x in received if x[0] in ('order_book', 'trade')) == [('trade', 4, 'LTC_USD', Decimal('42.42'))]
+    assert subscription.skipped == 4
+
+
+@pytest.mark.asyncio
+async def test_decode_pool() -> None:
+    with DecodePool(2, batch_size=2) as pool:
+        # inline and dispatched callbacks may interleave differently, the order per callback is kept
+        received, expected = await read(None, pool), await read(None)
+        for kind in ('market_data', 'order_book', 'trade', 'trades_state'):
+            assert [x for x in received if x[0] == kind] == [x for x in expected if x[0] == kind]
+
+        subscription = Subscription(['BTC_USD', 'BTC_EUR'], ['OrderBookAgg'], ['TradesDisabledOnPairs'])
+        received = await read(subscription, pool)
+        order_books = [x for x in received if x[0] == 'order_book']
+        assert order_books == [('order_book', 1, 'BTC_USD'), ('order_book', 5, 'BTC_EUR')]
+        assert subscription.skipped == 3
+
+
+@pytest.mark.asyncio
+async def test_conflation() -> None:
+    received = []
+
+    async def order_book_callback(order_id: int, pair: str, buy: dict, sell: dict) -> None:
+        received.append((order_id, pair))
+
+    payloads = [order_book('BTC_USD', n) for n in range(5)] + [order_book('ETH_USD', n) for n in range(5, 7)]
+    dispatcher = CallbackDispatcher()
+    metrics = PipelineMetrics()
+    with pytest.raises(exceptions.Disconnected):
+        await reader_loop(FakeWebSocket(payloads), None, order_book_callback, None, None,
+                          dispatcher=dispatcher, conflate=True, metrics=metrics)
+    await dispatcher.join()
+
+    assert sorted(received) == [(4, 'BTC_USD'), (6, 'ETH_USD')]
+    assert dispatcher.dropped_by_key == {('BTC_USD', 'OrderBookAgg'): 4, ('ETH_USD', 'OrderBookAgg'): 1}
+    assert metrics.conflated == dispatcher.dropped_by_key
+
+
+@pytest.mark.asyncio
+async def test_metrics() -> None:
+    async def order_book_callback(order_id: int, pair: str, buy: dict, sell: dict) -> None:
+        pass
+
+    metrics = PipelineMetrics()
+    dispatcher = CallbackDispatcher()
+    with pytest.raises(exceptions.Disconnected):
+        await reader_loop(FakeWebSocket(PAYLOADS), None, order_book_callback, None, None,
+                          dispatcher=dispatcher, metrics=metrics)
+    await dispatcher.join()
+
+    counts = {stage: histogram['count'] for stage, histogram in metrics.to_dict().items()}
+    assert counts == {'receive': len(PAYLOADS), 'decrypt': 0, 'unpack': len(PAYLOADS), 'decode': len(PAYLOADS),
+                      'dispatch': 3, 'callback': 3, 'exchange': 0}
+
+
+@pytest.mark.asyncio
+async def test_streams() -> None:
+    md = MarketDataConnection(ws_addr='ws://127.0.0.1', trade_pairs=['BTC_USD', 'BTC_EUR'], buffer_size=2)
+    md.ws = FakeWebSocket(PAYLOADS)
+    md._start()
+    books = []
+    with pytest.raises(exceptions.Disconnected):
+        async for book in md.order_books(['BTC_USD']):
+            books.append((book.trade_pair, book.current_order_id, book.best_bid()))
+    assert books == [('BTC_USD', 1, (Decimal(1), Decimal(1)))]
+    assert md.books['BTC_EUR'].current_order_id == 5
+
+    md = MarketDataConnection(ws_addr='ws://127.0.0.1')
+    md.ws = FakeWebSocket(PAYLOADS)
+    md._start()
+    trades = []
+    with pytest.raises(exceptions.Disconnected):
+        async for trade in md.trades():
+            assert isinstance(trade, AnonymousTrade)
+            trades.append((trade.trade_pair, trade.amount))
+    assert trades == [('BTC_USD', Decimal('42.42')), ('LTC_USD', Decimal('42.42'))]
+    await md.close()
+
+
+@pytest.mark.asyncio
+async def test_recording(tmpdir) -> None:
+    path = str(tmpdir.join('market_data.rec'))
+    received = []
+    order_books = []
+
+    async def market_data_callback(payload: dict) -> None:
+        received.append(payload)
+
+    async def order_book_callback(order_id: int, pair: str, buy: dict, sell: dict) -> None:
+        await asyncio.sleep(.01)
+        order_books.append((order_id, pair))
+
+    with Recorder(path) as recorder:
+        with pytest.raises(exceptions.Disconnected):
+            await reader_loop(FakeWebSocket(PAYLOADS), None, None, None, None, recorder=recorder)
+        assert recorder.frames == len(PAYLOADS) + 1
+
+    await replay_market_data(path, market_data_callback=market_data_callback,
+                             order_book_callback=order_book_callback)
+    assert received == PAYLOADS
+    # every callback has run when the replay returns
+    assert sorted(order_books) == sorted((x['current_order_id'], x['trade_pair'])
+                                         for x in PAYLOADS if x['@type'] == 'OrderBookAgg')
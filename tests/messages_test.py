@@ -0,0 +1,69 @@
+import json
+
+from datetime import datetime
+from decimal import Decimal
+
+from cryptology import messages
+from cryptology.serialization import get_serializer
+
+BUY_ORDER_PLACED = {
+    '@type': 'BuyOrderPlaced',
+    'amount': '1.5',
+    'initial_amount': '3',
+    'closed_inline': False,
+    'order_id': 1,
+    'price': '0.1',
+    'time': [946684800, 500000],
+    'trade_pair': 'BTC_USD',
+    'client_order_id': 123
+}
+
+SET_BALANCE = {
+    '@type': 'SetBalance',
+    'balance': '1',
+    'change': '1',
+    'currency': 'USD',
+    'reason': 'trade',
+    'time': [946684800, 0]
+}
+
+
+def encode(payload: dict) -> memoryview:
+    return memoryview(json.dumps(payload, indent=1).encode('utf-8'))
+
+
+def test_classify() -> None:
+    assert messages.classify(encode(BUY_ORDER_PLACED)) == 'BuyOrderPlaced'
+    assert messages.classify(b'{"a":{"b":1},"@type":"SetBalance"}') == 'SetBalance'
+    assert messages.classify(b'{"a": 1}') is None
+
+
+def test_typed_message() -> None:
+    message = messages.BuyOrderPlaced(dict(BUY_ORDER_PLACED))
+    assert message.amount == Decimal('1.5')
+    assert message.price == Decimal('0.1')
+    assert message.order_id == 1
+    assert message.closed_inline is False
+    assert message.time == datetime(2000, 1, 1, 0, 0, 0, 500000)
+    assert message.type == 'BuyOrderPlaced'
+    assert message['amount'] == '1.5'
+    assert message.get('missing') is None
+    assert message == BUY_ORDER_PLACED
+
+    assert messages.OwnTrade({'@type': 'OwnTrade'}).amount is None
+
+
+def test_decoder() -> None:
+    loads = get_serializer('json').loads
+    decoder = messages.MessageDecoder(['BuyOrderPlaced'])
+
+    message = decoder.decode(encode(BUY_ORDER_PLACED), loads)
+    assert isinstance(message, messages.BuyOrderPlaced)
+    assert decoder.decode(encode(SET_BALANCE), loads) is None
+    assert isinstance(decoder.decode(encode(SET_BALANCE), loads, {'SetBalance'}), messages.SetBalance)
+    assert (decoder.decoded, decoder.skipped) == (2, 1)
+
+    everything = messages.MessageDecoder()
+    unknown = everything.decode(b'{"@type": "Unknown", "a": 1}', loads)
+    assert type(unknown) is messages.Message
+    assert unknown['a'] == 1
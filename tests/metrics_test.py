@@ -0,0 +1,87 @@
+from cryptology.metrics import Histogram, PipelineMetrics, RoundTripTracker, bucket_index, bucket_value
+
+
+def test_buckets() -> None:
+    for nanoseconds in (0, 1, 31, 32, 33, 1000, 123456, 10 ** 9, 2 ** 40 - 1):
+        index = bucket_index(nanoseconds)
+        assert bucket_value(index) <= nanoseconds < bucket_value(index + 1)
+        assert bucket_value(index + 1) - bucket_value(index) <= max(nanoseconds / 16, 1)
+    assert bucket_index(2 ** 60) == bucket_index(2 ** 40)
+
+
+def test_histogram() -> None:
+    histogram = Histogram()
+    for n in range(1, 1001):
+        histogram.record(n / 1e6)
+    assert histogram.count == 1000
+    assert histogram.min == 1e-6 and histogram.max == 1e-3
+    assert 500e-6 <= histogram.percentile(.5) <= 500e-6 * 17 / 16
+    assert 990e-6 <= histogram.percentile(.99) <= 1e-3
+    assert histogram.percentile(1) == 1e-3
+    assert histogram.to_dict()['p50'] == histogram.percentile(.5)
+
+    histogram.reset()
+    assert histogram.count == 0 and histogram.percentile(.5) == 0.
+
+
+def test_prometheus() -> None:
+    metrics = PipelineMetrics()
+    metrics.record('decode', .001)
+    text = metrics.to_prometheus(labels={'account': 'test'})
+    assert '# TYPE cryptology_stage_seconds summary' in text
+    assert 'cryptology_stage_seconds_count{stage="decode",account="test"} 1\n' in text
+    assert 'cryptology_stage_seconds{stage="decode",account="test",quantile="0.5"} 0.001000000\n' in text
+
+
+def test_round_trips() -> None:
+    tracker = RoundTripTracker()
+    tracker.sent(1, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'client_order_id': 10})
+    tracker.sent(2, {'@type': 'PlaceSellLimitOrder', 'trade_pair': 'ETH_USD', 'client_order_id': 11})
+    tracker.sent(3, {'@type': 'CancelOrder', 'order_id': 5})
+    tracker.sent(4, {'@type': 'CancelAllOrders'})
+    assert len(tracker.pending) == 3
+
+    tracker.received({'@type': 'SetBalance', 'currency': 'USD'})
+    tracker.received({'@type': 'BuyOrderPlaced', 'trade_pair': 'BTC_USD', 'client_order_id': 10, 'order_id': 1})
+    tracker.received({'@type': 'InsufficientFunds', 'order_id': 11, 'currency': 'ETH'})
+    tracker.received({'@type': 'SellOrderCancelled', 'trade_pair': 'LTC_USD', 'order_id': 5, 'client_order_id': 3})
+    tracker.received({'@type': 'BuyOrderPlaced', 'trade_pair': 'BTC_USD', 'client_order_id': 10, 'order_id': 1})
+    assert not tracker.pending
+
+    stats = tracker.to_dict()
+    assert stats['BTC_USD']['PlaceBuyLimitOrder']['count'] == 1
+    assert stats['ETH_USD']['PlaceSellLimitOrder']['count'] == 1
+    assert stats['LTC_USD']['CancelOrder']['count'] == 1
+    assert 'order_type="PlaceBuyLimitOrder"' in tracker.to_prometheus()
+
+
+def test_round_trip_matching() -> None:
+    tracker = RoundTripTracker()
+    # without a client_order_id the answer can't be matched
+    tracker.sent(1, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD'})
+    tracker.sent(2, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'client_order_id': 10})
+    tracker.sent(3, {'@type': 'CancelOrder', 'order_id': 10})
+    assert list(tracker.pending) == [('client_order_id', 10), ('order_id', 10)]
+
+    tracker.received({'@type': 'InsufficientFunds', 'order_id': 10, 'currency': 'USD'})
+    assert list(tracker.pending) == [('order_id', 10)]
+    assert tracker.to_dict()['BTC_USD']['PlaceBuyLimitOrder']['count'] == 1
+
+
+def test_round_trip_expiry() -> None:
+    tracker = RoundTripTracker()
+    tracker.sent(1, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'client_order_id': 10})
+    sent_at = tracker.pending['client_order_id', 10].sent_at
+    # resending after a reconnect keeps the send time
+    tracker.sent(1, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'client_order_id': 10})
+    assert tracker.pending['client_order_id', 10].sent_at == sent_at
+
+    tracker.timeout = 0.
+    tracker.sent(2, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'client_order_id': 11})
+    assert tracker.expired == 1
+    assert list(tracker.pending) == [('client_order_id', 11)]
+
+    tracker = RoundTripTracker(window=0.)
+    tracker.sent(1, {'@type': 'PlaceBuyLimitOrder', 'trade_pair': 'BTC_USD', 'client_order_id': 10})
+    tracker.received({'@type': 'BuyOrderPlaced', 'trade_pair': 'BTC_USD', 'client_order_id': 10, 'order_id': 1})
+    assert tracker.histograms() == {}
@@ -0,0 +1,35 @@
+from decimal import Decimal
+
+from cryptology import OrderBooks
+
+
+def test_snapshots() -> None:
+    books = OrderBooks()
+    book = books.apply(10, 'BTC_USD', {'100': '1', '99.5': '2', '98': '3'}, {'101': '1.5', '102': '4'})
+    assert book is books['BTC_USD']
+    assert book.best_bid() == (Decimal('100'), Decimal('1'))
+    assert book.best_ask() == (Decimal('101'), Decimal('1.5'))
+    assert book.spread() == Decimal('1')
+    assert book.bids.top(2) == [(Decimal('100'), Decimal('1')), (Decimal('99.5'), Decimal('2'))]
+    assert book.asks.top(5) == [(Decimal('101'), Decimal('1.5')), (Decimal('102'), Decimal('4'))]
+    assert book.bids.top(0) == []
+    assert book.bids.amount_at(Decimal('99.5')) == Decimal('2')
+    assert book.bids.amount_at(Decimal('97')) == Decimal(0)
+    assert book.bids.volume_to(Decimal('99')) == Decimal('3')
+    assert book.asks.volume_to(Decimal('101.5')) == Decimal('1.5')
+
+    assert books.apply(11, 'BTC_USD', {'99.5': '2.5', '98': '3', '99.75': '1'}, {}) is book
+    assert list(book.bids) == [(Decimal('99.75'), Decimal('1')), (Decimal('99.5'), Decimal('2.5')),
+                               (Decimal('98'), Decimal('3'))]
+    assert book.best_ask() is None
+    assert book.spread() is None
+    assert book.bids.prices == sorted(book.bids.amounts)
+
+    assert books.apply(9, 'BTC_USD', {'1': '1'}, {'2': '2'}) is None
+    assert books.stale == 1
+    assert book.current_order_id == 11
+    assert book.best_bid() == (Decimal('99.75'), Decimal('1'))
+
+    assert 'ETH_USD' not in books
+    books.apply(5, 'ETH_USD', {}, {'10': '1'})
+    assert sorted(books) == ['BTC_USD', 'ETH_USD']
@@ -0,0 +1,98 @@
+import pytest
+
+from decimal import Decimal
+from typing import Any, Optional
+
+from cryptology import CryptologyError
+from cryptology.messages import BuyOrderPlaced
+from cryptology.orders import OrderTracker
+
+
+def placed(order_id: int, client_order_id: int, trade_pair: str = 'BTC_USD', amount: str = '2',
+           closed_inline: bool = False) -> dict:
+    return {'@type': 'BuyOrderPlaced', 'order_id': order_id, 'client_order_id': client_order_id,
+            'trade_pair': trade_pair, 'amount': amount, 'initial_amount': '3', 'price': '10',
+            'closed_inline': closed_inline, 'time': [946684800, 0]}
+
+
+def event(message_type: str, order_id: int, amount: Optional[str] = None) -> dict:
+    payload = {'@type': message_type, 'order_id': order_id, 'trade_pair': 'BTC_USD'}
+    if amount is not None:
+        payload['amount'] = amount
+    return payload
+
+
+def test_lifecycle() -> None:
+    orders = OrderTracker()
+    orders.received(placed(1, 11))
+    orders.received(BuyOrderPlaced(placed(2, 12, 'ETH_USD')))
+    orders.received(placed(3, 13, closed_inline=True))
+    orders.received({'@type': 'SetBalance', 'currency': 'USD', 'balance': '1'})
+    assert len(orders) == 2 and 1 in orders and 3 not in orders
+
+    order = orders.get(1)
+    assert orders.get_by_client_order_id(11) is order
+    assert orders.by_trade_pair('BTC_USD') == [order]
+    assert order.buy and order.price == Decimal(10) and order.initial_amount == Decimal(3)
+
+    orders.received(event('BuyOrderAmountChanged', 1, '1.5'))
+    orders.received(event('OwnTrade', 1, '0.5'))
+    assert order.amount == Decimal('1.5') and order.filled == Decimal('0.5')
+
+    orders.received(event('BuyOrderClosed', 1))
+    assert orders.get(1) is None and orders.get_by_client_order_id(11) is None
+    assert orders.by_trade_pair('BTC_USD') == []
+
+    # a message delivered again doesn't bring the order back
+    orders.received(placed(1, 11))
+    assert orders.get(1) is None
+    assert [x.order_id for x in orders] == [2]
+
+
+class Server:
+    """
+    answers `UserOrdersRequest` with `response` after delivering `during` to `orders`
+    """
+    def __init__(self, orders: OrderTracker, response: Any, *during: dict) -> None:
+        self.orders = orders
+        self.response = response
+        self.during = during
+
+    async def send_signed_request(self, *, payload: dict, request_id: Optional[int] = None,
+                                  timeout: Optional[float] = None) -> Any:
+        assert payload == {'@type': 'UserOrdersRequest'}
+        for message in self.during:
+            self.orders.received(message)
+        return self.response
+
+
+@pytest.mark.asyncio
+async def test_refresh() -> None:
+    orders = OrderTracker()
+    orders.received(placed(1, 11))
+    response = {'@type': 'UserOrdersResponse', 'order_books': {
+        'BTC_USD': {'buy': [{'order_id': 2, 'amount': 1, 'price': 10, 'client_order_id': 12}],
+                    'sell': [{'order_id': 3, 'amount': '4', 'price': '11', 'client_order_id': 13}]},
+    }}
+    # the answer may be older or newer than the messages arriving while it's requested
+    await orders.refresh(Server(orders, response, event('SellOrderAmountChanged', 3, '3'), placed(4, 14),
+                                event('BuyOrderCancelled', 2)))
+    assert sorted(x.order_id for x in orders) == [3, 4]
+    assert orders.get(3).amount == Decimal(3) and not orders.get(3).buy
+    assert orders.get(3).initial_amount is None
+    assert orders.replay is None
+
+    orders.received(event('SellOrderAmountChanged', 3, '2'))
+    assert orders.get(3).amount == Decimal(2)
+
+    with pytest.raises(CryptologyError):
+        await orders.refresh(Server(orders, {'@type': 'EchoResponse'}))
+    assert orders.replay is None
+
+
+def test_history() -> None:
+    orders = OrderTracker(history=2)
+    for order_id in range(3):
+        orders.received(placed(order_id, order_id))
+        orders.received(event('BuyOrderCancelled', order_id))
+    assert list(orders.finished) == [1, 2]
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+
+from cryptology.exceptions import CryptologyConnectionError
+from cryptology.outbound import OutboundQueue, TokenBucket
+
+
+def test_token_bucket() -> None:
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.take(100.) == 0
+    assert bucket.take(100.) == 0
+    assert bucket.take(100.) == pytest.approx(.1)
+    assert bucket.take(100.) == pytest.approx(.2)
+    assert bucket.take(101.) == 0
+
+    bucket.postpone(101., .5)
+    assert bucket.take(101.) == pytest.approx(.5)
+    assert bucket.take(101.6) == 0
+
+    unlimited = TokenBucket()
+    assert all(unlimited.take(1.) == 0 for _ in range(100))
+    unlimited.postpone(1., .25)
+    assert unlimited.take(1.) == .25
+
+
+@pytest.mark.asyncio
+async def test_queue() -> None:
+    sent = []
+    release = asyncio.Event()
+
+    async def send_bytes(frame: bytes) -> None:
+        await release.wait()
+        sent.append(frame)
+
+    outbound = OutboundQueue(send_bytes, max_size=4, max_batch=2)
+    for n in range(6):
+        await outbound.put(bytes([n]))
+    # the writer holds the first batch of two frames
+    assert outbound.queue_depth == 4
+
+    blocked = asyncio.ensure_future(outbound.put(b'\x06'))
+    await asyncio.sleep(.01)
+    assert not blocked.done()
+
+    release.set()
+    await asyncio.wait_for(blocked, 1)
+    await asyncio.wait_for(outbound.flush(), 1)
+    assert sent == [bytes([n]) for n in range(7)]
+    stats = outbound.stats()
+    assert stats['sent'] == 7 and stats['queued'] == 0
+    assert stats['max_latency'] >= stats['mean_latency'] > 0
+    await outbound.close()
+
+
+@pytest.mark.asyncio
+async def test_postpone() -> None:
+    sent = []
+    loop = asyncio.get_event_loop()
+
+    async def send_bytes(frame: bytes) -> None:
+        sent.append(loop.time())
+
+    outbound = OutboundQueue(send_bytes)
+    started = loop.time()
+    outbound.postpone(.1)
+    await outbound.put(b'test')
+    assert not sent
+    await outbound.flush()
+    assert sent[0] - started >= .09
+    await outbound.close()
+
+
+@pytest.mark.asyncio
+async def test_send_error() -> None:
+    async def send_bytes(frame: bytes) -> None:
+        raise ConnectionResetError()
+
+    outbound = OutboundQueue(send_bytes)
+    await outbound.put(b'1')
+    await outbound.put(b'2')
+    await asyncio.wait_for(outbound.flush(), 1)
+    with pytest.raises(CryptologyConnectionError):
+        await outbound.put(b'3')
+
+
+@pytest.mark.asyncio
+async def test_close_flushes() -> None:
+    sent = []
+
+    async def send_bytes(frame: bytes) -> None:
+        await asyncio.sleep(.001)
+        sent.append(frame)
+
+    outbound = OutboundQueue(send_bytes, max_batch=4)
+    for n in range(20):
+        await outbound.put(bytes([n]))
+    await asyncio.wait_for(outbound.close(), 1)
+    assert sent == [bytes([n]) for n in range(20)]
+    assert outbound.dropped == 0
+
+    async def stuck(frame: bytes) -> None:
+        await asyncio.sleep(10)
+
+    outbound = OutboundQueue(stuck, max_batch=4)
+    for n in range(10):
+        await outbound.put(bytes([n]))
+    await asyncio.wait_for(outbound.close(.05), 1)
+    assert outbound.dropped == 10
+    assert outbound.queue_depth == 0
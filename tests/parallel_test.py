@@ -5,9 +5,8 @@ from cryptology.parallel import run_parallel
 from typing import Optional
 
 
-async def target(sleep: float, exception: Optional[Exception] = None,
-                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
-    await asyncio.sleep(sleep, loop=loop)
+async def target(sleep: float, exception: Optional[Exception] = None) -> None:
+    await asyncio.sleep(sleep)
     if exception:
         raise exception
 
@@ -21,13 +20,11 @@ class BarError(Exception):
 
 
 @pytest.mark.asyncio
-async def test_exit(event_loop: asyncio.AbstractEventLoop) -> None:
-    await run_parallel([target(.1, loop=event_loop), target(.2, loop=event_loop)], loop=event_loop)
+async def test_exit() -> None:
+    await run_parallel([target(.1), target(.2)])
 
     with pytest.raises(FooError):
-        await run_parallel([target(.1, FooError(), loop=event_loop), target(.2, BarError(), loop=event_loop)],
-                           loop=event_loop)
+        await run_parallel([target(.1, FooError()), target(.2, BarError())])
 
     with pytest.raises(asyncio.CancelledError):
-        await run_parallel([target(.1, loop=event_loop), target(.2, loop=event_loop)],
-                           raise_canceled=True, loop=event_loop)
+        await run_parallel([target(.1), target(.2)], raise_canceled=True)
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+
+from cryptology import exceptions
+from cryptology.journal import OutgoingJournal, SessionState
+from cryptology.reconnect import Backoff, reconnect_loop
+
+
+def test_journal() -> None:
+    journal = OutgoingJournal(max_size=3)
+    assert journal.last_sequence_id is None
+    for n in range(1, 5):
+        journal.record(n, {'n': n})
+    assert len(journal) == 3
+    assert journal.last_sequence_id == 4
+
+    journal.acknowledge(2)
+    assert journal.pending() == [(3, {'n': 3}), (4, {'n': 4})]
+    journal.acknowledge(10)
+    assert journal.pending() == []
+
+
+def test_session_state() -> None:
+    state = SessionState(last_outbox_id=1)
+    for outbox_id in (2, 3, 4):
+        state.received(outbox_id)
+    state.handled(3)
+    assert state.last_outbox_id == 1
+    state.handled(2)
+    assert state.last_outbox_id == 3
+    state.handled(5)
+    assert state.last_outbox_id == 3
+    state.handled(4)
+    assert state.last_outbox_id == 5
+
+    state.received(6)
+    state.reset()
+    state.handled(7)
+    assert state.last_outbox_id == 7
+
+
+def test_backoff() -> None:
+    backoff = Backoff(initial=1, maximum=8, restart_delay=5, rate_limit_delay=20)
+    for ceiling in (1, 2, 4, 8, 8):
+        assert 1 <= backoff.delay() <= ceiling
+    assert backoff.delay(exceptions.RateLimit()) >= 20
+    backoff.reset()
+    assert 5 <= backoff.delay(exceptions.ServerRestart()) <= 5
+
+
+@pytest.mark.asyncio
+async def testreconnect_loop() -> None:
+    errors = [exceptions.ServerRestart(), exceptions.Disconnected(1006), asyncio.TimeoutError(),
+              exceptions.CryptologyConnectionError()]
+    calls = 0
+
+    async def connect() -> None:
+        nonlocal calls
+        calls += 1
+        if errors:
+            raise errors.pop(0)
+
+    await reconnect_loop(connect, Backoff(initial=.001, maximum=.001, restart_delay=.001), None, 60.)
+    assert calls == 5
+
+    async def fail() -> None:
+        raise exceptions.RateLimit()
+
+    with pytest.raises(exceptions.RateLimit):
+        await reconnect_loop(fail, Backoff(initial=.001, maximum=.001, rate_limit_delay=.001), 3, 60.)
+
+    async def invalid() -> None:
+        raise exceptions.InvalidSequence()
+
+    with pytest.raises(exceptions.InvalidSequence):
+        await reconnect_loop(invalid, Backoff(), None, 60.)
+
+    async def taken_over() -> None:
+        raise exceptions.ConcurrentConnection()
+
+    with pytest.raises(exceptions.ConcurrentConnection):
+        await reconnect_loop(taken_over, Backoff(), None, 60.)
@@ -0,0 +1,41 @@
+import os
+import pytest
+
+from datetime import datetime
+from typing import Optional
+
+from cryptology import codec, crypto
+from cryptology.recording import FRAME, KEY, Recorder, read_recording
+from cryptology.replay import ReplayProtocolClient, ReplayWebSocket
+
+
+def outbox_frame(outbox_id: int, payload: bytes, cipher: Optional[crypto.Cipher]) -> bytes:
+    frame = codec.encode_outbox_message(outbox_id, datetime(2018, 1, 1).timestamp(), payload)
+    return cipher.encrypt(frame) if cipher is not None else frame
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('decrypted', [False, True])
+async def test_client(tmpdir, decrypted: bool) -> None:
+    path = str(tmpdir.join('client.rec'))
+    for session in range(2):
+        cipher = crypto.Cipher(os.urandom(32))
+        with Recorder(path, decrypted=decrypted) as recorder:
+            recorder.write_key(cipher.key)
+            frame = outbox_frame(session + 1, b'{"@type": "SetBalance", "balance": "1"}', cipher)
+            recorder.write(cipher.decrypt(frame) if decrypted else frame, 1000. + session)
+
+    records = list(read_recording(path))
+    assert [(record_type, arrival) for record_type, arrival, _ in records] == \
+        ([(FRAME, 1000.), (FRAME, 1001.)] if decrypted else [(KEY, records[0][1]), (FRAME, 1000.),
+                                                             (KEY, records[2][1]), (FRAME, 1001.)])
+    with pytest.raises(AssertionError):
+        Recorder(path, decrypted=not decrypted)
+
+    ws = ReplayProtocolClient(ReplayWebSocket(path, speed=1000.))
+    outbox = []
+    # the end of the recording ends the iteration
+    async for outbox_id, ts, payload in ws.receive_iter(ws.replay.cipher, None, None):
+        outbox.append((outbox_id, payload['balance']))
+    assert outbox == [(1, '1'), (2, '1')]
+    await ws.close()
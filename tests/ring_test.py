@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+import pytest
+
+from decimal import Decimal
+from typing import List
+
+from cryptology.ring import OrderBookRecord, RingPublisher, RingSubscriber, TradeRecord, TradesStateRecord
+
+BOOK = {
+    '@type': 'OrderBookAgg',
+    'buy_levels': {'100.5': '1', '99': '2.25'},
+    'sell_levels': {'101': '0.1'},
+    'trade_pair': 'BTC_USD',
+    'current_order_id': 42,
+}
+TRADE = {
+    '@type': 'AnonymousTrade',
+    'time': [1530093825, 12],
+    'trade_pair': 'ETH_USD',
+    'current_order_id': 43,
+    'amount': '42.42',
+    'price': '555',
+    'maker_buy': True,
+}
+
+
+def test_records(tmpdir) -> None:
+    path = str(tmpdir.join('md.ring'))
+    with RingPublisher(path, slot_count=8, slot_size=512) as ring:
+        with RingSubscriber(path) as subscriber:
+            assert subscriber.read() is None
+            assert ring.write(BOOK)
+            assert ring.write(TRADE)
+            assert not ring.write({'@type': 'Unknown'})
+            assert ring.write({'@type': 'TradesDisabledOnPairs', 'trade_pairs': ['LTC_USD', 'BTC_EUR']})
+
+            book, trade, state = list(subscriber)
+            assert subscriber.read() is None
+
+            assert isinstance(book, OrderBookRecord)
+            assert (book.sequence, book.trade_pair, book.current_order_id) == (1, 'BTC_USD', 42)
+            assert book.buy_levels == BOOK['buy_levels']
+            assert book.sell_levels == BOOK['sell_levels']
+
+            assert isinstance(trade, TradeRecord)
+            assert (trade.trade_pair, trade.current_order_id, trade.time) == ('ETH_USD', 43, [1530093825, 12])
+            assert (trade.amount, trade.price, trade.maker_buy) == (Decimal('42.42'), Decimal(555), True)
+
+            assert isinstance(state, TradesStateRecord)
+            assert (state.trade_pairs, state.enabled) == (['LTC_USD', 'BTC_EUR'], False)
+            assert book.valid()
+
+
+def test_lapping(tmpdir) -> None:
+    path = str(tmpdir.join('md.ring'))
+    with RingPublisher(path, slot_count=4, slot_size=512) as ring:
+        with RingSubscriber(path) as subscriber:
+            ring.write(dict(BOOK, current_order_id=0))
+            first = subscriber.read()
+            for order_id in range(1, 10):
+                ring.write(dict(BOOK, current_order_id=order_id))
+            assert not first.valid()
+            assert [record.current_order_id for record in subscriber] == [6, 7, 8, 9]
+            assert subscriber.lost == 5
+
+
+def test_truncation(tmpdir) -> None:
+    path = str(tmpdir.join('md.ring'))
+    # room for 4 levels
+    with RingPublisher(path, slot_count=4, slot_size=16 + 28 + 4 * 48) as ring:
+        with RingSubscriber(path) as subscriber:
+            ring.write(dict(BOOK, buy_levels={str(price): '1' for price in range(10)},
+                            sell_levels={str(price): '1' for price in range(10, 20)}))
+            book = subscriber.read()
+            assert list(book.buy_levels) == ['9', '8']
+            assert list(book.sell_levels) == ['10', '11']
+            assert ring.truncated == 1
+
+
+def test_skipped(tmpdir) -> None:
+    path = str(tmpdir.join('md.ring'))
+    with RingPublisher(path, slot_count=2, slot_size=512) as ring:
+        with RingSubscriber(path) as subscriber:
+            ring.write(dict(BOOK, current_order_id=1))
+            ring.write(dict(BOOK, current_order_id=2))
+            assert not ring.write(dict(TRADE, trade_pair='A_VERY_LONG_TRADE_PAIR'))
+            assert not ring.write(dict(BOOK, buy_levels={'1': '0.' + '1' * 30}))
+            assert ring.skipped == 2
+            # the records in the slots the skipped ones would have taken are left alone
+            assert [record.current_order_id for record in subscriber] == [1, 2]
+
+
+def test_restart(tmpdir) -> None:
+    path = str(tmpdir.join('md.ring'))
+    ring = RingPublisher(path, slot_count=4, slot_size=512)
+    subscriber = RingSubscriber(path)
+    ring.write(BOOK)
+    book = subscriber.read()
+    assert subscriber.read() is None and not subscriber.closed
+
+    with RingPublisher(path, slot_count=8, slot_size=512) as restarted:
+        # the old records stay readable for the old subscriber
+        assert subscriber.closed
+        assert book.current_order_id == 42 and book.valid()
+        restarted.write(TRADE)
+        with RingSubscriber(path) as new_subscriber:
+            assert new_subscriber.slot_count == 8
+        ring.close()
+        subscriber.close()
+    assert os.path.exists(path)
+
+    ring = RingPublisher(path, slot_count=4, slot_size=512)
+    with RingSubscriber(path) as subscriber:
+        ring.close(unlink=True)
+        assert subscriber.closed
+    assert not os.path.exists(path)
+
+
+def read_books(path: str, count: int, results: multiprocessing.Queue) -> None:
+    with RingSubscriber(path) as subscriber:
+        results.put('ready')
+        order_ids: List[int] = []
+        while len(order_ids) < count:
+            order_ids.extend(record.current_order_id for record in subscriber)
+        results.put(order_ids)
+
+
+@pytest.mark.asyncio
+async def test_processes(tmpdir) -> None:
+    path = str(tmpdir.join('md.ring'))
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    with RingPublisher(path, slot_count=1024, slot_size=512) as ring:
+        readers = [context.Process(target=read_books, args=(path, 100, results)) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        assert [results.get(timeout=10) for _ in readers] == ['ready'] * 3
+        for order_id in range(100):
+            await ring.publish(dict(BOOK, current_order_id=order_id))
+        assert [results.get(timeout=10) for _ in readers] == [list(range(100))] * 3
+        for reader in readers:
+            reader.join()
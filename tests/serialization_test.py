@@ -0,0 +1,40 @@
+import pytest
+
+from cryptology import serialization
+
+PAYLOAD = {
+    '@type': 'OrderBookAgg',
+    'buy_levels': {'1': '1', '0.5': '2.25'},
+    'sell_levels': {},
+    'trade_pair': 'BTC_USD',
+    'current_order_id': 123456,
+    'comment': 'ünïcode',
+}
+
+
+@pytest.mark.parametrize('name', sorted(serialization.available_serializers()))
+def test_round_trip(name: str) -> None:
+    serializer = serialization.get_serializer(name)
+    encoded = serializer.dumps(PAYLOAD)
+    assert isinstance(encoded, bytes)
+    assert serialization.get_serializer('json').loads(encoded) == PAYLOAD
+    assert serializer.loads(memoryview(b'  ' + encoded)[2:]) == PAYLOAD
+
+    with pytest.raises(ValueError):
+        serializer.loads(b'{"@type": ')
+
+
+@pytest.mark.parametrize('name', sorted(serialization.available_serializers()))
+def test_dumps_like_json(name: str) -> None:
+    serializer = serialization.get_serializer(name)
+    json_serializer = serialization.get_serializer('json')
+    for payload in ({1: 'a'}, {'amount': 2 ** 70}):
+        assert json_serializer.loads(serializer.dumps(payload)) == json_serializer.loads(json_serializer.dumps(payload))
+
+
+def test_get_serializer() -> None:
+    assert serialization.get_serializer().name == next(
+        x for x in serialization.PREFERENCE if x in serialization.available_serializers())
+
+    with pytest.raises(ValueError):
+        serialization.get_serializer('pickle')